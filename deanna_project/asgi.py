@@ -2,6 +2,8 @@
 ASGI config for deanna_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it (e.g. ``uvicorn deanna_project.asgi:application``) to use the live
+chat stream (shop.views.conversation_stream) without tying up WSGI workers.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -139,13 +139,58 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Configuration APScheduler
 APSCHEDULER_DATETIME_FORMAT = "N j, Y, f:s a"
 APSCHEDULER_RUN_NOW_TIMEOUT = 25  # Secondes
+# Tâches planifiées (shop/scheduler.py). Les processus web démarrent le planificateur si
+# SCHEDULER_AUTOSTART est vrai ; seul le détenteur du bail exécute les tâches. En production,
+# mettre SCHEDULER_AUTOSTART=False et lancer un seul "python manage.py runscheduler".
+SCHEDULER_AUTOSTART = os.environ.get('SCHEDULER_AUTOSTART', 'True') == 'True'
+SCHEDULER_LEASE_NAME = 'shop-scheduler'
+SCHEDULER_LEASE_TTL = 90  # Secondes ; repris par un autre processus si le leader disparaît
+SCHEDULER_EXECUTION_MAX_AGE = 7 * 24 * 3600  # Historique des exécutions conservé (secondes)
 
 # Configuration WhiteNoise pour les fichiers statiques
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Configuration pour les sessions
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Profil choisi par la variable d'environnement SESSION_PROFILE :
+#   db             : une lecture (et souvent une écriture) de django_session par requête authentifiée
+#   cached_db      : lecture dans le cache "sessions", la base n'est qu'une copie durable (recommandé)
+#   signed_cookies : aucune I/O serveur ; session limitée à ~4 Ko et non révocable côté serveur
+# Mesure : python manage.py bench_session_queries (chiffres dans le commentaire de CACHES)
+SESSION_PROFILES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_PROFILE = os.environ.get('SESSION_PROFILE', 'db')
+SESSION_ENGINE = SESSION_PROFILES[SESSION_PROFILE]
+SESSION_CACHE_ALIAS = 'sessions'
 SESSION_COOKIE_AGE = 1209600  # 2 semaines en secondes
+# Purge des sessions expirées (tâche purge_expired_sessions, toutes les 15 minutes)
+SESSION_PURGE_BATCH_SIZE = 500  # Sessions supprimées par transaction
+SESSION_PURGE_TIME_BUDGET = 5  # Secondes maximum par passage ; le reste est repris au suivant
+SESSION_PURGE_PAUSE = 0.05  # Secondes de pause entre deux lots
+
+# Recherche plein texte des produits (shop/search.py)
+SEARCH_MAX_RESULTS = 500  # Résultats classés au plus par recherche
+SEARCH_RANK_CANDIDATES = 5000  # Produits les plus récents classés pour un mot très courant
+
+# Catalogue paginé par curseur : total affiché plafonné (« 1000+ produits »), 0 pour ne pas compter
+CATALOG_COUNT_CAP = 1000
+
+# Facettes du catalogue (shop/facets.py)
+FACET_PRICE_BANDS = [5000, 10000, 25000, 50000, 100000]  # Bornes des tranches de prix (CFA)
+FACET_MAX_VALUES = 20  # Valeurs affichées au plus par facette (catégories, boutiques...)
+FACET_INDEX_MIN_AGE = 30  # Secondes minimum entre deux reconstructions de l'index en mémoire
+FACET_INDEX_BACKGROUND_REBUILD = True  # Reconstruction dans un thread (l'ancien index reste servi)
+
+# Cache des pages du catalogue pour les visiteurs anonymes (shop/page_cache.py)
+CATALOG_PAGE_CACHE_TIMEOUT = 60  # Secondes ; les signaux invalident avant par espace de noms
+CATALOG_CACHE_TIMEOUT = 3600  # Listes partagées (slides, catégories) mises en cache par version
+
+# Réservations de stock pendant le paiement (shop/reservations.py)
+STOCK_RESERVATION_TTL = 15 * 60  # Secondes pendant lesquelles les unités d'un panier restent retenues
+STOCK_RESERVATION_PURGE_BATCH_SIZE = 1000  # Réservations expirées supprimées par lot
+STOCK_RESERVATION_PURGE_TIME_BUDGET = 5  # Secondes maximum par passage de la tâche de purge
 
 # Configuration de sécurité pour développement
 if DEBUG:
@@ -208,6 +253,33 @@ LOGGING = {
 
 # Configuration OpenRouter
 OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY")
+AI_KEY_CHECK_TTL = 600  # Secondes pendant lesquelles la vérification de la clé API reste valable
+AI_HTTP_MAX_CONNECTIONS = 10  # Connexions HTTP maximum du pool partagé vers OpenRouter
+AI_HTTP_MAX_KEEPALIVE = 5  # Connexions gardées ouvertes (évite une poignée de main TLS par message)
+AI_HTTP_TIMEOUT = 30  # Délai maximum (secondes) d'un appel à OpenRouter
+
+# Configuration de la file des réponses IA (worker : python manage.py run_ai_worker)
+AI_REPLY_JOB_MAX_ATTEMPTS = 3  # Nombre d'essais avant abandon d'une tâche
+AI_REPLY_JOB_RETRY_DELAY = 30  # Secondes avant le premier nouvel essai (doublé à chaque échec)
+AI_REPLY_JOB_LOCK_TIMEOUT = 300  # Secondes avant de reprendre une tâche bloquée "en cours"
+AI_WORKER_POLL_INTERVAL = 2  # Secondes entre deux consultations de la file vide
+# Durée de vie du contexte produit mis en cache pour les prompts IA. Les signaux l'invalident
+# dans tous les processus (version dans CACHES['shared']).
+PRODUCT_CONTEXT_CACHE_TIMEOUT = 300
+
+# Configuration du flux de chat en direct (SSE, servi par deanna_project.asgi)
+CHAT_BROKER_BACKEND = 'shop.realtime.InProcessBroker'  # Remplaçable par un broker partagé entre processus
+# Messages d'autres processus (worker IA) : séquence par conversation dans CACHES['shared']
+CHAT_STREAM_SIGNAL_INTERVAL = 0.5  # Secondes entre deux lectures de la séquence (cache, sans SQL)
+CHAT_STREAM_POLL_INTERVAL = 30  # Secondes entre deux relectures de secours de la base
+CHAT_STREAM_KEEPALIVE = 15  # Secondes sans événement avant l'envoi d'un commentaire de maintien
+CHAT_STREAM_MAX_DURATION = 300  # Durée d'un flux ; le navigateur se reconnecte avec Last-Event-ID
+# Présence des commerçants (shop/presence.py) : les API de statut lisent le cache, la table
+# MerchantActivity n'en est qu'une copie durable écrite par lots
+PRESENCE_WRITE_GRANULARITY = 30  # Secondes minimum entre deux battements pris en compte
+PRESENCE_FLUSH_INTERVAL = 30  # Secondes entre deux écritures groupées en base
+PRESENCE_OFFLINE_AFTER = 300  # Secondes sans battement avant d'être considéré hors ligne
+PRESENCE_CACHE_TIMEOUT = 24 * 3600  # Durée de vie des présences dans le cache partagé (CACHES['shared'])
 
 # Configuration email (pour développement)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -237,7 +309,38 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
-    }
+    },
+    # Cache des sessions (profil cached_db). Doit être partagé entre les processus web en
+    # production, par exemple :
+    #   SESSION_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+    #   SESSION_CACHE_LOCATION=redis://127.0.0.1:6379/1
+    # Par défaut (développement, tests), un cache mémoire local en tient lieu : chaque
+    # processus relit alors la base une fois par session avant de la servir depuis son cache.
+    #
+    # Requêtes SQL par requête HTTP, client connecté, en régime établi
+    # (python manage.py bench_session_queries, SQLite) :
+    #   vue                       db   cached_db   signed_cookies
+    #   product_list              10       9             9
+    #   cart_detail                7       6             6
+    #   conversation_detail        9       8             8
+    #   chat_messages_api          7       6             6
+    # La lecture de django_session disparaît ; les écritures de session ne restent qu'aux
+    # requêtes qui modifient la session (connexion, messages flash).
+    'sessions': {
+        'BACKEND': os.environ.get('SESSION_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('SESSION_CACHE_LOCATION', 'sessions'),
+        'TIMEOUT': SESSION_COOKIE_AGE,
+    },
+    # Cache partagé entre les processus web et le worker : présence des commerçants, pages
+    # du catalogue et versions d'invalidation des caches (shop/cache_utils.py). Comme
+    # 'sessions', il doit pointer vers un serveur commun en production, par exemple :
+    #   SHARED_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+    #   SHARED_CACHE_LOCATION=redis://127.0.0.1:6379/2
+    # Le cache mémoire local par défaut ne convient qu'à un seul processus (développement, tests).
+    'shared': {
+        'BACKEND': os.environ.get('SHARED_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('SHARED_CACHE_LOCATION', 'shared'),
+    },
 }
 
 # Configuration pour les fichiers de langue
@@ -250,7 +353,3 @@ FIXTURE_DIRS = [
     BASE_DIR / 'fixtures',
 ]
 
-print("✅ Configuration Django chargée avec succès!")
-print(f"🔑 Clé API OpenRouter: {'✅ Présente' if OPENROUTER_API_KEY else '❌ Absente'}")
-print(f"🐛 Debug: {DEBUG}")
-print(f"🌐 Allowed Hosts: {ALLOWED_HOSTS}")
\ No newline at end of file
@@ -7,7 +7,8 @@ from .models import (
     Merchant, Shop, Category, SubCategory, Product, ProductVariation,
     Review, ProductImage, ProductVideo, Cart, CartItem, Order, OrderItem,
     Conversation, Message, NegotiationSettings, HeroSlide, Client,
-    VariationGroup, VariationOption, CartItemVariation, OrderItemVariation
+    VariationGroup, VariationOption, CartItemVariation, OrderItemVariation,
+    AIReplyJob, SchedulerLease, StockReservation
 )
 
 # Admin pour Merchant
@@ -170,6 +171,10 @@ class CartItemInline(admin.TabularInline):
     readonly_fields = ('product', 'quantity', 'get_total', 'selected_variations_display')
     inlines = [CartItemVariationInline]
     
+    def get_queryset(self, request):
+        # Totaux calculés en SQL (voir CartItemQuerySet.with_totals)
+        return super().get_queryset(request).with_totals().select_related('product').prefetch_related('selected_variations')
+    
     def get_total(self, obj):
         return obj.get_total
     get_total.short_description = 'Total'
@@ -202,6 +207,9 @@ class OrderItemInline(admin.TabularInline):
     readonly_fields = ('product', 'quantity', 'get_total', 'date_added', 'selected_variations_display')
     inlines = [OrderItemVariationInline]
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product').prefetch_related('selected_variations')
+    
     def get_total(self, obj):
         return obj.get_total
     get_total.short_description = 'Total'
@@ -223,6 +231,11 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'transaction_id')
     readonly_fields = ('date_ordered', 'transaction_id')
     inlines = [OrderItemInline]
+    list_select_related = ('user',)
+    
+    def get_queryset(self, request):
+        # cart_total et cart_items en sous-requêtes : pas de requête par ligne de la liste
+        return super().get_queryset(request).with_totals()
     
     fieldsets = (
         ('Informations de commande', {
@@ -240,8 +253,19 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_display = ('product', 'order', 'quantity', 'get_total', 'date_added', 'variations_display')
     list_filter = ('date_added',)
     search_fields = ('product__name', 'order__id')
-    readonly_fields = ('date_added', 'get_total')
+    # Prix figés à la commande : non modifiables
+    readonly_fields = ('date_added', 'get_total', 'shop', 'unit_price', 'variation_total', 'line_total')
     inlines = [OrderItemVariationInline]
+    list_select_related = ('product', 'order')
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('selected_variations')
+    
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Les variations sont enregistrées après la ligne : on refige leur total
+        if not change or any(formset.has_changed() for formset in formsets):
+            form.instance.refresh_variation_total()
     
     def get_total(self, obj):
         return obj.get_total
@@ -291,6 +315,32 @@ class MessageAdmin(admin.ModelAdmin):
         return obj.text[:50] + '...' if obj.text and len(obj.text) > 50 else obj.text
     text_preview.short_description = 'Message'
 
+# Admin pour AIReplyJob (suivi de la file des réponses IA)
+@admin.register(AIReplyJob)
+class AIReplyJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'conversation', 'status', 'attempts', 'run_after', 'created_at', 'error_preview')
+    list_filter = ('status', 'created_at')
+    search_fields = ('conversation__product__name', 'last_error')
+    readonly_fields = ('conversation', 'trigger_message', 'reply_message', 'attempts', 'locked_at', 'created_at', 'updated_at')
+    
+    def error_preview(self, obj):
+        return obj.last_error[:50] + '...' if obj.last_error and len(obj.last_error) > 50 else obj.last_error
+    error_preview.short_description = 'Dernière erreur'
+
+# Admin pour SchedulerLease (processus leader des tâches planifiées)
+@admin.register(SchedulerLease)
+class SchedulerLeaseAdmin(admin.ModelAdmin):
+    list_display = ('name', 'holder', 'acquired_at', 'expires_at')
+    readonly_fields = ('name', 'holder', 'acquired_at', 'expires_at')
+
+# Admin pour StockReservation (unités retenues pendant le paiement)
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'cart', 'quantity', 'expires_at', 'created_at')
+    list_select_related = ('product', 'cart')
+    raw_id_fields = ('product', 'cart')
+    readonly_fields = ('created_at',)
+
 # Admin pour NegotiationSettings
 @admin.register(NegotiationSettings)
 class NegotiationSettingsAdmin(admin.ModelAdmin):
@@ -0,0 +1,188 @@
+# Fichier : shop/ai_client.py
+"""
+Registre du client OpenRouter partagé par tout le processus.
+
+Le client OpenAI (et son pool de connexions HTTP) est créé une seule fois,
+au premier besoin. La clé API est vérifiée une fois puis le résultat est
+gardé en cache pendant AI_KEY_CHECK_TTL secondes. La vérification (appel
+réseau) se fait hors du verrou : pendant ce temps, les autres threads
+utilisent le client avec le dernier résultat connu.
+"""
+import logging
+import os
+import threading
+import time
+
+import httpx
+from django.conf import settings
+from openai import OpenAI, AuthenticationError, PermissionDeniedError, RateLimitError
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+# États possibles de la clé API
+KEY_UNCONFIGURED = 'unconfigured'
+KEY_UNCHECKED = 'unchecked'
+KEY_VALID = 'valid'
+KEY_INVALID = 'invalid'
+KEY_QUOTA_EXCEEDED = 'quota_exceeded'
+KEY_UNKNOWN = 'unknown'  # Vérification impossible (réseau...), le client reste utilisable
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class AIClientRegistry:
+    """
+    Conserve un client OpenAI unique par processus, avec son état de santé.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._api_key = None
+        self._created_at = None
+        self._key_status = KEY_UNCHECKED
+        self._key_checked_at = None
+        self._last_error = ''
+        self._checking = False
+        self._stats = {'key_checks': 0, 'requests': 0, 'failures': 0}
+
+    def _current_api_key(self):
+        return os.environ.get("OPENROUTER_API_KEY") or _setting('OPENROUTER_API_KEY', None)
+
+    def _build_client(self, api_key):
+        http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=_setting('AI_HTTP_MAX_CONNECTIONS', 10),
+                max_keepalive_connections=_setting('AI_HTTP_MAX_KEEPALIVE', 5),
+            ),
+            timeout=httpx.Timeout(_setting('AI_HTTP_TIMEOUT', 30), connect=5.0),
+        )
+        return OpenAI(base_url=OPENROUTER_BASE_URL, api_key=api_key, http_client=http_client)
+
+    def _check_key(self, client):
+        """
+        Vérifie la clé via l'endpoint /auth/key d'OpenRouter : aucune
+        complétion n'est consommée pour ce test.
+        """
+        self._stats['key_checks'] += 1
+        try:
+            client.with_options(max_retries=0).get("/auth/key", cast_to=object)
+            logger.info("✅ Clé API OpenRouter validée avec succès")
+            return KEY_VALID, ''
+        except (AuthenticationError, PermissionDeniedError) as e:
+            logger.error("❌ CLÉ API OPENROUTER INVALIDE")
+            logger.error("💡 Vérifiez votre clé API sur https://openrouter.ai/keys")
+            return KEY_INVALID, str(e)
+        except RateLimitError as e:
+            logger.warning("⚠️  Quota OpenRouter épuisé, utilisation du mode secours")
+            return KEY_QUOTA_EXCEEDED, str(e)
+        except Exception as e:
+            # Pour les autres erreurs, on continue quand même
+            logger.warning(f"⚠️  Avertissement test API: {e}")
+            return KEY_UNKNOWN, str(e)
+
+    def _key_check_expired(self):
+        if self._key_checked_at is None:
+            return True
+        return time.monotonic() - self._key_checked_at > _setting('AI_KEY_CHECK_TTL', 600)
+
+    def get_client(self):
+        """
+        Retourne le client partagé, ou None si la clé est absente, invalide
+        ou si le quota est épuisé (mode secours).
+        """
+        api_key = self._current_api_key()
+        if not api_key:
+            if self._key_status != KEY_UNCONFIGURED:
+                logger.error("❌ CLÉ API OPENROUTER NON CONFIGURÉE")
+                logger.error("💡 Définissez la variable d'environnement : export OPENROUTER_API_KEY='votre_clé'")
+                self._key_status = KEY_UNCONFIGURED
+            return None
+
+        with self._lock:
+            if self._client is None or api_key != self._api_key:
+                self.close()
+                try:
+                    self._client = self._build_client(api_key)
+                except Exception as e:
+                    logger.error(f"❌ Erreur création client OpenAI: {e}")
+                    self._last_error = str(e)
+                    return None
+                self._api_key = api_key
+                self._created_at = time.time()
+                self._key_checked_at = None
+                self._key_status = KEY_UNCHECKED
+            client = self._client
+            # Un seul thread vérifie la clé ; les autres ne l'attendent pas
+            check = self._key_check_expired() and not self._checking
+            if check:
+                self._checking = True
+
+        if check:
+            try:
+                key_status, last_error = self._check_key(client)
+            finally:
+                with self._lock:
+                    self._checking = False
+            with self._lock:
+                # Résultat ignoré si la clé a changé entre-temps
+                if client is self._client:
+                    self._key_status, self._last_error = key_status, last_error
+                    self._key_checked_at = time.monotonic()
+
+        if self._key_status in (KEY_INVALID, KEY_QUOTA_EXCEEDED):
+            return None
+        return client
+
+    def record_success(self):
+        self._stats['requests'] += 1
+
+    def record_failure(self, error):
+        """
+        Note l'échec d'un appel. Une erreur d'authentification ou de quota
+        force une nouvelle vérification de la clé au prochain appel.
+        """
+        self._stats['requests'] += 1
+        self._stats['failures'] += 1
+        self._last_error = str(error)
+        if isinstance(error, (AuthenticationError, PermissionDeniedError, RateLimitError)):
+            self._key_checked_at = None
+
+    def invalidate(self):
+        """Oublie le résultat de la vérification de la clé."""
+        self._key_checked_at = None
+
+    def close(self):
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+            self._client = None
+
+    def health(self):
+        """État du client pour les diagnostics."""
+        age = None
+        if self._key_checked_at is not None:
+            age = round(time.monotonic() - self._key_checked_at, 1)
+        return {
+            'configured': bool(self._current_api_key()),
+            'client_ready': self._client is not None,
+            'client_created_at': self._created_at,
+            'key_status': self._key_status,
+            'key_checked_seconds_ago': age,
+            'key_check_ttl': _setting('AI_KEY_CHECK_TTL', 600),
+            'last_error': self._last_error,
+            **self._stats,
+        }
+
+
+ai_client_registry = AIClientRegistry()
+
+
+def get_ai_client_health():
+    return ai_client_registry.health()
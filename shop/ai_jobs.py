@@ -0,0 +1,190 @@
+# Fichier : shop/ai_jobs.py
+"""
+File d'attente des réponses IA, persistée en base.
+
+Les vues se contentent d'appeler enqueue_ai_reply() : l'appel à OpenRouter
+est fait par le worker (python manage.py run_ai_worker), qui crée ensuite
+le Message(is_ai_response=True).
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AIReplyJob, Message
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue_ai_reply(conversation, trigger_message):
+    """
+    Enregistre une tâche "réponse IA nécessaire" pour un message client.
+    Une seule requête INSERT : aucun appel réseau sur le chemin HTTP.
+    """
+    job = AIReplyJob.objects.create(
+        conversation=conversation,
+        trigger_message=trigger_message,
+        max_attempts=_setting('AI_REPLY_JOB_MAX_ATTEMPTS', 3),
+    )
+    logger.debug(f"📥 Tâche IA #{job.id} mise en file pour la conversation {conversation.id}")
+    return job
+
+
+def requeue_stale_jobs(now=None):
+    """
+    Remet en attente les tâches restées "en cours" trop longtemps
+    (worker arrêté brutalement pendant le traitement). Une tâche qui a
+    épuisé ses essais est marquée en échec : un message qui fait tomber le
+    worker n'est pas repris indéfiniment. Retourne le nombre remis en attente.
+    """
+    now = now or timezone.now()
+    lock_timeout = _setting('AI_REPLY_JOB_LOCK_TIMEOUT', 300)
+    stale = AIReplyJob.objects.filter(
+        status=AIReplyJob.STATUS_RUNNING,
+        locked_at__lt=now - timedelta(seconds=lock_timeout),
+    )
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=AIReplyJob.STATUS_FAILED, locked_at=None,
+        last_error=f"Tâche bloquée plus de {lock_timeout}s à chaque essai", updated_at=now,
+    )
+    if failed:
+        logger.error(f"❌ {failed} tâche(s) IA bloquée(s) abandonnée(s) après leur dernier essai")
+    return stale.update(status=AIReplyJob.STATUS_PENDING, locked_at=None, updated_at=now)
+
+
+def claim_next_job(now=None):
+    """
+    Réserve la prochaine tâche due pour ce worker.
+    La réservation est un UPDATE conditionnel sur le statut : si un autre
+    worker a pris la tâche entre-temps, on passe à la suivante.
+    """
+    now = now or timezone.now()
+    candidates = (
+        AIReplyJob.objects
+        .filter(status=AIReplyJob.STATUS_PENDING, run_after__lte=now)
+        .order_by('run_after', 'id')
+        .values_list('id', flat=True)[:10]
+    )
+    for job_id in list(candidates):
+        claimed = AIReplyJob.objects.filter(
+            id=job_id,
+            status=AIReplyJob.STATUS_PENDING,
+        ).update(
+            status=AIReplyJob.STATUS_RUNNING,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return AIReplyJob.objects.select_related('trigger_message').get(id=job_id)
+    return None
+
+
+def process_job(job):
+    """
+    Génère la réponse IA d'une tâche réservée et crée le message correspondant.
+    Retourne le statut final de la tâche.
+    """
+    from .services import NegotiationContext, get_ai_negotiation_response, get_fallback_response
+
+    context = None
+    try:
+        context = NegotiationContext.load(job.conversation_id)
+        conversation = context.conversation
+        # Les erreurs de l'API remontent ici : la tâche est réessayée avec un délai croissant
+        ai_response_text = get_ai_negotiation_response(
+            context.product,
+            job.trigger_message.text,
+            conversation,
+            context,
+            raise_errors=True
+        )
+    except Exception as e:
+        status = _fail_or_retry(job, e)
+        if status == AIReplyJob.STATUS_FAILED and context is not None:
+            # Dernier essai échoué : le client reçoit la réponse de secours plutôt que rien
+            text = get_fallback_response(context.product, job.trigger_message.text, context.conversation, context)
+            _post_reply(job, context, text)
+            job.save(update_fields=['reply_message', 'updated_at'])
+        return status
+
+    if not ai_response_text:
+        # L'IA n'est pas autorisée à répondre (commerçant actif, négociation désactivée...)
+        job.status = AIReplyJob.STATUS_SKIPPED
+        job.locked_at = None
+        job.save(update_fields=['status', 'locked_at', 'updated_at'])
+        logger.info(f"⏸️ Tâche IA #{job.id} ignorée pour la conversation {conversation.id}")
+        return job.status
+
+    _post_reply(job, context, ai_response_text)
+    job.status = AIReplyJob.STATUS_DONE
+    job.locked_at = None
+    job.last_error = ''
+    job.save(update_fields=['status', 'reply_message', 'locked_at', 'last_error', 'updated_at'])
+    logger.info(f"✅ Réponse IA envoyée pour la conversation {conversation.id} (tâche #{job.id})")
+    return job.status
+
+
+def _post_reply(job, context, text):
+    job.reply_message = Message.objects.create(
+        conversation=context.conversation,
+        sender=context.merchant.user,
+        text=text,
+        is_ai_response=True
+    )
+
+
+def _fail_or_retry(job, error):
+    """Replanifie la tâche avec un délai croissant, ou la marque en échec."""
+    job.last_error = str(error)
+    job.locked_at = None
+    if job.attempts < job.max_attempts:
+        retry_delay = _setting('AI_REPLY_JOB_RETRY_DELAY', 30) * (2 ** (job.attempts - 1))
+        job.status = AIReplyJob.STATUS_PENDING
+        job.run_after = timezone.now() + timedelta(seconds=retry_delay)
+        logger.warning(f"⚠️ Tâche IA #{job.id} en erreur ({error}), nouvel essai dans {retry_delay}s")
+    else:
+        job.status = AIReplyJob.STATUS_FAILED
+        logger.error(f"❌ Tâche IA #{job.id} abandonnée après {job.attempts} essais : {error}")
+    job.save(update_fields=['status', 'run_after', 'locked_at', 'last_error', 'updated_at'])
+    return job.status
+
+
+def run_pending_jobs(max_jobs=None):
+    """Traite les tâches dues jusqu'à épuisement de la file. Retourne le nombre traité."""
+    requeue_stale_jobs()
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        job = claim_next_job()
+        if job is None:
+            break
+        process_job(job)
+        processed += 1
+    return processed
+
+
+def run_worker(poll_interval=None, once=False):
+    """Boucle principale du worker : traite la file puis attend de nouvelles tâches."""
+    from .services import warm_up_ai_services
+
+    poll_interval = poll_interval if poll_interval is not None else _setting('AI_WORKER_POLL_INTERVAL', 2)
+    logger.info("🤖 Worker IA démarré")
+    warm_up_ai_services()
+    while True:
+        close_old_connections()
+        try:
+            processed = run_pending_jobs()
+        except Exception as e:
+            logger.error(f"❌ Erreur dans le worker IA : {e}")
+            processed = 0
+        if once:
+            return processed
+        if not processed:
+            time.sleep(poll_interval)
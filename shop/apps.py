@@ -2,7 +2,6 @@
 from django.apps import AppConfig
 import logging
 from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
 import atexit
 import sys
 
@@ -13,46 +12,45 @@ class ShopConfig(AppConfig):
     name = 'shop'
     
     def ready(self):
+        # Enregistre les récepteurs de signaux (invalidation des caches)
+        from . import signals  # noqa: F401
+        
         # Évite de démarrer le scheduler pendant les commandes manage.py
         if 'runserver' in sys.argv or 'uwsgi' in sys.argv:
             self.start_scheduler()
     
     def start_scheduler(self):
         try:
-            from .tasks import update_merchant_online_status, check_chat_activity
+            from django.conf import settings
+            from .scheduler import add_scheduled_jobs, release_lease, SCHEDULED_JOBS
             
             # Crée le scheduler
             scheduler = BackgroundScheduler(daemon=True)
             
-            # Ajoute la tâche de statut des commerçants (toutes les 30 secondes)
-            scheduler.add_job(
-                update_merchant_online_status,
-                trigger=IntervalTrigger(seconds=30),
-                id='update_merchant_status',
-                name='Mise à jour statut commerçants',
-                replace_existing=True,
-                max_instances=1
-            )
-            
-            # Ajoute la tâche d'activité chat (toutes les minutes)
-            scheduler.add_job(
-                check_chat_activity,
-                trigger=IntervalTrigger(minutes=1),
-                id='check_chat_activity',
-                name='Vérification activité chat',
-                replace_existing=True,
-                max_instances=1
-            )
+            # Tâches périodiques : exécutées uniquement par le processus leader
+            # (bail en base), ou déléguées à "manage.py runscheduler"
+            autostart = getattr(settings, 'SCHEDULER_AUTOSTART', True)
+            if autostart:
+                add_scheduled_jobs(scheduler)
             
             # Démarre le scheduler
             scheduler.start()
+            
+            # Construit l'index des facettes du catalogue avant la première requête
+            from .facets import get_facet_index
+            scheduler.add_job(get_facet_index, id='warm_up_facet_index', replace_existing=True)
             logger.info("✅ APScheduler démarré avec succès")
-            logger.info("📋 Tâches planifiées :")
-            logger.info("   - Mise à jour statut commerçants : toutes les 30 secondes")
-            logger.info("   - Vérification activité chat : toutes les minutes")
+            if autostart:
+                logger.info("📋 Tâches planifiées (exécutées par le processus leader) :")
+                for job in SCHEDULED_JOBS:
+                    logger.info(f"   - {job['name']} : toutes les {job['trigger']}")
+            else:
+                logger.info("📋 Tâches planifiées déléguées à manage.py runscheduler")
             
             # Arrête proprement le scheduler à la fermeture
             atexit.register(lambda: scheduler.shutdown(wait=False))
+            if autostart:
+                atexit.register(release_lease)
                 
         except Exception as e:
-            logger.error(f"❌ Erreur démarrage APScheduler: {e}")
\ No newline at end of file
+            logger.error(f"❌ Erreur démarrage APScheduler: {e}")
@@ -0,0 +1,56 @@
+# Fichier : shop/cache_utils.py
+"""
+Numéros de version stockés dans le cache partagé, pour invalider des
+familles de clés sans les parcourir : on incrémente la version et les
+anciennes clés ne sont simplement plus lues (elles expirent d'elles-mêmes).
+Une modification faite dans un processus invalide ainsi les caches de tous
+les autres, même quand les valeurs restent dans un cache local.
+"""
+import time
+
+from django.core.cache import caches
+
+# Cache commun à tous les processus (voir CACHES['shared'] dans les settings)
+SHARED_CACHE_ALIAS = 'shared'
+
+
+def shared_cache():
+    return caches[SHARED_CACHE_ALIAS]
+
+
+def _version_key(name):
+    return f"version:{name}"
+
+
+def _initial_version():
+    # Valeur de départ basée sur l'horloge : si la clé de version est évincée
+    # du cache, la nouvelle version ne retombe pas sur une ancienne valeur.
+    return int(time.time() * 1000)
+
+
+def get_version(name):
+    """Retourne la version courante d'un espace de noms."""
+    return shared_cache().get_or_set(_version_key(name), _initial_version, timeout=None)
+
+
+def get_versions(names):
+    """Retourne les versions de plusieurs espaces de noms en un seul appel au cache."""
+    keys = {_version_key(name): name for name in names}
+    found = shared_cache().get_many(list(keys))
+    missing = {key: _initial_version() for key in keys if key not in found}
+    if missing:
+        shared_cache().set_many(missing, timeout=None)
+        found.update(missing)
+    return {keys[key]: value for key, value in found.items()}
+
+
+def bump_version(name):
+    """Invalide toutes les clés d'un espace de noms."""
+    key = _version_key(name)
+    try:
+        return shared_cache().incr(key)
+    except ValueError:
+        # Clé absente : on repart d'une valeur neuve
+        version = _initial_version()
+        shared_cache().set(key, version, timeout=None)
+        return version
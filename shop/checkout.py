@@ -0,0 +1,134 @@
+# Fichier : shop/checkout.py
+"""
+Passage de commande : le panier devient une commande en une transaction.
+
+Les lignes des produits (et des variations) sont verrouillées dans l'ordre
+des identifiants avant la vérification du stock (réservations des autres
+paniers déduites, voir shop/reservations.py), puis décrémentées par un
+seul UPDATE avec F() : deux acheteurs simultanés ne peuvent pas vendre la
+même unité. Le nombre de requêtes ne dépend pas de la taille du panier.
+"""
+import logging
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from . import page_cache
+from .cache_utils import bump_version
+from .models import Product, ProductVariation, CartItemVariation, Order, OrderItem, OrderItemVariation
+from .reservations import OutOfStock, check_available, lock_products, release_cart
+from .signals import product_context_namespace
+
+logger = logging.getLogger(__name__)
+
+
+def _decrement(model, field, quantities):
+    """Un seul UPDATE : field = field - quantité, pour chaque ligne de `quantities`."""
+    if not quantities:
+        return 0
+    return model.objects.filter(pk__in=list(quantities)).update(**{field: Case(
+        *[When(pk=pk, then=F(field) - Value(quantity)) for pk, quantity in quantities.items()],
+        default=F(field), output_field=IntegerField(),
+    )})
+
+
+def _order_item(order, product_id, quantity, product, variations):
+    """Ligne de commande avec boutique, prix et variations figés (prix lus sous verrou)."""
+    _, _, shop_id, unit_price = product
+    variation_total = sum((variation.price_modifier for variation in variations), Decimal('0.00'))
+    return OrderItem(
+        product_id=product_id, order=order, quantity=quantity, shop_id=shop_id,
+        unit_price=unit_price, variation_total=variation_total,
+        line_total=(unit_price + variation_total) * quantity,
+        variations_data={'variations': [
+            {'type': variation.type, 'value': variation.value, 'price_modifier': str(variation.price_modifier)}
+            for variation in variations
+        ]},
+    )
+
+
+def _invalidate_catalog(product_ids, shop_ids):
+    """
+    UPDATE sans signaux : on invalide nous-mêmes ce qui affiche le stock.
+    Les listes du catalogue n'affichent ni ne filtrent le stock : seules les
+    pages des boutiques dont un produit est épuisé (produits en vedette
+    filtrés sur stock > 0) et le contexte des produits vendus sont touchés.
+    """
+    for shop_id in shop_ids:
+        bump_version(page_cache.shop_namespace(shop_id))
+    for product_id in product_ids:
+        bump_version(product_context_namespace(product_id))
+
+
+@transaction.atomic
+def place_order(cart, user, shipping):
+    """
+    Transforme le panier en commande et vide le panier.
+    `shipping` : full_name, email, city, address, zipcode.
+    Lève OutOfStock (rien n'est écrit) si un produit n'a plus assez de stock ;
+    retourne None si le panier est vide.
+    """
+    items = list(cart.items.order_by('pk').values_list('pk', 'product_id', 'quantity'))
+    if not items:
+        return None
+    variation_ids = defaultdict(list)
+    for cart_item_id, variation_id in CartItemVariation.objects.filter(
+        cart_item__cart=cart
+    ).order_by('variation_id').values_list('cart_item_id', 'variation_id'):
+        variation_ids[cart_item_id].append(variation_id)
+
+    product_quantities = defaultdict(int)
+    variation_quantities = defaultdict(int)
+    for cart_item_id, product_id, quantity in items:
+        product_quantities[product_id] += quantity
+        for variation_id in variation_ids[cart_item_id]:
+            variation_quantities[variation_id] += quantity
+
+    # Verrous pris dans l'ordre des identifiants : pas d'interblocage entre deux paniers
+    products = lock_products(product_quantities)
+    variations = {}
+    if variation_quantities:
+        variations = {
+            variation.pk: variation for variation in
+            ProductVariation.objects.select_for_update().filter(pk__in=list(variation_quantities)).order_by('pk')
+        }
+
+    # Les unités réservées par ce panier sont à lui ; celles des autres paniers sont exclues
+    check_available(cart, product_quantities, products)
+
+    order = Order.objects.create(
+        user=user,
+        complete=True,
+        transaction_id=f"trans-{user.id}-{date.today().isoformat()}",
+        **shipping
+    )
+    _decrement(Product, 'stock', product_quantities)
+    # Le stock d'une variation s'ajoute à celui du produit (total_stock) : pas de contrôle séparé
+    _decrement(ProductVariation, 'stock_variation', variation_quantities)
+
+    order_items = OrderItem.objects.bulk_create([
+        _order_item(order, product_id, quantity, products[product_id], [
+            variations[variation_id] for variation_id in variation_ids[cart_item_id] if variation_id in variations
+        ])
+        for cart_item_id, product_id, quantity in items
+    ])
+    OrderItemVariation.objects.bulk_create([
+        OrderItemVariation(order_item=order_item, variation_id=variation_id)
+        for (cart_item_id, _, _), order_item in zip(items, order_items)
+        for variation_id in variation_ids[cart_item_id]
+    ])
+
+    # Vide le panier (les liens CartItemVariation suivent en cascade) et libère ses réservations
+    cart.items.all().delete()
+    release_cart(cart)
+
+    sold_out_shops = {
+        shop_id for product_id, (_, stock, shop_id, _) in products.items()
+        if stock - product_quantities[product_id] <= 0
+    }
+    transaction.on_commit(lambda: _invalidate_catalog(list(products), sold_out_shops))
+    logger.info(f"🧾 Commande {order.id} : {len(items)} articles, {sum(product_quantities.values())} unités")
+    return order
@@ -0,0 +1,364 @@
+# Fichier : shop/facets.py
+"""
+Navigation à facettes du catalogue : nombre de produits pour chaque valeur
+de facette (catégorie, sous-catégorie, boutique, tranche de prix, note)
+sous les filtres en cours.
+
+Chaque valeur de facette est un bitmap (entier Python) des produits qui la
+portent : compter sous des filtres revient à des ET binaires suivis de
+int.bit_count(), sans GROUP BY. Les produits sont numérotés dans l'ordre
+(catégorie, sous-catégorie, boutique, id) pour que les bitmaps de ces
+facettes soient des plages compactes, stockées avec leur décalage.
+
+L'index est construit en une requête et gardé en mémoire par processus.
+Les signaux de Product, Review, Category, SubCategory et Shop incrémentent
+la version 'facets' (cache_utils, cache partagé entre les processus). L'index est alors reconstruit au plus
+une fois toutes les FACET_INDEX_MIN_AGE secondes, dans un thread : les
+requêtes continuent de lire l'ancien index pendant la reconstruction. Les
+compteurs peuvent donc avoir ce retard sur le catalogue.
+"""
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, QuerySet
+from django.db.models.functions import Cast
+
+from .cache_utils import get_version
+
+logger = logging.getLogger(__name__)
+
+FACET_NAMESPACE = 'facets'
+FACETS = ('category', 'subcategory', 'shop', 'price_band', 'rating')
+RATING_THRESHOLDS = (5, 4, 3, 2, 1)
+# Paliers de prix précalculés pour les fourchettes libres (min_price / max_price)
+PRICE_RANGE_STEPS = 64
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def price_bands():
+    """Bornes des tranches de prix : tranche i = [bornes[i - 1], bornes[i]["""
+    return list(_setting('FACET_PRICE_BANDS', [5000, 10000, 25000, 50000, 100000]))
+
+
+def price_band_range(band):
+    """(min inclus, max exclu) d'une tranche ; None pour une borne ouverte."""
+    bounds = price_bands()
+    if not 0 <= band <= len(bounds):
+        raise ValueError(band)
+    low = bounds[band - 1] if band > 0 else None
+    high = bounds[band] if band < len(bounds) else None
+    return low, high
+
+
+def _price_band_label(band):
+    low, high = price_band_range(band)
+    if low is None:
+        return f"Moins de {high:,}".replace(',', ' ')
+    if high is None:
+        return f"{low:,} et plus".replace(',', ' ')
+    return f"{low:,} – {high:,}".replace(',', ' ')
+
+
+def _bitmap(positions):
+    """(décalage en octets, bitmap) pour une liste de positions croissantes."""
+    first = positions[0] // 8
+    buffer = bytearray(positions[-1] // 8 - first + 1)
+    for position in positions:
+        buffer[position // 8 - first] |= 1 << (position % 8)
+    return first, int.from_bytes(buffer, 'little')
+
+
+def _from_positions(positions):
+    """Bitmap complet de positions dans un ordre quelconque."""
+    positions = sorted(positions)
+    if not positions:
+        return 0
+    offset, bits = _bitmap(positions)
+    return bits << (offset * 8)
+
+
+class FacetIndex:
+    def __init__(self):
+        self.size = 0
+        # facette -> valeur -> (décalage en octets, bitmap, nombre de produits)
+        self.bitmaps = {facet: {} for facet in FACETS}
+        self.labels = {facet: {} for facet in FACETS}
+        self.category_slugs = {}
+        self.subcategory_slugs = {}
+        # facette -> valeur -> slug (liens de navigation)
+        self.value_slugs = {'category': {}, 'subcategory': {}}
+        # id produit -> position (recherche dichotomique), positions par prix croissant
+        self.sorted_pks = array('q')
+        self.pk_positions = array('q')
+        self.sorted_prices = array('d')
+        self.price_positions = array('q')
+        # price_prefixes[k] : bitmap des k * price_step produits les moins chers
+        self.price_step = 1
+        self.price_prefixes = [0]
+
+    @classmethod
+    def build(cls):
+        from .models import Product, Category, SubCategory, Shop
+
+        started = time.perf_counter()
+        index = cls()
+        bounds = price_bands()
+        positions = {facet: defaultdict(list) for facet in FACETS}
+        category_positions, subcategory_positions, shop_positions, band_positions, rating_positions = (
+            positions[facet] for facet in FACETS
+        )
+        pks, prices = array('q'), array('d')
+        rows = (
+            Product.objects.order_by('category_id', 'subcategory_id', 'shop_id', 'id')
+            # Prix lu en flottant : pas de conversion Decimal par ligne
+            .values_list('id', 'category_id', 'subcategory_id', 'shop_id', Cast('price', FloatField()), 'rating_avg')
+            .iterator(chunk_size=10000)
+        )
+        for position, (pk, category_id, subcategory_id, shop_id, price, rating_avg) in enumerate(rows):
+            if category_id is not None:
+                category_positions[category_id].append(position)
+            if subcategory_id is not None:
+                subcategory_positions[subcategory_id].append(position)
+            shop_positions[shop_id].append(position)
+            band_positions[bisect_right(bounds, price)].append(position)
+            if rating_avg >= 1:
+                # Note arrondie à l'entier inférieur ; les seuils sont cumulés plus bas
+                rating_positions[min(int(rating_avg), 5)].append(position)
+            pks.append(pk)
+            prices.append(price)
+        index.size = len(pks)
+
+        for facet, values in positions.items():
+            if facet == 'rating':
+                continue
+            for value, value_positions in values.items():
+                offset, bits = _bitmap(value_positions)
+                index.bitmaps[facet][value] = (offset, bits, len(value_positions))
+        # « n ★ et plus » : union des notes n à 5
+        cumulated, total = 0, 0
+        for threshold in RATING_THRESHOLDS:
+            bucket = rating_positions.get(threshold)
+            if bucket:
+                cumulated |= _from_positions(bucket)
+                total += len(bucket)
+            if total:
+                index.bitmaps['rating'][threshold] = (0, cumulated, total)
+
+        pk_order = sorted(range(index.size), key=pks.__getitem__)
+        index.sorted_pks = array('q', (pks[position] for position in pk_order))
+        index.pk_positions = array('q', pk_order)
+        price_order = sorted(range(index.size), key=prices.__getitem__)
+        index.sorted_prices = array('d', (prices[position] for position in price_order))
+        index.price_positions = array('q', price_order)
+        index.price_step = max(1, -(-index.size // PRICE_RANGE_STEPS))
+        prefix = 0
+        for start in range(0, index.size - index.price_step + 1, index.price_step):
+            prefix |= _from_positions(index.price_positions[start:start + index.price_step])
+            index.price_prefixes.append(prefix)
+
+        for category_id, name, slug in Category.objects.values_list('id', 'name', 'slug'):
+            index.labels['category'][category_id] = name
+            index.category_slugs[slug] = category_id
+            index.value_slugs['category'][category_id] = slug
+        for subcategory_id, name, slug in SubCategory.objects.values_list('id', 'name', 'slug'):
+            index.labels['subcategory'][subcategory_id] = name
+            index.subcategory_slugs[slug] = subcategory_id
+            index.value_slugs['subcategory'][subcategory_id] = slug
+        shops = Shop.objects.values_list('id', 'merchant__first_name', 'merchant__last_name')
+        for shop_id, first_name, last_name in shops:
+            index.labels['shop'][shop_id] = f"Boutique de {first_name} {last_name}"
+        for band in range(len(bounds) + 1):
+            index.labels['price_band'][band] = _price_band_label(band)
+        for threshold in RATING_THRESHOLDS:
+            index.labels['rating'][threshold] = f"{threshold} ★ et plus"
+
+        logger.info(
+            f"🧮 Index des facettes construit : {index.size} produits "
+            f"en {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+        return index
+
+    def _full(self, facet, value):
+        """Bitmap complet (sans décalage) d'une valeur ; 0 si aucun produit."""
+        entry = self.bitmaps[facet].get(value)
+        return entry[1] << (entry[0] * 8) if entry else 0
+
+    def products_bitmap(self, product_ids):
+        """
+        Bitmap d'un ensemble d'identifiants de produits (ex. résultats de
+        recherche) ; un QuerySet est lu par lots, sans liste intermédiaire.
+        """
+        if isinstance(product_ids, QuerySet):
+            product_ids = product_ids.iterator(chunk_size=5000)
+        positions = []
+        for pk in product_ids:
+            i = bisect_left(self.sorted_pks, pk)
+            if i < len(self.sorted_pks) and self.sorted_pks[i] == pk:
+                positions.append(self.pk_positions[i])
+        return _from_positions(positions)
+
+    def _cheapest(self, count):
+        """Bitmap des `count` produits les moins chers : un palier plus la bordure."""
+        step = count // self.price_step
+        border = self.price_positions[step * self.price_step:count]
+        return self.price_prefixes[step] | _from_positions(border)
+
+    def price_range_bitmap(self, min_price=None, max_price=None):
+        """Bitmap des produits dont le prix est dans [min_price, max_price]."""
+        start = bisect_left(self.sorted_prices, float(min_price)) if min_price is not None else 0
+        end = bisect_right(self.sorted_prices, float(max_price)) if max_price is not None else self.size
+        if end <= start:
+            return 0
+        # Les moins chers jusqu'à `end`, privés des moins chers jusqu'à `start`
+        return self._cheapest(end) ^ self._cheapest(start)
+
+    def counts(self, selected=None, restrict=None):
+        """
+        Compteurs par facette. `selected` : {facette: valeur} des filtres de
+        facette actifs ; `restrict` : bitmap des autres filtres (recherche,
+        prix libre) ou None. Le compteur d'une facette tient compte de tous
+        les filtres sauf le sien, pour pouvoir changer de valeur.
+        """
+        selected = {facet: value for facet, value in (selected or {}).items() if value is not None}
+        filters = {facet: self._full(facet, value) for facet, value in selected.items()}
+        max_values = _setting('FACET_MAX_VALUES', 20)
+
+        result = {}
+        for facet in FACETS:
+            base = restrict
+            for other, bitmap in filters.items():
+                if other != facet:
+                    base = bitmap if base is None else base & bitmap
+            base_bytes = None if base is None else base.to_bytes((self.size + 7) // 8 or 1, 'little')
+
+            values = []
+            for value, (offset, bits, total) in self.bitmaps[facet].items():
+                if base_bytes is None:
+                    count = total
+                else:
+                    chunk = base_bytes[offset:offset + (bits.bit_length() + 7) // 8]
+                    count = (int.from_bytes(chunk, 'little') & bits).bit_count()
+                if count or selected.get(facet) == value:
+                    values.append({
+                        'value': value,
+                        'label': self.labels[facet].get(value, str(value)),
+                        'count': count,
+                        'selected': selected.get(facet) == value,
+                        'slug': self.value_slugs.get(facet, {}).get(value),
+                    })
+            if facet in ('price_band', 'rating'):
+                values.sort(key=lambda v: v['value'], reverse=facet == 'rating')
+            else:
+                values.sort(key=lambda v: (-v['count'], v['label']))
+                values = values[:max_values]
+            result[facet] = values
+        return result
+
+
+_index = None
+_index_version = None
+_index_built_at = 0.0
+_rebuilding = False
+# _lock protège l'état ci-dessus (jamais tenu pendant une construction) ;
+# _build_lock fait attendre les requêtes simultanées du premier appel.
+_lock = threading.Lock()
+_build_lock = threading.Lock()
+
+
+def _install(index, version):
+    global _index, _index_version, _index_built_at
+    _index, _index_version, _index_built_at = index, version, time.monotonic()
+
+
+def _rebuild(version, close_connection=True):
+    global _rebuilding
+    try:
+        index = FacetIndex.build()
+        with _lock:
+            _install(index, version)
+    except Exception as e:
+        logger.error(f"❌ Erreur reconstruction de l'index des facettes : {e}")
+    finally:
+        with _lock:
+            _rebuilding = False
+        if close_connection:
+            # Connexion ouverte par ce thread
+            connection.close()
+
+
+def get_facet_index():
+    """
+    Index du processus ; une reconstruction est lancée si le catalogue a
+    changé. La version vit dans le cache partagé : une modification faite
+    par un autre processus est vue ici. La construction se fait hors de
+    _lock, l'index courant restant servi jusqu'à l'échange.
+    """
+    global _rebuilding
+    version = get_version(FACET_NAMESPACE)
+    with _lock:
+        index = _index
+        rebuild = (
+            index is not None
+            and version != _index_version
+            and not _rebuilding
+            and time.monotonic() - _index_built_at >= _setting('FACET_INDEX_MIN_AGE', 30)
+        )
+        if rebuild:
+            _rebuilding = True
+
+    if index is None:
+        # Premier appel : construction synchrone, une seule pour les requêtes simultanées
+        with _build_lock:
+            if _index is None:
+                built = FacetIndex.build()
+                with _lock:
+                    if _index is None:
+                        _install(built, version)
+            return _index
+    if rebuild:
+        if _setting('FACET_INDEX_BACKGROUND_REBUILD', True):
+            threading.Thread(target=_rebuild, args=(version,), daemon=True).start()
+        else:
+            _rebuild(version, close_connection=False)
+            return _index
+    return index
+
+
+def reset_facet_index():
+    global _index, _index_version
+    with _lock:
+        _index = None
+        _index_version = None
+
+
+def facet_counts(category_slug=None, subcategory_slug=None, shop=None, price_band=None, min_rating=None,
+                 min_price=None, max_price=None, product_ids=None):
+    """
+    Compteurs des facettes pour les filtres du catalogue. `product_ids` :
+    identifiants (ou QuerySet values_list) des résultats d'une recherche,
+    None s'il n'y a pas de recherche.
+    """
+    index = get_facet_index()
+    selected = {
+        'category': index.category_slugs.get(category_slug, -1) if category_slug else None,
+        'subcategory': index.subcategory_slugs.get(subcategory_slug, -1) if subcategory_slug else None,
+        'shop': shop,
+        'price_band': price_band,
+        'rating': min_rating,
+    }
+    restrict = None
+    if product_ids is not None:
+        restrict = index.products_bitmap(product_ids)
+    if min_price is not None or max_price is not None:
+        price_bitmap = index.price_range_bitmap(min_price, max_price)
+        restrict = price_bitmap if restrict is None else restrict & price_bitmap
+    return index.counts(selected, restrict)
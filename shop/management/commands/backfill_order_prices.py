@@ -0,0 +1,29 @@
+# Fichier : shop/management/commands/backfill_order_prices.py
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from shop.order_prices import price_order_items, unpriced_order_items
+
+
+class Command(BaseCommand):
+    help = "Fige boutique, prix et total des lignes de commande chargées sans eux (fixtures, dumps, imports)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Lignes mises à jour par lot')
+
+    def handle(self, *args, **options):
+        # Lots par identifiant croissant ; les prix déjà figés ne sont jamais recalculés
+        OrderItem = apps.get_model('shop', 'OrderItem')
+        batch_size = options['batch_size']
+        last_id = 0
+        updated = 0
+        while True:
+            ids = list(
+                unpriced_order_items(apps).filter(pk__gt=last_id)
+                .order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            updated += price_order_items(apps, OrderItem.objects.filter(pk__in=ids))
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'{updated} lignes de commande figées'))
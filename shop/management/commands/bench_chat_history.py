@@ -0,0 +1,100 @@
+# Fichier : shop/management/commands/bench_chat_history.py
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from shop.models import Merchant, Shop, Product, Conversation, Message
+from shop.pagination import keyset_paginate, decode_cursor, keyset_filter
+
+ORDERING = ('-timestamp', '-id')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Mesure l'affichage de l'historique d'une longue négociation (pagination keyset vs OFFSET)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=100_000, help='Nombre de messages générés')
+        parser.add_argument('--per-page', type=int, default=50, help='Taille de page')
+        parser.add_argument('--runs', type=int, default=5, help='Répétitions par mesure (on garde le minimum)')
+
+    def handle(self, *args, **options):
+        # Tout est créé dans une transaction annulée à la fin : la base reste intacte
+        try:
+            with transaction.atomic():
+                conversation = self.create_conversation(options['messages'])
+                self.run_benchmarks(conversation, options['per_page'], options['runs'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_conversation(self, count):
+        merchant_user = User.objects.create_user('bench_marchand')
+        client_user = User.objects.create_user('bench_client')
+        merchant = Merchant.objects.create(
+            user=merchant_user, first_name='Bench', last_name='Marchand',
+            email='bench@example.com', phone='00000000', country='Mali'
+        )
+        shop = Shop.objects.create(merchant=merchant, description='Boutique de mesure')
+        product = Product.objects.create(shop=shop, name='Produit de mesure', price=1000, stock=1)
+        conversation = Conversation.objects.create(product=product, client=client_user, merchant=merchant)
+
+        start = timezone.now() - timedelta(seconds=count)
+        Message.objects.bulk_create(
+            (
+                Message(
+                    conversation=conversation,
+                    sender=client_user if i % 2 else merchant_user,
+                    text=f'Message {i}',
+                    timestamp=start + timedelta(seconds=i),
+                )
+                for i in range(count)
+            ),
+            batch_size=5000,
+        )
+        self.stdout.write(f"{count} messages générés")
+        return conversation
+
+    def measure(self, label, func, runs):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            rows = func()
+            timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(f"{label:<40} {min(timings):9.2f} ms   ({rows} lignes)")
+
+    def run_benchmarks(self, conversation, per_page, runs):
+        messages = conversation.messages.all()
+        total = messages.count()
+
+        # Curseur situé au milieu de l'historique, obtenu en parcourant les pages
+        middle_cursor = None
+        depth = 0
+        while depth < total // 2:
+            page = keyset_paginate(messages.only('id', 'timestamp'), ORDERING, middle_cursor, per_page=1000)
+            middle_cursor = page.next_cursor
+            depth += len(page)
+
+        self.measure('Dernière page (keyset)', lambda: len(keyset_paginate(messages, ORDERING, None, per_page)), runs)
+        self.measure('Page au milieu (keyset)', lambda: len(keyset_paginate(messages, ORDERING, middle_cursor, per_page)), runs)
+        self.measure('Page au milieu (OFFSET)', lambda: len(list(messages.order_by(*ORDERING)[depth:depth + per_page])), runs)
+        self.measure('Historique complet (avant)', lambda: len(list(messages.order_by('timestamp'))), runs)
+
+        if connection.vendor == 'sqlite':
+            sql, params = self.keyset_sql(messages, middle_cursor, per_page)
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = ' / '.join(row[-1] for row in cursor.fetchall())
+            self.stdout.write(f"Plan SQLite (keyset) : {plan}")
+
+    def keyset_sql(self, messages, cursor, per_page):
+        values = decode_cursor(cursor, Message, ORDERING)
+        queryset = messages.order_by(*ORDERING).filter(keyset_filter(ORDERING, values))[:per_page + 1]
+        return queryset.query.sql_with_params()
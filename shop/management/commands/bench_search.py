@@ -0,0 +1,93 @@
+# Fichier : shop/management/commands/bench_search.py
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from shop.models import Merchant, Shop, Product
+from shop.search import rebuild_index, search_backend, search_products
+
+WORDS = [
+    'boubou', 'pagne', 'wax', 'bazin', 'brodé', 'sandale', 'cuir', 'sac', 'perle', 'collier',
+    'bracelet', 'karité', 'savon', 'panier', 'tissu', 'indigo', 'bogolan', 'chapeau', 'calebasse', 'statuette',
+]
+# Mots très courants (présents dans 20 à 95 % des produits), puis mots sélectifs
+QUERIES = ['boubou', 'bazin brodé', 'sac cuir', 'bogol', 'karité savon naturel', 'mot150', 'mot1500', 'mot15 mot40']
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Mesure la recherche de produits (index plein texte vs filtre icontains)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200_000, help='Nombre de produits générés')
+        parser.add_argument('--runs', type=int, default=5, help='Répétitions par mesure (on garde le minimum)')
+
+    def handle(self, *args, **options):
+        if search_backend() is None:
+            self.stderr.write("Index de recherche indisponible sur cette base")
+            return
+        # Tout est créé dans une transaction annulée à la fin : la base reste intacte
+        try:
+            with transaction.atomic():
+                self.create_products(options['products'])
+                self.run_benchmarks(options['runs'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_products(self, count):
+        merchant = Merchant.objects.create(
+            user=User.objects.create_user('bench_search_marchand'), first_name='Bench', last_name='Recherche',
+            email='bench-search@example.com', phone='00000000', country='Mali'
+        )
+        shop = Shop.objects.create(merchant=merchant, description='Boutique de mesure')
+        rng = random.Random(0)
+        # Vocabulaire réaliste : quelques mots du métier noyés dans des milliers de mots rares
+        vocabulary = WORDS + [f'mot{i}' for i in range(20_000)]
+        weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+        Product.objects.bulk_create(
+            (
+                Product(
+                    shop=shop,
+                    name=' '.join(rng.choices(vocabulary, weights, k=3)),
+                    description=' '.join(rng.choices(vocabulary, weights, k=30)),
+                    price=1000,
+                    stock=1,
+                )
+                for _ in range(count)
+            ),
+            batch_size=5000,
+        )
+        started = time.perf_counter()
+        indexed = rebuild_index()
+        self.stdout.write(f"{indexed} produits indexés en {time.perf_counter() - started:.1f} s")
+
+    def measure(self, label, func, runs):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            rows = func()
+            timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(f"{label:<40} {min(timings):9.2f} ms   ({rows} lignes)")
+
+    def run_benchmarks(self, runs):
+        products = Product.objects.all()
+        for query in QUERIES:
+            # Comme product_search_list : nombre de résultats puis première page
+            self.measure(f"'{query}' (index)", lambda: self.first_page(search_products(products, query)), runs)
+            self.measure(
+                f"'{query}' (icontains)",
+                lambda: self.first_page(products.filter(Q(name__icontains=query) | Q(description__icontains=query))),
+                runs,
+            )
+
+    def first_page(self, queryset):
+        queryset.count()
+        return len(queryset[:12])
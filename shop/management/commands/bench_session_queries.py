@@ -0,0 +1,70 @@
+# Fichier : shop/management/commands/bench_session_queries.py
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from shop.models import Merchant, Shop, Product, Conversation, Message
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compte les requêtes SQL par requête HTTP pour chaque profil de session (SESSION_PROFILES)'
+
+    def handle(self, *args, **options):
+        # Données de mesure créées dans une transaction annulée à la fin
+        try:
+            with transaction.atomic():
+                self.run(*self.create_fixtures())
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_fixtures(self):
+        merchant_user = User.objects.create_user('bench_sessions_marchand', password='bench')
+        client_user = User.objects.create_user('bench_sessions_client', password='bench')
+        merchant = Merchant.objects.create(
+            user=merchant_user, first_name='Bench', last_name='Sessions',
+            email='bench-sessions@example.com', phone='00000000', country='Mali'
+        )
+        shop = Shop.objects.create(merchant=merchant, description='Boutique de mesure')
+        product = Product.objects.create(shop=shop, name='Produit de mesure', price=Decimal('1000'), stock=5)
+        conversation = Conversation.objects.create(product=product, client=client_user, merchant=merchant)
+        Message.objects.create(conversation=conversation, sender=client_user, text='Bonjour')
+        return client_user, conversation
+
+    def run(self, client_user, conversation):
+        urls = [
+            ('product_list', reverse('product_list')),
+            ('cart_detail', reverse('cart_detail')),
+            ('conversation_detail', reverse('conversation_detail', args=[conversation.id])),
+            ('chat_messages_api', reverse('chat_messages_api', args=[conversation.id])),
+        ]
+        results = {}
+        for profile, engine in settings.SESSION_PROFILES.items():
+            caches[settings.SESSION_CACHE_ALIAS].clear()
+            with override_settings(SESSION_ENGINE=engine, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                client = Client()
+                client.force_login(client_user)
+                for label, url in urls:
+                    # Premier passage : sessions, panier et caches initialisés
+                    client.get(url)
+                    with CaptureQueriesContext(connection) as queries:
+                        response = client.get(url)
+                    if response.status_code != 200:
+                        self.stderr.write(f"{label} ({profile}) : réponse {response.status_code}")
+                    results.setdefault(label, {})[profile] = len(queries)
+
+        profiles = list(settings.SESSION_PROFILES)
+        self.stdout.write(f"{'vue':<24}" + ''.join(f"{profile:>16}" for profile in profiles))
+        for label, counts in results.items():
+            self.stdout.write(f"{label:<24}" + ''.join(f"{counts[profile]:>16}" for profile in profiles))
@@ -0,0 +1,77 @@
+# Fichier : shop/management/commands/bench_startup.py
+import json
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Code exécuté dans un processus neuf : mesure django.setup() et l'import
+# des modules applicatifs, en comptant les tentatives de connexion réseau.
+# Le client IA et le scheduler doivent rester non initialisés.
+PROBE = r"""
+import json, os, socket, sys, threading, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'deanna_project.settings')
+connections = []
+_connect = socket.socket.connect
+def _counting_connect(self, address):
+    connections.append(str(address))
+    return _connect(self, address)
+socket.socket.connect = _counting_connect
+_getaddrinfo = socket.getaddrinfo
+def _counting_getaddrinfo(host, *args, **kwargs):
+    connections.append(f'dns:{host}')
+    return _getaddrinfo(host, *args, **kwargs)
+socket.getaddrinfo = _counting_getaddrinfo
+started = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+import shop.services, shop.views, shop.urls
+imports_done = time.perf_counter()
+from shop.ai_client import ai_client_registry
+print(json.dumps({
+    'ai_client_ready': ai_client_registry.health()['client_ready'],
+    'scheduler_started': any(t.name == 'APScheduler' for t in threading.enumerate()),
+    'setup_ms': (setup_done - started) * 1000,
+    'imports_ms': (imports_done - setup_done) * 1000,
+    'connections': connections,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Mesure le temps de démarrage de Django et vérifie qu\'aucun appel réseau n\'est fait'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Nombre de démarrages mesurés')
+
+    def handle(self, *args, **options):
+        results = []
+        for _ in range(options['runs']):
+            output = subprocess.run(
+                [sys.executable, '-c', PROBE],
+                cwd=settings.BASE_DIR,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+        for key, label in (('setup_ms', 'django.setup()'), ('imports_ms', 'import shop.*')):
+            values = [r[key] for r in results]
+            self.stdout.write(
+                f"{label:<16} médiane {statistics.median(values):8.1f} ms   "
+                f"min {min(values):8.1f} ms   max {max(values):8.1f} ms"
+            )
+
+        connections = sorted({c for r in results for c in r['connections']})
+        if connections:
+            self.stdout.write(self.style.ERROR(f"Connexions réseau au démarrage : {', '.join(connections)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS('Aucune connexion réseau au démarrage'))
+        if any(r['ai_client_ready'] for r in results):
+            self.stdout.write(self.style.ERROR('Client IA initialisé au démarrage'))
+        if any(r['scheduler_started'] for r in results):
+            self.stdout.write(self.style.ERROR('Scheduler démarré au démarrage'))
@@ -0,0 +1,26 @@
+# Fichier : shop/management/commands/rebuild_product_ratings.py
+from django.core.management.base import BaseCommand
+
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = "Recalcule la note moyenne et le nombre d'avis stockés sur chaque produit"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Produits mis à jour par requête')
+
+    def handle(self, *args, **options):
+        # Lots par identifiant croissant : pas de verrou sur tout le catalogue
+        batch_size = options['batch_size']
+        last_id = 0
+        updated = 0
+        while True:
+            ids = list(
+                Product.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            updated += Product.refresh_rating_summary(ids)
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'{updated} produits mis à jour'))
@@ -0,0 +1,19 @@
+# Fichier : shop/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+
+from shop.search import rebuild_index, search_backend
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche plein texte des produits (après un import en masse)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Produits lus par lot')
+
+    def handle(self, *args, **options):
+        backend = search_backend()
+        if backend is None:
+            self.stdout.write(self.style.WARNING('Index de recherche indisponible sur cette base : filtre icontains utilisé'))
+            return
+        indexed = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{indexed} produits indexés ({backend})'))
@@ -0,0 +1,21 @@
+# Fichier : shop/management/commands/run_ai_worker.py
+from django.core.management.base import BaseCommand
+
+from shop.ai_jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Traite la file des réponses IA de négociation (worker en arrière-plan)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Traite les tâches en attente puis s\'arrête')
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help='Délai (secondes) entre deux consultations de la file vide')
+
+    def handle(self, *args, **options):
+        processed = run_worker(poll_interval=options['poll_interval'], once=options['once'])
+        if options['once']:
+            self.stdout.write(
+                self.style.SUCCESS(f'{processed} tâche(s) IA traitée(s)')
+            )
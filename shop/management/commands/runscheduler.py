@@ -0,0 +1,28 @@
+# Fichier : shop/management/commands/runscheduler.py
+from apscheduler.schedulers.blocking import BlockingScheduler
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django_apscheduler.jobstores import DjangoJobStore
+
+from shop.scheduler import add_scheduled_jobs, release_lease, SCHEDULED_JOBS
+
+
+class Command(BaseCommand):
+    help = 'Exécute les tâches planifiées dans un processus dédié (à lancer une seule fois par déploiement)'
+
+    def handle(self, *args, **options):
+        scheduler = BlockingScheduler(timezone=settings.TIME_ZONE)
+        # Tâches et historique des exécutions enregistrés par django_apscheduler
+        scheduler.add_jobstore(DjangoJobStore(), 'default')
+        add_scheduled_jobs(scheduler)
+
+        for job in SCHEDULED_JOBS:
+            self.stdout.write(f"   - {job['name']} ({job['id']})")
+        self.stdout.write(self.style.SUCCESS('Planificateur démarré (Ctrl+C pour arrêter)'))
+        try:
+            scheduler.start()
+        except (KeyboardInterrupt, SystemExit):
+            scheduler.shutdown()
+        finally:
+            release_lease()
+            self.stdout.write('Planificateur arrêté')
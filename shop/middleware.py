@@ -1,6 +1,5 @@
 # Fichier : shop/middleware.py
-from django.utils import timezone
-from .models import MerchantActivity
+from .presence import presence_tracker
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,20 +14,18 @@ class MerchantActivityMiddleware:
         
         # Met à jour l'activité après la requête
         self.track_merchant_activity(request)
+        # Écrit les battements en attente dès que PRESENCE_FLUSH_INTERVAL est écoulé,
+        # quel que soit l'utilisateur de cette requête
+        presence_tracker.flush_if_due()
         
         return response
     
     def track_merchant_activity(self, request):
-        """Met à jour l'activité du commerçant connecté"""
+        """Note l'activité du commerçant connecté (écriture regroupée, voir shop/presence.py)"""
         if request.user.is_authenticated and hasattr(request.user, 'merchant'):
             try:
                 session_key = request.session.session_key
-                MerchantActivity.update_activity(
-                    merchant=request.user.merchant,
-                    session_key=session_key
-                )
-                
-                logger.debug(f"Activité mise à jour pour {request.user.merchant}")
+                presence_tracker.record(request.user.merchant.id, session_key)
                 
             except Exception as e:
                 logger.error(f"Erreur suivi activité pour {request.user.merchant}: {e}")
\ No newline at end of file
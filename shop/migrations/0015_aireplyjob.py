@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_merchantactivity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIReplyJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('running', 'En cours'), ('done', 'Terminée'), ('skipped', 'Ignorée'), ('failed', 'Échouée')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=3)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ai_jobs', to='shop.conversation')),
+                ('reply_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shop.message')),
+                ('trigger_message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ai_jobs', to='shop.message')),
+            ],
+            options={
+                'verbose_name': 'Tâche de réponse IA',
+                'verbose_name_plural': 'Tâches de réponse IA',
+                'ordering': ['run_after', 'id'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='shop_aijob_status_run_idx')],
+            },
+        ),
+    ]
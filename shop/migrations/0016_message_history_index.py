@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_aireplyjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'timestamp', 'id'], name='shop_msg_conv_ts_id_idx'),
+        ),
+    ]
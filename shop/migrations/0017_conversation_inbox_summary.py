@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:00
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Substr
+
+
+def backfill_inbox_summary(apps, schema_editor):
+    """Renseigne le dernier message des conversations existantes en une requête."""
+    Conversation = apps.get_model('shop', 'Conversation')
+    Message = apps.get_model('shop', 'Message')
+    latest = Message.objects.filter(conversation=OuterRef('pk')).order_by('-timestamp', '-id')
+    Conversation.objects.update(
+        last_message_at=Coalesce(Subquery(latest.values('timestamp')[:1]), F('created_at')),
+        last_message_preview=Coalesce(Subquery(latest.annotate(preview=Substr('text', 1, 140)).values('preview')[:1]), Value('')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0016_message_history_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='client_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=140),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='merchant_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['merchant', 'last_message_at', 'id'], name='shop_conv_merchant_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['client', 'last_message_at', 'id'], name='shop_conv_client_recent_idx'),
+        ),
+        migrations.RunPython(backfill_inbox_summary, migrations.RunPython.noop),
+    ]
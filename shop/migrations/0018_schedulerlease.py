@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_conversation_inbox_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('holder', models.CharField(max_length=255)),
+                ('acquired_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Bail du planificateur',
+                'verbose_name_plural': 'Baux du planificateur',
+            },
+        ),
+    ]
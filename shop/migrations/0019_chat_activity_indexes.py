@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0018_schedulerlease'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='merchantactivity',
+            index=models.Index(fields=['is_active_in_chat'], name='shop_activity_chat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['timestamp', 'sender'], name='shop_msg_ts_sender_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Index de recherche plein texte des produits (voir shop/search.py)
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from shop import search
+
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(search.SQLITE_CREATE_SQL)
+        except Exception:
+            # SQLite compilé sans FTS5 : la recherche garde le filtre icontains
+            return
+    elif connection.vendor == 'postgresql':
+        for sql in search.POSTGRES_CREATE_SQL:
+            schema_editor.execute(sql)
+    else:
+        return
+    search.reset_backend_cache()
+    search.rebuild_index(using=connection.alias, model=apps.get_model('shop', 'Product'))
+
+
+def drop_search_index(apps, schema_editor):
+    from shop import search
+
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {search.SQLITE_TABLE}")
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {search.POSTGRES_TABLE}")
+    search.reset_backend_cache()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0019_chat_activity_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:56
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_summary(apps, schema_editor):
+    """Calcule la note moyenne et le nombre d'avis des produits existants en une requête."""
+    Product = apps.get_model('shop', 'Product')
+    Review = apps.get_model('shop', 'Review')
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        rating_avg=Coalesce(Subquery(reviews.annotate(value=Avg('rating')).values('value')), 0.0),
+        rating_count=Coalesce(Subquery(reviews.annotate(value=Count('id')).values('value')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0020_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['rating_avg', 'rating_count'], name='shop_product_rating_idx'),
+        ),
+        migrations.RunPython(backfill_rating_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0022_catalog_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='shop.cart')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='shop.product')),
+            ],
+            options={
+                'verbose_name': 'Réservation de stock',
+                'verbose_name_plural': 'Réservations de stock',
+                'indexes': [models.Index(fields=['product', 'expires_at', 'quantity'], name='shop_reservation_active_idx'), models.Index(fields=['expires_at', 'id'], name='shop_reservation_expiry_idx')],
+                'constraints': [models.UniqueConstraint(fields=('cart', 'product'), name='shop_reservation_cart_product_uniq')],
+            },
+        ),
+    ]
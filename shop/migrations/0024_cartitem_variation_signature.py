@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:32
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def backfill_variation_signatures(apps, schema_editor):
+    """
+    Calcule la signature des lignes existantes et fusionne les doublons
+    (même panier, produit et variations) avant la contrainte d'unicité.
+    """
+    CartItem = apps.get_model('shop', 'CartItem')
+    CartItemVariation = apps.get_model('shop', 'CartItemVariation')
+    variation_ids = defaultdict(list)
+    for cart_item_id, variation_id in CartItemVariation.objects.values_list('cart_item_id', 'variation_id'):
+        variation_ids[cart_item_id].append(variation_id)
+
+    kept = {}
+    for item in CartItem.objects.order_by('pk').only('pk', 'cart_id', 'product_id', 'quantity'):
+        signature = '-'.join(str(pk) for pk in sorted(set(variation_ids[item.pk])))
+        key = (item.cart_id, item.product_id, signature)
+        if key in kept:
+            CartItem.objects.filter(pk=kept[key]).update(quantity=models.F('quantity') + item.quantity)
+            item.delete()
+        else:
+            kept[key] = item.pk
+            if signature:
+                CartItem.objects.filter(pk=item.pk).update(variation_signature=signature)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0023_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='variation_signature',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(backfill_variation_signatures, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Migration séparée : sous PostgreSQL, ajouter la contrainte dans la transaction
+    # qui vient de fusionner les doublons échouerait (déclencheurs différés en attente)
+
+    dependencies = [
+        ('shop', '0024_cartitem_variation_signature'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product', 'variation_signature'), name='shop_cartitem_signature_uniq'),
+        ),
+    ]
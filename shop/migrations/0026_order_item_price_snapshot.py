@@ -0,0 +1,62 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:38
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_order_prices(apps, schema_editor):
+    """Fige les prix des lignes existantes aux prix actuels (voir OrderItem.capture_prices)."""
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    OrderItemVariation = apps.get_model('shop', 'OrderItemVariation')
+    Product = apps.get_model('shop', 'Product')
+    product = Product.objects.filter(pk=OuterRef('product'))
+    modifiers = OrderItemVariation.objects.filter(order_item=OuterRef('pk')).order_by().values('order_item')
+    zero = Value(Decimal('0.00'))
+    OrderItem.objects.update(
+        shop=Subquery(product.values('shop')),
+        unit_price=Coalesce(Subquery(product.values('price')), zero),
+        variation_total=Coalesce(
+            Subquery(modifiers.annotate(total=Sum('variation__price_modifier')).values('total')), zero,
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        ),
+    )
+    OrderItem.objects.update(line_total=(F('unit_price') + F('variation_total')) * Coalesce('quantity', 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0025_cartitem_signature_constraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='line_total',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='shop',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='shop.shop'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='variation_total',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['shop', 'date_added'], name='shop_orderitem_shop_date_idx'),
+        ),
+        migrations.RunPython(backfill_order_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:12
+
+from django.db import migrations
+
+from shop.order_prices import price_order_items
+
+
+def backfill_remaining_prices(apps, schema_editor):
+    """Fige les lignes restées sans prix depuis 0026 (créées par l'admin), avant NOT NULL."""
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    price_order_items(apps, OrderItem.objects.filter(line_total__isnull=True))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0026_order_item_price_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_remaining_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0027_backfill_order_item_prices'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='orderitem',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='variation_total',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+    ]
@@ -4,6 +4,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.urls import reverse
+from django.db.models.functions import Coalesce
 from decimal import Decimal, InvalidOperation
 
 # Le modèle Merchant (Commerçant)
@@ -88,9 +89,38 @@ class Product(models.Model):
     # Produits similaires (relation Many-to-Many)
     similar_products = models.ManyToManyField('self', blank=True, symmetrical=False, related_name='recomended_by')
 
+    # Résumé des avis, tenu à jour par les signaux de Review (0 = aucun avis)
+    rating_avg = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Filtre « note minimale » et tri « meilleure note » sans agréger les avis
+            models.Index(fields=['rating_avg', 'rating_count', 'id'], name='shop_product_rating_idx'),
+            # Tris du catalogue paginé par curseur (views.CATALOG_ORDERINGS)
+            models.Index(fields=['name', 'id'], name='shop_product_name_idx'),
+            models.Index(fields=['price', 'id'], name='shop_product_price_idx'),
+            models.Index(fields=['subcategory', 'name', 'id'], name='shop_product_subcat_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def refresh_rating_summary(cls, products=None):
+        """
+        Recalcule rating_avg et rating_count depuis les avis, en un seul UPDATE.
+        `products` : queryset ou liste d'identifiants (tous les produits par défaut).
+        """
+        reviews = Review.objects.filter(product=models.OuterRef('pk')).order_by().values('product')
+        queryset = cls.objects.all()
+        if products is not None:
+            queryset = products if isinstance(products, models.QuerySet) else queryset.filter(pk__in=products)
+        return queryset.update(
+            rating_avg=Coalesce(models.Subquery(reviews.annotate(value=models.Avg('rating')).values('value')), 0.0),
+            rating_count=Coalesce(models.Subquery(reviews.annotate(value=models.Count('id')).values('value')), 0),
+        )
+
 # Variations de produits
 class ProductVariation(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='variations')
@@ -156,6 +186,46 @@ class OrderItemVariation(models.Model):
     class Meta:
         unique_together = ('order_item', 'variation')
 
+# Totaux calculés en SQL (sous-requêtes) plutôt que par ligne en Python
+MONEY_FIELD = models.DecimalField(max_digits=14, decimal_places=2)
+
+
+def _variation_total(through_model, line_field):
+    """Somme des price_modifier des variations d'une ligne, en sous-requête (0 sans variation)."""
+    modifiers = through_model.objects.filter(**{line_field: models.OuterRef('pk')}).order_by().values(line_field)
+    return Coalesce(
+        models.Subquery(modifiers.annotate(total=models.Sum('variation__price_modifier')).values('total')),
+        models.Value(Decimal('0.00')), output_field=MONEY_FIELD,
+    )
+
+
+class CartItemQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annote variation_total et line_total ((prix + variations) x quantité)."""
+        return self.annotate(
+            variation_total=_variation_total(CartItemVariation, 'cart_item'),
+        ).annotate(
+            line_total=models.ExpressionWrapper(
+                (models.F('product__price') + models.F('variation_total')) * models.F('quantity'),
+                output_field=MONEY_FIELD,
+            ),
+        )
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annote cart_total (somme des lignes) et cart_items (nombre d'articles)."""
+        lines = OrderItem.objects.filter(order=models.OuterRef('pk')).order_by()
+        return self.annotate(
+            cart_total=Coalesce(
+                models.Subquery(lines.values('order').annotate(total=models.Sum('line_total')).values('total')),
+                models.Value(Decimal('0.00')), output_field=MONEY_FIELD,
+            ),
+            cart_items=Coalesce(
+                models.Subquery(lines.values('order').annotate(total=models.Sum('quantity')).values('total')), 0
+            ),
+        )
+
 # Avis et évaluations
 class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
@@ -199,23 +269,41 @@ class CartItem(models.Model):
     
     # Référence aux variations sélectionnées via le modèle intermédiaire
     selected_variations = models.ManyToManyField(ProductVariation, through=CartItemVariation, blank=True)
+    # Identifiants triés des variations sélectionnées ("3-17", "" sans variation) :
+    # une ligne par (panier, produit, combinaison), retrouvée par l'index unique
+    variation_signature = models.CharField(max_length=255, blank=True, default='')
+
+    objects = CartItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['cart', 'product', 'variation_signature'], name='shop_cartitem_signature_uniq'
+            ),
+        ]
 
     def __str__(self):
         variations_str = ", ".join([f"{v.type}: {v.value}" for v in self.selected_variations.all()])
         return f"{self.quantity} x {self.product.name}" + (f" ({variations_str})" if variations_str else "")
+
+    @staticmethod
+    def signature_for(variation_ids):
+        return '-'.join(str(variation_id) for variation_id in sorted({int(pk) for pk in variation_ids}))
     
     @property
     def get_total(self):
+        # Ligne chargée par CartItem.objects.with_totals() : aucune requête
+        if hasattr(self, 'line_total'):
+            return self.line_total
         base_price = self.product.price
         # Ajouter le prix des variations sélectionnées
         variation_price = sum([v.price_modifier for v in self.selected_variations.all()])
         return (base_price + variation_price) * self.quantity
     
-    # Méthode pour obtenir la clé unique du panier
+    # Méthode pour obtenir la clé unique du panier (sans requête : signature stockée)
     @property
     def cart_key(self):
-        variations = sorted([f"{v.type}_{v.value}" for v in self.selected_variations.all()])
-        return f"{self.product.id}_{'_'.join(variations)}"
+        return f"{self.product_id}_{self.variation_signature}"
 
 # Le modèle Order (Commande)
 class Order(models.Model):
@@ -230,19 +318,25 @@ class Order(models.Model):
     address = models.CharField(max_length=200, null=True)
     zipcode = models.CharField(max_length=200, null=True)
 
+    objects = OrderQuerySet.as_manager()
+
     def __str__(self):
         return str(self.id)
     
     @property
     def get_cart_total(self):
-        orderitems = self.orderitem_set.all()
-        total = sum([item.get_total for item in orderitems])
-        return total
+        # Commande chargée par Order.objects.with_totals() : aucune requête
+        if hasattr(self, 'cart_total'):
+            return self.cart_total
+        total = self.orderitem_set.aggregate(total=models.Sum('line_total'))['total']
+        return total or Decimal('0.00')
 
     @property
     def get_cart_items(self):
+        if hasattr(self, 'cart_items'):
+            return self.cart_items
         orderitems = self.orderitem_set.all()
-        total = sum([item.quantity for item in orderitems])
+        total = sum([item.quantity or 0 for item in orderitems])
         return total
 
 # Le modèle OrderItem (Article de la commande)
@@ -256,28 +350,51 @@ class OrderItem(models.Model):
     selected_variations = models.ManyToManyField(ProductVariation, through=OrderItemVariation, blank=True)
     variations_data = models.JSONField(default=dict, blank=True) # Backup des données de variation
 
+    # Prix et boutique figés à la commande (shop/checkout.py) : le chiffre d'affaires
+    # ne change plus quand un commerçant modifie un prix ou supprime un produit.
+    # Une ligne créée ailleurs (admin, script) est figée par save() ; line_total
+    # suit toujours la quantité. Lignes chargées sans save() : backfill_order_prices.
+    shop = models.ForeignKey(Shop, on_delete=models.SET_NULL, null=True, blank=True, related_name='order_items')
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    variation_total = models.DecimalField(max_digits=10, decimal_places=2)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            # Chiffre d'affaires d'une boutique par jour, sans jointure sur Product
+            models.Index(fields=['shop', 'date_added'], name='shop_orderitem_shop_date_idx'),
+        ]
+
     @property
     def get_total(self):
-        base_price = self.product.price if self.product else 0
-        variation_price = 0
-        for variation in self.selected_variations.all():
-            variation_price += variation.price_modifier
-        return (base_price + variation_price) * self.quantity
-    
-    # Sauvegarder les données de variation
+        return self.line_total
+
+    def snapshot_prices(self):
+        """Fige boutique, prix unitaire et variations encore vides aux prix actuels ; recalcule le total."""
+        if self.product is not None:
+            self.shop_id = self.shop_id or self.product.shop_id
+            if self.unit_price is None:
+                self.unit_price = self.product.price
+        if self.unit_price is None:
+            self.unit_price = Decimal('0.00')
+        if self.variation_total is None:
+            self.variation_total = self.current_variation_total() if self.pk else Decimal('0.00')
+        self.line_total = (self.unit_price + self.variation_total) * (self.quantity or 0)
+
+    def current_variation_total(self):
+        return self.selected_variations.aggregate(total=models.Sum('price_modifier'))['total'] or Decimal('0.00')
+
+    def refresh_variation_total(self):
+        """Refige variation_total après modification des variations (écrites après la ligne)."""
+        self.variation_total = self.current_variation_total()
+        self.save(update_fields=['variation_total'])
+
     def save(self, *args, **kwargs):
-        if self.pk:  # Si l'instance existe déjà
-            # Sauvegarder les données de variation dans le JSON
-            self.variations_data = {
-                'variations': [
-                    {
-                        'type': v.type,
-                        'value': v.value,
-                        'price_modifier': str(v.price_modifier)
-                    } 
-                    for v in self.selected_variations.all()
-                ]
-            }
+        # Prix unitaire et variations restent figés ; le total suit la quantité
+        self.snapshot_prices()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'line_total'}
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -294,12 +411,45 @@ class Conversation(models.Model):
     merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, related_name='merchant_conversations')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Résumé dénormalisé pour la boîte de réception, tenu à jour à chaque
+    # nouveau message (voir shop/signals.py)
+    PREVIEW_LENGTH = 140
+    last_message_at = models.DateTimeField(default=timezone.now)
+    last_message_preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True, default='')
+    client_unread_count = models.PositiveIntegerField(default=0)
+    merchant_unread_count = models.PositiveIntegerField(default=0)
+
     class Meta:
         unique_together = ('product', 'client') # Un seul chat par client et par produit
+        indexes = [
+            # Boîte de réception triée par activité récente
+            models.Index(fields=['merchant', 'last_message_at', 'id'], name='shop_conv_merchant_recent_idx'),
+            models.Index(fields=['client', 'last_message_at', 'id'], name='shop_conv_client_recent_idx'),
+        ]
 
     def __str__(self):
         return f"Conversation sur {self.product.name} entre {self.client.username} et {self.merchant.user.username}"
 
+    def unread_count_field(self, user):
+        """Nom du compteur de messages non lus de `user` dans cette conversation."""
+        if user.id == self.client_id:
+            return 'client_unread_count'
+        if user.id == self.merchant.user_id:
+            return 'merchant_unread_count'
+        return None
+
+    def unread_count_for(self, user):
+        field = self.unread_count_field(user)
+        return getattr(self, field) if field else 0
+
+    def mark_read(self, user):
+        """Remet à zéro le compteur de `user` (aucune écriture s'il est déjà à zéro)."""
+        field = self.unread_count_field(user)
+        if field is None:
+            return 0
+        setattr(self, field, 0)
+        return Conversation.objects.filter(pk=self.pk, **{f'{field}__gt': 0}).update(**{field: 0})
+
 # Le modèle Message
 class Message(models.Model):
     """
@@ -313,6 +463,14 @@ class Message(models.Model):
     # Champ pour identifier les messages générés par l'IA
     is_ai_response = models.BooleanField(default=False) 
 
+    class Meta:
+        indexes = [
+            # Pagination par curseur de l'historique : (conversation, timestamp, id)
+            models.Index(fields=['conversation', 'timestamp', 'id'], name='shop_msg_conv_ts_id_idx'),
+            # Auteurs des messages récents (tâche check_chat_activity)
+            models.Index(fields=['timestamp', 'sender'], name='shop_msg_ts_sender_idx'),
+        ]
+
     def __str__(self):
         return f"Message de {self.sender.username} dans la conversation {self.conversation.id}"
 
@@ -376,6 +534,10 @@ class MerchantActivity(models.Model):
     current_session_key = models.CharField(max_length=40, blank=True, null=True)
     
     class Meta:
+        indexes = [
+            # Peu de commerçants actifs dans le chat : la tâche ne lit que ceux-là
+            models.Index(fields=['is_active_in_chat'], name='shop_activity_chat_idx'),
+        ]
         verbose_name = "Activité du commerçant"
         verbose_name_plural = "Activités des commerçants"
     
@@ -405,4 +567,94 @@ class MerchantActivity(models.Model):
             activity.last_login = timezone.now()
             
         activity.save()
-        return activity
\ No newline at end of file
+        return activity
+
+# File d'attente persistante des réponses IA (traitée par manage.py run_ai_worker)
+class AIReplyJob(models.Model):
+    """
+    Tâche "réponse IA nécessaire" créée à chaque message client.
+    Le worker la consomme hors du cycle requête/réponse HTTP.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_SKIPPED = 'skipped'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'En attente'),
+        (STATUS_RUNNING, 'En cours'),
+        (STATUS_DONE, 'Terminée'),
+        (STATUS_SKIPPED, 'Ignorée'),
+        (STATUS_FAILED, 'Échouée'),
+    ]
+
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='ai_jobs')
+    trigger_message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='ai_jobs')
+    reply_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)  # Date à partir de laquelle la tâche peut être prise
+    locked_at = models.DateTimeField(null=True, blank=True)  # Date de prise en charge par un worker
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='shop_aijob_status_run_idx'),
+        ]
+        verbose_name = "Tâche de réponse IA"
+        verbose_name_plural = "Tâches de réponse IA"
+
+    def __str__(self):
+        return f"Réponse IA #{self.id} ({self.get_status_display()}) - conversation {self.conversation_id}"
+
+# Bail de leadership : un seul processus exécute les tâches planifiées (voir shop/scheduler.py)
+class SchedulerLease(models.Model):
+    """
+    Bail détenu par le processus qui exécute les tâches planifiées.
+    Renouvelé à chaque exécution ; repris par un autre processus à expiration.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    holder = models.CharField(max_length=255)
+    acquired_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Bail du planificateur"
+        verbose_name_plural = "Baux du planificateur"
+
+    def __str__(self):
+        return f"{self.name} détenu par {self.holder} jusqu'à {self.expires_at}"
+
+# Réservation temporaire de stock pendant le paiement (voir shop/reservations.py)
+class StockReservation(models.Model):
+    """
+    Unités d'un produit retenues pour un panier jusqu'à expires_at.
+    Stock disponible = Product.stock - réservations actives des autres paniers.
+    Les réservations expirées sont ignorées, puis supprimées par lots
+    (tâche expire_stock_reservations).
+    """
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='shop_reservation_cart_product_uniq'),
+        ]
+        indexes = [
+            # Somme des réservations actives d'un produit, lue dans l'index seul
+            models.Index(fields=['product', 'expires_at', 'quantity'], name='shop_reservation_active_idx'),
+            # Purge des réservations expirées
+            models.Index(fields=['expires_at', 'id'], name='shop_reservation_expiry_idx'),
+        ]
+        verbose_name = "Réservation de stock"
+        verbose_name_plural = "Réservations de stock"
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} pour le panier {self.cart_id} jusqu'à {self.expires_at}"
@@ -0,0 +1,51 @@
+# Fichier : shop/order_prices.py
+"""
+Remise en état des prix figés des lignes de commande.
+
+Les lignes passées par la caisse (bulk_create) ou par OrderItem.save() sont
+figées à l'écriture ; celles chargées autrement (loaddata, import SQL, ancien
+dump) peuvent arriver sans boutique ou avec un total incohérent. Ce module
+est partagé par la migration 0027 et la commande backfill_order_prices :
+il ne dépend que du registre d'applications reçu (historique ou courant).
+"""
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def expected_line_total():
+    return (F('unit_price') + F('variation_total')) * Coalesce('quantity', 0)
+
+
+def unpriced_order_items(apps):
+    """Lignes sans prix, sans boutique (produit encore présent) ou dont le total ne correspond pas."""
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    return OrderItem.objects.alias(expected=expected_line_total()).filter(
+        Q(unit_price__isnull=True) | Q(variation_total__isnull=True) | Q(line_total__isnull=True)
+        | Q(shop__isnull=True, product__isnull=False) | ~Q(line_total=F('expected'))
+    )
+
+
+def price_order_items(apps, items):
+    """
+    Complète boutique, prix unitaire et variations manquants aux prix actuels
+    (les prix déjà figés sont conservés), puis recalcule line_total.
+    Retourne le nombre de lignes mises à jour.
+    """
+    OrderItemVariation = apps.get_model('shop', 'OrderItemVariation')
+    Product = apps.get_model('shop', 'Product')
+    product = Product.objects.filter(pk=OuterRef('product'))
+    modifiers = OrderItemVariation.objects.filter(order_item=OuterRef('pk')).order_by().values('order_item')
+    zero = Value(Decimal('0.00'))
+    items.update(
+        shop=Coalesce(F('shop'), Subquery(product.values('shop'))),
+        unit_price=Coalesce(F('unit_price'), Subquery(product.values('price')), zero),
+        variation_total=Coalesce(
+            F('variation_total'),
+            Subquery(modifiers.annotate(total=Sum('variation__price_modifier')).values('total')), zero,
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        ),
+    )
+    return items.update(line_total=expected_line_total())
@@ -0,0 +1,134 @@
+# Fichier : shop/page_cache.py
+"""
+Cache des pages du catalogue (listes de produits, page d'une boutique).
+
+Pour un visiteur anonyme, la page rendue est mise en cache sous une clé qui
+contient la vue, ses paramètres d'URL, les paramètres GET normalisés et les
+versions (cache_utils) des espaces de noms dont elle dépend. Les signaux
+n'incrémentent que les espaces touchés : modifier un HeroSlide n'invalide
+pas les pages des boutiques, un produit n'invalide que le catalogue et sa
+boutique. Une page trouvée en cache est servie sans requête SQL.
+
+Les listes partagées (slides, catégories) sont aussi mises en cache par
+version, pour les utilisateurs connectés dont les pages ne sont pas mises
+en cache.
+
+Pages, listes et versions vivent dans le cache partagé (CACHES['shared']) :
+une page rendue par un processus sert tous les autres, et une invalidation
+faite par l'un est vue par tous.
+"""
+import hashlib
+import logging
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from .cache_utils import get_version, get_versions, shared_cache
+
+logger = logging.getLogger(__name__)
+
+PRODUCTS = 'catalog:products'
+CATEGORIES = 'catalog:categories'
+HERO = 'catalog:hero'
+SHOPS = 'catalog:shops'
+
+
+def shop_namespace(shop_id):
+    return f"catalog:shop:{shop_id}"
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def normalized_params(request):
+    """Paramètres GET triés, sans valeurs vides : ?b=2&a=1&c= et ?a=1&b=2 partagent une entrée."""
+    return urlencode(sorted(
+        (name, value) for name, values in request.GET.lists() for value in values if value != ''
+    ))
+
+
+def is_anonymous(request):
+    """
+    Sans cookie de session, le visiteur est anonyme sans lire la session.
+    Avec un cookie, on vérifie (une lecture de session avec le profil 'db').
+    """
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return True
+    return not request.user.is_authenticated
+
+
+def _page_key(view_name, args, kwargs, request, versions):
+    raw = repr((args, sorted(kwargs.items()), normalized_params(request), sorted(versions.items())))
+    return f"catalog_page:{view_name}:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def cached_catalog_page(namespaces):
+    """
+    Met en cache la page rendue pour les visiteurs anonymes.
+    `namespaces(request, *args, **kwargs)` retourne les espaces de noms dont
+    dépend la page, ou None s'ils ne sont pas encore connus : la vue est alors
+    exécutée, puis la fonction rappelée (None à nouveau : page non mise en cache).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or 'messages' in request.COOKIES or not is_anonymous(request):
+                return view(request, *args, **kwargs)
+            names = namespaces(request, *args, **kwargs)
+            if names is not None:
+                versions = get_versions(names)
+                content = shared_cache().get(_page_key(view.__name__, args, kwargs, request, versions))
+                if content is not None:
+                    return HttpResponse(content)
+            response = view(request, *args, **kwargs)
+            if names is None:
+                # Espaces de noms connus seulement après la vue (ex. slug de boutique résolu)
+                names = namespaces(request, *args, **kwargs)
+                if names is None:
+                    return response
+                versions = get_versions(names)
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                key = _page_key(view.__name__, args, kwargs, request, versions)
+                shared_cache().set(key, response.content, _setting('CATALOG_PAGE_CACHE_TIMEOUT', 60))
+            return response
+        return wrapper
+    return decorator
+
+
+def catalog_namespaces(request, *args, **kwargs):
+    return [PRODUCTS, CATEGORIES, HERO, SHOPS]
+
+
+def _shop_slug_key(shop_slug):
+    return f"catalog:shop_slug:{shop_slug}"
+
+
+def remember_shop_slug(shop_slug, shop_id):
+    """Associe un slug de boutique à son id, pour trouver la page en cache sans requête."""
+    shared_cache().set(_shop_slug_key(shop_slug), shop_id, _setting('CATALOG_PAGE_CACHE_TIMEOUT', 60))
+
+
+def forget_shop_slug(shop_slug):
+    """Slug introuvable ou boutique privée : la page ne doit plus être servie depuis le cache."""
+    shared_cache().delete(_shop_slug_key(shop_slug))
+
+
+def shop_page_namespaces(request, shop_slug):
+    shop_id = shared_cache().get(_shop_slug_key(shop_slug))
+    if shop_id is None:
+        # Slug pas encore résolu : la vue le résout et l'enregistre (ou l'oublie)
+        return None
+    return [shop_namespace(shop_id), CATEGORIES]
+
+
+def cached_list(namespace, name, loader):
+    """Liste partagée (slides, catégories) mise en cache sous la version de `namespace`."""
+    key = f"{namespace}:{name}:v{get_version(namespace)}"
+    items = shared_cache().get(key)
+    if items is None:
+        items = list(loader())
+        shared_cache().set(key, items, _setting('CATALOG_CACHE_TIMEOUT', 3600))
+    return items
@@ -0,0 +1,175 @@
+# Fichier : shop/pagination.py
+"""
+Pagination par curseur (keyset) : la page suivante est sélectionnée par un
+WHERE sur les valeurs de tri du dernier élément vu, au lieu d'un OFFSET.
+Le coût d'une page ne dépend donc pas de sa profondeur, à condition qu'un
+index couvre les colonnes de tri.
+"""
+import base64
+import json
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    """Encode des valeurs de tri en un curseur opaque pour les URL."""
+    raw = json.dumps([str(v) if v is not None else None for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, ordering, annotations=None):
+    """
+    Décode un curseur et convertit chaque valeur dans le type de son champ
+    (ou de l'annotation du même nom, ex. search_rank).
+    """
+    annotations = annotations or {}
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise InvalidCursor(cursor)
+        return [
+            None if value is None else (
+                annotations[name].output_field if name in annotations else _get_field(model, name)
+            ).to_python(value)
+            for name, value in zip(_field_names(ordering), values)
+        ]
+    except InvalidCursor:
+        raise
+    except Exception as e:
+        raise InvalidCursor(cursor) from e
+
+
+def _field_names(ordering):
+    return [name.lstrip('-') for name in ordering]
+
+
+def _reverse_ordering(ordering):
+    return [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+
+
+def _get_field(model, path):
+    """Résout un chemin 'relation__champ' vers le champ final."""
+    parts = path.split('__')
+    for part in parts[:-1]:
+        model = model._meta.get_field(part).related_model
+    field = model._meta.get_field(parts[-1])
+    if field.is_relation:
+        field = field.target_field
+    return field
+
+
+def _value_of(obj, path):
+    value = obj
+    for part in path.split('__'):
+        value = getattr(value, part, None)
+        if value is None:
+            return None
+    return value
+
+
+def keyset_filter(ordering, values):
+    """
+    Condition "strictement après (values)" dans l'ordre donné, par exemple
+    pour ('-timestamp', '-id') : timestamp <= t ET (timestamp < t OU
+    (timestamp = t ET id < i)). La borne redondante sur la première colonne
+    permet au moteur de parcourir l'index par intervalle.
+    """
+    condition = Q()
+    equal_prefix = Q()
+    for name, value in zip(ordering, values):
+        field = name.lstrip('-')
+        lookup = 'lt' if name.startswith('-') else 'gt'
+        condition |= equal_prefix & Q(**{f'{field}__{lookup}': value})
+        equal_prefix &= Q(**{field: value})
+    first = ordering[0]
+    if len(ordering) > 1 and values[0] is not None:
+        bound = 'lte' if first.startswith('-') else 'gte'
+        condition = Q(**{f'{first.lstrip("-")}__{bound}': values[0]}) & condition
+    return condition
+
+
+class KeysetPage:
+    def __init__(self, items, has_next, next_cursor, cursor=None, has_previous=False, previous_cursor=None):
+        self.object_list = items
+        self.has_next = has_next
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+        self.has_previous = has_previous
+        self.previous_cursor = previous_cursor
+        # Renseignés par capped_count() si la vue affiche un total
+        self.count = None
+        self.count_capped = False
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def keyset_paginate(queryset, ordering, cursor=None, per_page=20, backwards=False):
+    """
+    Retourne la page qui suit `cursor` pour le tri `ordering` (celle qui le
+    précède si `backwards` ; sans curseur, la dernière page).
+    Le dernier champ de tri doit être unique (typiquement 'id' ou '-id').
+    """
+    fetch_ordering = _reverse_ordering(ordering) if backwards else list(ordering)
+    queryset = queryset.order_by(*fetch_ordering)
+    if cursor:
+        values = decode_cursor(cursor, queryset.model, ordering, queryset.query.annotations)
+        queryset = queryset.filter(keyset_filter(fetch_ordering, values))
+    items = list(queryset[:per_page + 1])
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if backwards:
+        items.reverse()
+
+    def cursor_of(obj):
+        return encode_cursor([_value_of(obj, name) for name in _field_names(ordering)])
+
+    if backwards:
+        has_next, has_previous = bool(cursor) and bool(items), has_more
+    else:
+        has_next, has_previous = has_more, bool(cursor) and bool(items)
+    return KeysetPage(
+        items,
+        has_next,
+        cursor_of(items[-1]) if has_next else None,
+        cursor,
+        has_previous,
+        cursor_of(items[0]) if has_previous else None,
+    )
+
+
+def paginate_request(request, queryset, ordering, per_page=20):
+    """
+    Page désignée par les paramètres GET : ?after=<curseur>, ?before=<curseur>
+    ou ?last=1. Un curseur invalide (tri modifié, URL tronquée) ramène à la
+    première page, comme Paginator.get_page() pour un numéro invalide.
+    """
+    after, before = request.GET.get('after'), request.GET.get('before')
+    try:
+        if before or request.GET.get('last'):
+            return keyset_paginate(queryset, ordering, before, per_page, backwards=True)
+        return keyset_paginate(queryset, ordering, after, per_page)
+    except InvalidCursor:
+        return keyset_paginate(queryset, ordering, None, per_page)
+
+
+def capped_count(queryset, cap):
+    """
+    Nombre de lignes plafonné : (nombre, plafonné). Le COUNT porte sur une
+    sous-requête limitée à cap + 1 lignes, son coût ne dépend donc pas de la
+    taille du catalogue.
+    """
+    count = queryset.order_by().values('pk')[:cap + 1].count()
+    return min(count, cap), count > cap
@@ -0,0 +1,259 @@
+# Fichier : shop/presence.py
+"""
+Présence des commerçants : lue depuis le cache, écrite en base par lots.
+
+Le middleware appelle presence_tracker.record() à chaque requête, mais un
+battement n'est pris en compte que si le précédent a plus de
+PRESENCE_WRITE_GRANULARITY secondes. Il met alors à jour presence_store
+(cache partagé entre les processus, lu par les API de statut et par l'IA)
+et rejoint le lot en attente, écrit dans MerchantActivity par flush() : un
+seul UPDATE pour tous les commerçants concernés, déclenché en fin de
+requête dès que PRESENCE_FLUSH_INTERVAL est écoulé. La base n'est relue
+qu'en cas d'absence du cache.
+"""
+import atexit
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .cache_utils import shared_cache
+from .models import MerchantActivity
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class Presence:
+    """
+    Instantané de présence d'un commerçant. Expose les mêmes attributs que
+    MerchantActivity, utilisables par services.get_status_from_activity().
+    """
+
+    def __init__(self, merchant_id, last_seen, last_login=None, is_active_in_chat=False):
+        self.merchant_id = merchant_id
+        self.last_seen = last_seen
+        self.last_login = last_login
+        self.is_active_in_chat = is_active_in_chat
+
+    @property
+    def minutes_since_last_seen(self):
+        return (timezone.now() - self.last_seen).total_seconds() / 60
+
+    @property
+    def is_online(self):
+        # Même seuil que la tâche update_merchant_online_status
+        return self.minutes_since_last_seen < _setting('PRESENCE_OFFLINE_AFTER', 300) / 60
+
+
+class PresenceStore:
+    """Derniers battements des commerçants, conservés dans le cache partagé."""
+
+    CHAT_ACTIVE_KEY = 'presence:chat_active'
+    # Valeur mise en cache pour un commerçant sans activité connue
+    UNKNOWN = {'last_seen': None, 'last_login': None}
+
+    @staticmethod
+    def _key(merchant_id):
+        return f"presence:{merchant_id}"
+
+    @property
+    def timeout(self):
+        return _setting('PRESENCE_CACHE_TIMEOUT', 24 * 3600)
+
+    def touch(self, merchant_id, seen_at):
+        """Enregistre un battement ; un retour après une absence ouvre une nouvelle session."""
+        entry = shared_cache().get(self._key(merchant_id))
+        last_login = entry['last_login'] if entry else None
+        offline_after = timedelta(seconds=_setting('PRESENCE_OFFLINE_AFTER', 300))
+        if not entry or not entry['last_seen'] or seen_at - entry['last_seen'] >= offline_after:
+            last_login = seen_at
+        shared_cache().set(self._key(merchant_id), {'last_seen': seen_at, 'last_login': last_login}, self.timeout)
+
+    def get(self, merchant_id):
+        """Présence d'un commerçant (None si jamais vu)."""
+        return self.get_many([merchant_id])[merchant_id]
+
+    def get_many(self, merchant_ids):
+        """Présences de plusieurs commerçants : un appel au cache, une requête au plus pour les absents."""
+        merchant_ids = list(dict.fromkeys(merchant_ids))
+        keys = {self._key(merchant_id): merchant_id for merchant_id in merchant_ids}
+        entries = {keys[key]: entry for key, entry in shared_cache().get_many(list(keys)).items()}
+
+        missing = [merchant_id for merchant_id in merchant_ids if merchant_id not in entries]
+        if missing:
+            loaded = {merchant_id: dict(self.UNKNOWN) for merchant_id in missing}
+            rows = MerchantActivity.objects.filter(merchant_id__in=missing).values_list(
+                'merchant_id', 'last_seen', 'last_login'
+            )
+            for merchant_id, last_seen, last_login in rows:
+                loaded[merchant_id] = {'last_seen': last_seen, 'last_login': last_login}
+            shared_cache().set_many(
+                {self._key(merchant_id): entry for merchant_id, entry in loaded.items()}, self.timeout
+            )
+            entries.update(loaded)
+
+        chat_active = self.chat_active_merchants()
+        presences = {}
+        for merchant_id in merchant_ids:
+            entry = entries[merchant_id]
+            presences[merchant_id] = None
+            if entry['last_seen']:
+                presences[merchant_id] = Presence(
+                    merchant_id, entry['last_seen'], entry['last_login'], merchant_id in chat_active
+                )
+        return presences
+
+    def chat_active_merchants(self):
+        """Commerçants actifs dans le chat, tels que calculés par check_chat_activity."""
+        chat_active = shared_cache().get(self.CHAT_ACTIVE_KEY)
+        if chat_active is None:
+            chat_active = self.set_chat_active_merchants(
+                MerchantActivity.objects.filter(is_active_in_chat=True).values_list('merchant_id', flat=True)
+            )
+        return chat_active
+
+    def set_chat_active_merchants(self, merchant_ids):
+        chat_active = frozenset(merchant_ids)
+        shared_cache().set(self.CHAT_ACTIVE_KEY, chat_active, self.timeout)
+        return chat_active
+
+    def forget(self, merchant_id):
+        shared_cache().delete(self._key(merchant_id))
+
+
+presence_store = PresenceStore()
+
+
+class PresenceTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # merchant_id -> (vu à, clé de session) en attente d'écriture
+        self._pending = {}
+        # merchant_id -> (dernier last_seen écrit, clé de session écrite)
+        self._written = {}
+        self._last_flush = None
+
+    @property
+    def granularity(self):
+        return _setting('PRESENCE_WRITE_GRANULARITY', 30)
+
+    @property
+    def flush_interval(self):
+        return _setting('PRESENCE_FLUSH_INTERVAL', 30)
+
+    def record(self, merchant_id, session_key=None, now=None):
+        """
+        Note un battement de présence. Retourne True s'il devra être écrit.
+        Écrit le lot en attente si le dernier flush est assez ancien.
+        """
+        now = now or timezone.now()
+        with self._lock:
+            written = self._written.get(merchant_id)
+            recorded = (
+                written is None
+                or (now - written[0]).total_seconds() >= self.granularity
+                or session_key not in (None, written[1])
+            )
+            if recorded:
+                self._pending[merchant_id] = (now, session_key)
+                self._written[merchant_id] = (now, session_key or (written[1] if written else None))
+            flush_due = self._flush_due(now)
+        if recorded:
+            presence_store.touch(merchant_id, now)
+        if flush_due:
+            self.flush(now)
+        return recorded
+
+    def _flush_due(self, now):
+        return bool(self._pending) and (
+            self._last_flush is None
+            or (now - self._last_flush).total_seconds() >= self.flush_interval
+        )
+
+    def flush_if_due(self, now=None):
+        """
+        Écrit le lot en attente si le dernier flush a plus de flush_interval
+        secondes. Appelé à la fin de chaque requête (middleware) : les
+        battements ne restent pas en mémoire jusqu'au prochain record().
+        """
+        now = now or timezone.now()
+        with self._lock:
+            flush_due = self._flush_due(now)
+        return self.flush(now) if flush_due else 0
+
+    def flush(self, now=None):
+        """Écrit les battements en attente. Retourne le nombre de commerçants écrits."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = now or timezone.now()
+        if not pending:
+            return 0
+        try:
+            self._write(pending)
+        except Exception as e:
+            logger.error(f"❌ Erreur écriture de la présence ({len(pending)} commerçants) : {e}")
+            with self._lock:
+                # Rejoué au prochain flush, sans écraser un battement plus récent
+                for merchant_id, heartbeat in pending.items():
+                    self._pending.setdefault(merchant_id, heartbeat)
+            return 0
+        return len(pending)
+
+    def _write(self, pending):
+        merchant_ids = list(pending)
+        last_seen = Case(
+            *[When(merchant_id=merchant_id, then=Value(seen_at)) for merchant_id, (seen_at, _) in pending.items()],
+            default=F('last_seen')
+        )
+        session_whens = [
+            When(merchant_id=merchant_id, then=Value(session_key))
+            for merchant_id, (_, session_key) in pending.items()
+            if session_key
+        ]
+        updates = {
+            'last_seen': last_seen,
+            # Un commerçant qui revient en ligne ouvre une nouvelle session
+            'last_login': Case(When(is_online=False, then=last_seen), default=F('last_login')),
+            'is_online': Value(True),
+        }
+        if session_whens:
+            updates['current_session_key'] = Case(*session_whens, default=F('current_session_key'))
+
+        updated = MerchantActivity.objects.filter(merchant_id__in=merchant_ids).update(**updates)
+        if updated < len(merchant_ids):
+            # Premiers battements : création des activités manquantes
+            existing = set(
+                MerchantActivity.objects.filter(merchant_id__in=merchant_ids).values_list('merchant_id', flat=True)
+            )
+            MerchantActivity.objects.bulk_create(
+                [
+                    MerchantActivity(
+                        merchant_id=merchant_id,
+                        last_seen=seen_at,
+                        last_login=seen_at,
+                        is_online=True,
+                        current_session_key=session_key,
+                    )
+                    for merchant_id, (seen_at, session_key) in pending.items()
+                    if merchant_id not in existing
+                ],
+                ignore_conflicts=True
+            )
+        logger.debug(f"🔄 Présence écrite pour {len(merchant_ids)} commerçant(s)")
+
+    def reset(self):
+        with self._lock:
+            self._pending.clear()
+            self._written.clear()
+            self._last_flush = None
+
+
+presence_tracker = PresenceTracker()
+atexit.register(presence_tracker.flush)
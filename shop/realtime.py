@@ -0,0 +1,135 @@
+# Fichier : shop/realtime.py
+"""
+Publication/abonnement pour les mises à jour de chat en direct (flux SSE).
+
+Le broker par défaut vit dans le processus ASGI : les messages créés par ce
+processus sont poussés immédiatement. Pour les messages créés ailleurs
+(worker IA, autres processus web), publish_message() incrémente aussi un
+numéro de séquence par conversation dans le cache partagé : chaque flux le
+lit toutes les CHAT_STREAM_SIGNAL_INTERVAL secondes (une lecture de cache,
+pas de requête SQL) et ne relit la base que s'il a changé. La relecture
+périodique de la base (CHAT_STREAM_POLL_INTERVAL) ne sert plus que de filet
+de sécurité, si le cache partagé a perdu la clé.
+"""
+import asyncio
+import logging
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .cache_utils import shared_cache
+
+logger = logging.getLogger(__name__)
+
+
+def conversation_channel(conversation_id):
+    return f"conversation:{conversation_id}"
+
+
+def _sequence_key(channel):
+    return f"realtime:sequence:{channel}"
+
+
+def bump_sequence(channel):
+    """Signale un nouvel événement sur `channel` à tous les processus."""
+    cache = shared_cache()
+    try:
+        return cache.incr(_sequence_key(channel))
+    except ValueError:
+        cache.add(_sequence_key(channel), 0, timeout=None)
+        return cache.incr(_sequence_key(channel))
+
+
+async def channel_sequence(channel):
+    """Dernier numéro de séquence de `channel` (None si jamais publié)."""
+    return await shared_cache().aget(_sequence_key(channel))
+
+
+class Subscription:
+    """Abonnement d'un flux à un canal : une file asyncio liée à sa boucle."""
+
+    def __init__(self, channel, loop):
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=100)
+
+    def deliver(self, payload):
+        # Appelé dans la boucle de l'abonné
+        if self.queue.full():
+            # L'abonné est en retard : il relira de toute façon la base
+            return
+        self.queue.put_nowait(payload)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class BaseBroker:
+    """Interface des brokers : publish() est appelable depuis n'importe quel thread."""
+
+    def subscribe(self, channel):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def publish(self, channel, payload):
+        raise NotImplementedError
+
+
+class InProcessBroker(BaseBroker):
+    """Broker en mémoire, limité au processus courant."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self, channel):
+        subscription = Subscription(channel, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[subscription.channel]
+
+    def publish(self, channel, payload):
+        with self._lock:
+            subscribers = list(self._subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, payload)
+            except RuntimeError:
+                # Boucle fermée : l'abonnement sera retiré par son flux
+                pass
+        return len(subscribers)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = getattr(settings, 'CHAT_BROKER_BACKEND', 'shop.realtime.InProcessBroker')
+                _broker = import_string(backend)()
+    return _broker
+
+
+def publish_message(message):
+    """Signale un nouveau message aux flux abonnés à sa conversation, dans tous les processus."""
+    channel = conversation_channel(message.conversation_id)
+    try:
+        bump_sequence(channel)
+        get_broker().publish(channel, {'id': message.id, 'conversation_id': message.conversation_id})
+    except Exception as e:
+        logger.error(f"Erreur publication du message {message.id}: {e}")
@@ -0,0 +1,170 @@
+# Fichier : shop/reservations.py
+"""
+Réservations temporaires de stock.
+
+L'ouverture de la page de paiement retient les unités du panier pendant
+STOCK_RESERVATION_TTL secondes : deux acheteurs ne peuvent plus atteindre
+le paiement pour la dernière unité. Le stock disponible d'un produit est
+Product.stock moins les réservations actives des autres paniers ; une
+réservation expirée n'est plus comptée, même avant d'être purgée.
+Recharger la page de paiement ne prolonge pas la réservation : tant que le
+panier n'a pas changé, l'échéance d'origine est conservée.
+
+Seules les lignes des produits du panier sont verrouillées (SELECT ... FOR
+UPDATE, dans l'ordre des identifiants) : une vente flash sur un produit ne
+bloque pas les autres.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, StockReservation
+from .tasks import record_task_run
+
+logger = logging.getLogger(__name__)
+
+
+class OutOfStock(Exception):
+    """Stock disponible insuffisant pour au moins un produit du panier."""
+
+    def __init__(self, products):
+        self.products = products  # [(nom, stock disponible, quantité demandée)]
+        super().__init__(', '.join(f"{name} ({available}/{requested})" for name, available, requested in products))
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def cart_quantities(cart):
+    """Quantité demandée par produit, toutes lignes du panier confondues."""
+    return dict(
+        cart.items.values('product_id').annotate(total=Sum('quantity')).order_by()
+        .values_list('product_id', 'total')
+    )
+
+
+def lock_products(product_ids):
+    """Verrouille les produits (ordre des identifiants) : {pk: (nom, stock, boutique, prix)}."""
+    return {
+        pk: (name, stock, shop_id, price) for pk, name, stock, shop_id, price in
+        Product.objects.select_for_update().filter(pk__in=list(product_ids)).order_by('pk')
+        .values_list('pk', 'name', 'stock', 'shop_id', 'price')
+    }
+
+
+def active_reservations(now=None):
+    return StockReservation.objects.filter(expires_at__gt=now or timezone.now())
+
+
+def held_quantities(product_ids, exclude_cart=None, now=None):
+    """Unités retenues par les réservations actives, par produit (index shop_reservation_active_idx)."""
+    reservations = active_reservations(now).filter(product_id__in=list(product_ids))
+    if exclude_cart is not None:
+        reservations = reservations.exclude(cart=exclude_cart)
+    return dict(
+        reservations.values('product_id').annotate(held=Sum('quantity')).order_by()
+        .values_list('product_id', 'held')
+    )
+
+
+def with_available_stock(queryset, now=None, exclude_cart=None):
+    """Annote available_stock = stock - réservations actives (hors celles de `exclude_cart`)."""
+    held = active_reservations(now).filter(product=OuterRef('pk'))
+    if exclude_cart is not None:
+        held = held.exclude(cart=exclude_cart)
+    held = held.values('product').annotate(held=Sum('quantity')).values('held')
+    return queryset.annotate(available_stock=F('stock') - Coalesce(Subquery(held), 0))
+
+
+def check_available(cart, quantities, products, now=None):
+    """Lève OutOfStock si un produit n'a pas assez d'unités hors réservations des autres paniers."""
+    held = held_quantities(quantities, exclude_cart=cart, now=now)
+    missing = []
+    for pk, quantity in quantities.items():
+        name, stock = products[pk][:2]
+        available = stock - held.get(pk, 0)
+        if available < quantity:
+            missing.append((name, max(available, 0), quantity))
+    if missing:
+        raise OutOfStock(missing)
+
+
+def current_hold(cart, quantities, now=None):
+    """Échéance de la réservation active du panier si elle couvre exactement `quantities`, sinon None."""
+    held = list(active_reservations(now).filter(cart=cart).values_list('product_id', 'quantity', 'expires_at'))
+    if held and {product_id: quantity for product_id, quantity, _ in held} == quantities:
+        return min(expires_at for _, _, expires_at in held)
+    return None
+
+
+@transaction.atomic
+def hold_cart(cart, ttl=None, now=None):
+    """
+    Réserve le contenu du panier (remplace ses réservations précédentes).
+    Une réservation encore active pour le même contenu est conservée telle
+    quelle : recharger le paiement ne la prolonge pas.
+    Retourne la date d'expiration, None si le panier est vide ; lève OutOfStock.
+    """
+    now = now or timezone.now()
+    ttl = ttl or _setting('STOCK_RESERVATION_TTL', 15 * 60)
+    quantities = cart_quantities(cart)
+    if not quantities:
+        release_cart(cart)
+        return None
+    expires_at = current_hold(cart, quantities, now=now)
+    if expires_at is not None:
+        return expires_at
+    check_available(cart, quantities, lock_products(quantities), now=now)
+
+    expires_at = now + timedelta(seconds=ttl)
+    release_cart(cart)
+    StockReservation.objects.bulk_create([
+        StockReservation(cart=cart, product_id=product_id, quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in quantities.items()
+    ])
+    return expires_at
+
+
+def release_cart(cart):
+    """Libère les réservations du panier (commande passée ou panier vidé)."""
+    return StockReservation.objects.filter(cart=cart).delete()[0]
+
+
+def expire_reservations(batch_size=None, time_budget=None, now=None):
+    """
+    Supprime les réservations expirées par lots bornés, triés par
+    (expires_at, id), comme purge_expired_sessions : chaque lot est une
+    transaction courte. Retourne le nombre de réservations supprimées.
+    """
+    batch_size = batch_size or _setting('STOCK_RESERVATION_PURGE_BATCH_SIZE', 1000)
+    time_budget = time_budget if time_budget is not None else _setting('STOCK_RESERVATION_PURGE_TIME_BUDGET', 5)
+    now = now or timezone.now()
+    started = time.perf_counter()
+    expired = batches = 0
+    complete = False
+    try:
+        while time.perf_counter() - started < time_budget:
+            ids = list(
+                StockReservation.objects.filter(expires_at__lte=now)
+                .order_by('expires_at', 'id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if ids:
+                # Une réservation renouvelée entre-temps n'est pas supprimée
+                expired += StockReservation.objects.filter(pk__in=ids, expires_at__lte=now).delete()[0]
+                batches += 1
+            if len(ids) < batch_size:
+                complete = True
+                break
+    except Exception as e:
+        logger.error(f"Erreur dans expire_reservations: {e}")
+
+    record_task_run('expire_stock_reservations', started, expired=expired, batches=batches, complete=complete)
+    return expired
@@ -0,0 +1,154 @@
+# Fichier : shop/scheduler.py
+"""
+Tâches planifiées et élection d'un leader.
+
+Chaque processus web peut démarrer un planificateur (SCHEDULER_AUTOSTART),
+mais une tâche n'est exécutée que par le processus qui détient le bail
+SCHEDULER_LEASE_NAME en base : la charge planifiée reste la même quel que
+soit le nombre de workers. En production, on désactive SCHEDULER_AUTOSTART
+et on lance un processus dédié : python manage.py runscheduler (historique
+des exécutions enregistré par django_apscheduler).
+"""
+import logging
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+from apscheduler.triggers.interval import IntervalTrigger
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django_apscheduler.util import close_old_connections
+
+from .models import SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+# Tâches exécutées par le leader : identifiant, libellé, fonction, intervalle
+SCHEDULED_JOBS = [
+    {
+        'id': 'update_merchant_status',
+        'name': 'Mise à jour statut commerçants',
+        'func': 'shop.tasks.update_merchant_online_status',
+        'trigger': {'seconds': 30},
+    },
+    {
+        'id': 'check_chat_activity',
+        'name': 'Vérification activité chat',
+        'func': 'shop.tasks.check_chat_activity',
+        'trigger': {'minutes': 1},
+    },
+    {
+        'id': 'purge_expired_sessions',
+        'name': 'Purge des sessions expirées',
+        'func': 'shop.tasks.purge_expired_sessions',
+        'trigger': {'minutes': 15},
+    },
+    {
+        'id': 'expire_stock_reservations',
+        'name': 'Purge des réservations de stock expirées',
+        'func': 'shop.reservations.expire_reservations',
+        'trigger': {'minutes': 5},
+    },
+    {
+        'id': 'delete_old_job_executions',
+        'name': 'Purge de l\'historique des exécutions',
+        'func': 'shop.scheduler.delete_old_job_executions',
+        'trigger': {'days': 1},
+    },
+]
+
+_holder_id = None
+_holder_pid = None
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def get_holder_id():
+    """Identifiant de ce processus (recalculé après un fork, ex. workers uWSGI)."""
+    global _holder_id, _holder_pid
+    pid = os.getpid()
+    if _holder_pid != pid:
+        _holder_id = f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}"
+        _holder_pid = pid
+    return _holder_id
+
+
+def acquire_lease(name=None, holder=None, ttl=None, now=None):
+    """
+    Prend ou renouvelle le bail. Retourne True si ce processus est leader.
+    Un seul UPDATE conditionnel : réussit si le bail nous appartient déjà
+    ou s'il a expiré.
+    """
+    name = name or _setting('SCHEDULER_LEASE_NAME', 'shop-scheduler')
+    holder = holder or get_holder_id()
+    ttl = ttl or _setting('SCHEDULER_LEASE_TTL', 90)
+    now = now or timezone.now()
+    expires_at = now + timedelta(seconds=ttl)
+
+    taken = SchedulerLease.objects.filter(
+        Q(holder=holder) | Q(expires_at__lte=now),
+        name=name,
+    ).update(
+        acquired_at=Case(When(holder=holder, then=F('acquired_at')), default=Value(now)),
+        holder=holder,
+        expires_at=expires_at,
+    )
+    if taken:
+        return True
+    try:
+        with transaction.atomic():
+            SchedulerLease.objects.create(name=name, holder=holder, acquired_at=now, expires_at=expires_at)
+    except IntegrityError:
+        # Bail détenu par un autre processus
+        return False
+    logger.info(f"👑 Bail {name} pris par {holder}")
+    return True
+
+
+def release_lease(name=None, holder=None):
+    """Libère le bail (arrêt du processus) pour qu'un autre le reprenne sans attendre."""
+    name = name or _setting('SCHEDULER_LEASE_NAME', 'shop-scheduler')
+    holder = holder or get_holder_id()
+    try:
+        return SchedulerLease.objects.filter(name=name, holder=holder).update(expires_at=timezone.now())
+    except Exception as e:
+        logger.error(f"❌ Erreur libération du bail {name}: {e}")
+        return 0
+
+
+@close_old_connections
+def run_as_leader(func_path):
+    """Exécute une tâche planifiée si ce processus détient le bail."""
+    if not acquire_lease():
+        logger.debug(f"⏭️ {func_path} ignorée : un autre processus est leader")
+        return False
+    import_string(func_path)()
+    return True
+
+
+def delete_old_job_executions(max_age=None):
+    """Supprime l'historique django_apscheduler plus ancien que SCHEDULER_EXECUTION_MAX_AGE."""
+    from django_apscheduler.models import DjangoJobExecution
+    max_age = max_age or _setting('SCHEDULER_EXECUTION_MAX_AGE', 7 * 24 * 3600)
+    DjangoJobExecution.objects.delete_old_job_executions(max_age)
+
+
+def add_scheduled_jobs(scheduler):
+    """Ajoute les tâches planifiées au planificateur, chacune protégée par le bail."""
+    for job in SCHEDULED_JOBS:
+        scheduler.add_job(
+            run_as_leader,
+            trigger=IntervalTrigger(**job['trigger']),
+            args=[job['func']],
+            id=job['id'],
+            name=job['name'],
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
@@ -0,0 +1,248 @@
+# Fichier : shop/search.py
+"""
+Recherche plein texte des produits, classée par pertinence.
+
+L'index vit à côté de la table des produits :
+  - SQLite     : table virtuelle FTS5 shop_product_fts (rowid = id du produit)
+  - PostgreSQL : table shop_product_search (tsvector + index GIN)
+Il est créé par la migration 0020, tenu à jour par les signaux de Product
+(shop/signals.py) et reconstruit par manage.py rebuild_search_index.
+Sur un autre moteur, ou si l'index est absent, on revient au filtre
+icontains historique.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import IntegerField, Q
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+SQLITE_TABLE = 'shop_product_fts'
+POSTGRES_TABLE = 'shop_product_search'
+POSTGRES_CONFIG = 'french'
+
+# Pondération : un mot du nom compte plus qu'un mot de la description
+SQLITE_CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} "
+    f"USING fts5(name, description, tokenize='unicode61 remove_diacritics 2')"
+)
+POSTGRES_CREATE_SQL = [
+    f"CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} ("
+    f"product_id bigint PRIMARY KEY REFERENCES shop_product(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    f"document tsvector NOT NULL)",
+    f"CREATE INDEX IF NOT EXISTS {POSTGRES_TABLE}_document_idx ON {POSTGRES_TABLE} USING GIN (document)",
+]
+POSTGRES_DOCUMENT_SQL = (
+    f"setweight(to_tsvector('{POSTGRES_CONFIG}', %s), 'A') || "
+    f"setweight(to_tsvector('{POSTGRES_CONFIG}', %s), 'B')"
+)
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_available = {}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def search_backend(using=DEFAULT_DB_ALIAS):
+    """'sqlite', 'postgresql' ou None (index indisponible : filtre icontains)."""
+    connection = connections[using]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return None
+    if using not in _available:
+        table = SQLITE_TABLE if connection.vendor == 'sqlite' else POSTGRES_TABLE
+        with connection.cursor() as cursor:
+            _available[using] = table in connection.introspection.table_names(cursor)
+    return connection.vendor if _available[using] else None
+
+
+def reset_backend_cache():
+    _available.clear()
+
+
+def query_terms(query):
+    return _WORD_RE.findall(query or '')[:10]
+
+
+def _sqlite_match(terms):
+    # Chaque mot entre guillemets (pas d'opérateur FTS5 injecté) ; le dernier en préfixe
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _postgres_tsquery(terms):
+    return ' & '.join(terms[:-1] + [f"{terms[-1]}:*"])
+
+
+def _match_sql(backend, terms):
+    """Sous-requête des identifiants correspondant à `terms`, sans classement ni limite."""
+    if backend == 'sqlite':
+        return f"SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s", [_sqlite_match(terms)]
+    return (
+        f"SELECT product_id FROM {POSTGRES_TABLE} WHERE document @@ to_tsquery('{POSTGRES_CONFIG}', %s)",
+        [_postgres_tsquery(terms)]
+    )
+
+
+def _restriction_sql(queryset, column):
+    """Clause « AND column IN (filtres de `queryset`) », vide si `queryset` n'est pas filtré."""
+    if queryset is None or not queryset.query.where:
+        return '', []
+    sql, params = queryset.order_by().values('pk').query.get_compiler(queryset.db).as_sql()
+    return f" AND {column} IN ({sql})", list(params)
+
+
+def search_product_ids(query, limit=None, using=DEFAULT_DB_ALIAS, queryset=None):
+    """
+    Identifiants des produits correspondant à `query`, du plus pertinent au
+    moins pertinent. Les filtres de `queryset` sont appliqués dans la requête
+    plein texte, avant la limite. None si l'index n'est pas disponible.
+    """
+    backend = search_backend(using)
+    if backend is None:
+        return None
+    terms = query_terms(query)
+    if not terms or (queryset is not None and queryset.query.is_empty()):
+        return []
+    limit = limit or _setting('SEARCH_MAX_RESULTS', 500)
+    # Le classement coûte une évaluation par résultat : pour un mot très courant,
+    # on ne classe que les SEARCH_RANK_CANDIDATES produits filtrés les plus récents.
+    candidates = max(limit, _setting('SEARCH_RANK_CANDIDATES', 5000))
+    with connections[using].cursor() as cursor:
+        if backend == 'sqlite':
+            restriction, restriction_params = _restriction_sql(queryset, 'rowid')
+            cursor.execute(
+                f"SELECT rowid FROM ("
+                f"SELECT rowid, bm25({SQLITE_TABLE}, 10.0, 1.0) AS score FROM {SQLITE_TABLE} "
+                f"WHERE {SQLITE_TABLE} MATCH %s{restriction} ORDER BY rowid DESC LIMIT %s"
+                f") ORDER BY score LIMIT %s",
+                [_sqlite_match(terms), *restriction_params, candidates, limit]
+            )
+        else:
+            restriction, restriction_params = _restriction_sql(queryset, 'product_id')
+            cursor.execute(
+                f"SELECT product_id FROM ("
+                f"SELECT product_id, document, query FROM {POSTGRES_TABLE}, to_tsquery('{POSTGRES_CONFIG}', %s) query "
+                f"WHERE document @@ query{restriction} ORDER BY product_id DESC LIMIT %s"
+                f") candidates ORDER BY ts_rank(document, query) DESC LIMIT %s",
+                [_postgres_tsquery(terms), *restriction_params, candidates, limit]
+            )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def matching_products(queryset, query):
+    """
+    Restreint `queryset` à tous les produits correspondant à `query`, sans
+    classement ni limite, par une sous-requête sur l'index (compteurs des
+    facettes : rien n'est chargé en Python).
+    """
+    backend = search_backend(queryset.db)
+    if backend is None:
+        return queryset.filter(Q(name__icontains=query) | Q(description__icontains=query))
+    terms = query_terms(query)
+    if not terms:
+        return queryset.none()
+    sql, params = _match_sql(backend, terms)
+    return queryset.filter(pk__in=RawSQL(sql, params))
+
+
+def _rank_expression(model, product_ids, vendor):
+    """
+    Position de chaque produit dans `product_ids`. Un CASE à 500 branches coûte
+    une quinzaine de millisecondes au tri : on cherche l'identifiant dans une
+    seule valeur (tableau sous PostgreSQL, chaîne délimitée sous SQLite).
+    """
+    column = f'"{model._meta.db_table}"."{model._meta.pk.column}"'
+    if vendor == 'postgresql':
+        return RawSQL(f"array_position(%s::bigint[], {column})", [list(product_ids)], output_field=IntegerField())
+    ids = ',' + ','.join(str(product_id) for product_id in product_ids) + ','
+    return RawSQL(f"instr(%s, ',' || {column} || ',')", [ids], output_field=IntegerField())
+
+
+def search_products(queryset, query):
+    """
+    Restreint `queryset` aux produits correspondant à `query`, triés par
+    pertinence (annotation search_rank : plus elle est petite, plus le produit
+    est pertinent). Filtrer `queryset` avant l'appel : la limite
+    SEARCH_MAX_RESULTS s'applique aux produits filtrés.
+    """
+    product_ids = search_product_ids(query, using=queryset.db, queryset=queryset)
+    if product_ids is None:
+        # Index indisponible : filtre historique, sans classement
+        return queryset.filter(Q(name__icontains=query) | Q(description__icontains=query))
+    if not product_ids:
+        return queryset.none()
+    rank = _rank_expression(queryset.model, product_ids, connections[queryset.db].vendor)
+    return queryset.filter(pk__in=product_ids).annotate(search_rank=rank).order_by('search_rank')
+
+
+def index_product(product, using=DEFAULT_DB_ALIAS):
+    """Ajoute ou remplace un produit dans l'index."""
+    backend = search_backend(using)
+    if backend is None:
+        return
+    name, description = product.name or '', product.description or ''
+    with connections[using].cursor() as cursor:
+        if backend == 'sqlite':
+            cursor.execute(f"DELETE FROM {SQLITE_TABLE} WHERE rowid = %s", [product.pk])
+            cursor.execute(
+                f"INSERT INTO {SQLITE_TABLE} (rowid, name, description) VALUES (%s, %s, %s)",
+                [product.pk, name, description]
+            )
+        else:
+            cursor.execute(
+                f"INSERT INTO {POSTGRES_TABLE} (product_id, document) VALUES (%s, {POSTGRES_DOCUMENT_SQL}) "
+                f"ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                [product.pk, name, description]
+            )
+
+
+def unindex_product(product_id, using=DEFAULT_DB_ALIAS):
+    backend = search_backend(using)
+    if backend is None:
+        return
+    table, column = (SQLITE_TABLE, 'rowid') if backend == 'sqlite' else (POSTGRES_TABLE, 'product_id')
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {column} = %s", [product_id])
+
+
+def rebuild_index(batch_size=5000, using=DEFAULT_DB_ALIAS, model=None):
+    """Reconstruit tout l'index depuis la table des produits. Retourne le nombre indexé."""
+    if model is None:
+        from .models import Product as model
+
+    backend = search_backend(using)
+    if backend is None:
+        return 0
+    connection = connections[using]
+    table = SQLITE_TABLE if backend == 'sqlite' else POSTGRES_TABLE
+    indexed = 0
+    last_id = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table}")
+        while True:
+            rows = list(
+                model.objects.using(using).filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', 'name', 'description')[:batch_size]
+            )
+            if not rows:
+                break
+            params = [(pk, name or '', description or '') for pk, name, description in rows]
+            if backend == 'sqlite':
+                cursor.executemany(f"INSERT INTO {table} (rowid, name, description) VALUES (%s, %s, %s)", params)
+            else:
+                cursor.executemany(
+                    f"INSERT INTO {table} (product_id, document) VALUES (%s, {POSTGRES_DOCUMENT_SQL})", params
+                )
+            indexed += len(rows)
+            last_id = rows[-1][0]
+    if backend == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+    logger.info(f"🔎 Index de recherche reconstruit : {indexed} produits")
+    return indexed
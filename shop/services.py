@@ -3,106 +3,144 @@ import os
 import re
 import logging
 from decimal import Decimal, InvalidOperation
-from openai import OpenAI
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Q, Avg
+from django.db.models import Q, Avg, Count, Exists, OuterRef
 from .models import (
     Product, NegotiationSettings, Conversation, Message, 
     MerchantActivity, ProductImage, ProductVideo, ProductVariation,
     Review, Category, SubCategory
 )
+from .ai_client import ai_client_registry, get_ai_client_health
+from .cache_utils import get_version
+from .presence import presence_store
+from .signals import product_context_namespace
 
 # Configuration du logger
 logger = logging.getLogger(__name__)
 
 def get_openai_client():
     """
-    Retourne le client OpenAI configuré pour OpenRouter - VERSION CORRIGÉE
+    Retourne le client OpenAI partagé configuré pour OpenRouter.
+    Le client est créé une seule fois par processus et la clé API n'est
+    revérifiée qu'à l'expiration de AI_KEY_CHECK_TTL (voir ai_client.py).
     """
-    api_key = os.environ.get("OPENROUTER_API_KEY")
-    
-    if not api_key:
-        logger.error("❌ CLÉ API OPENROUTER NON CONFIGURÉE")
-        logger.error("💡 Pour configurer :")
-        logger.error("1. Allez sur https://openrouter.ai/")
-        logger.error("2. Créez un compte et générez une clé API")
-        logger.error("3. Définissez la variable d'environnement : export OPENROUTER_API_KEY='votre_clé'")
-        return None
+    return ai_client_registry.get_client()
 
-    try:
-        # CORRECTION : Configuration simplifiée sans paramètres problématiques
-        client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=api_key,
-        )
-        
-        # Test simple de la clé
+class NegotiationContext:
+    """
+    Tout ce dont les décisions de l'IA ont besoin pour une conversation :
+    produit, boutique, commerçant, paramètres de négociation et présence.
+    Chargé en une seule requête (select_related + annotation), la présence
+    étant lue dans presence_store comme pour les API de statut, puis passé
+    à should_use_ai, get_negotiation_parameters, get_ai_negotiation_response,
+    get_fallback_response et get_conversation_ai_status.
+    """
+    # Fenêtre pendant laquelle un message du commerçant empêche l'IA de répondre
+    MERCHANT_CHAT_WINDOW = timedelta(minutes=10)
+
+    def __init__(self, conversation):
+        self.conversation = conversation
+        self.product = conversation.product
+        self.shop = self.product.shop
+        self.merchant = conversation.merchant
         try:
-            test_response = client.chat.completions.create(
-                model="mistralai/mistral-small-3.1-24b-instruct:free",
-                messages=[{"role": "user", "content": "Test"}],
-                max_tokens=5
-            )
-            logger.info("✅ Clé API OpenRouter validée avec succès")
-            return client
-            
-        except Exception as test_error:
-            if "401" in str(test_error):
-                logger.error("❌ CLÉ API OPENROUTER INVALIDE")
-                logger.error("💡 Vérifiez votre clé API sur https://openrouter.ai/keys")
-                return None
-            elif "quota" in str(test_error).lower():
-                logger.warning("⚠️  Quota OpenRouter épuisé, utilisation du mode secours")
-                return None
-            else:
-                # Pour les autres erreurs, on continue quand même
-                logger.warning(f"⚠️  Avertissement test API: {test_error}")
-                return client
-        
-    except Exception as e:
-        logger.error(f"❌ Erreur création client OpenAI: {e}")
-        return None
-
-def should_use_ai(conversation):
+            self.settings = self.shop.negotiation_settings
+        except NegotiationSettings.DoesNotExist:
+            self.settings = None
+        # Présence en cache (Presence, mêmes attributs que MerchantActivity) ou None
+        self.activity = presence_store.get(self.merchant.id)
+
+    @classmethod
+    def queryset(cls):
+        """Conversations avec toutes les relations utiles à l'IA, en une requête."""
+        recent_merchant_messages = Message.objects.filter(
+            conversation=OuterRef('pk'),
+            sender=OuterRef('merchant__user'),
+            timestamp__gte=timezone.now() - cls.MERCHANT_CHAT_WINDOW
+        )
+        return Conversation.objects.select_related(
+            'product__shop__merchant',
+            'product__shop__negotiation_settings',
+            'product__category',
+            'product__subcategory',
+            'merchant__user',
+            'client',
+        ).annotate(merchant_recently_in_chat=Exists(recent_merchant_messages))
+
+    @classmethod
+    def load(cls, conversation_id):
+        return cls(cls.queryset().get(pk=conversation_id))
+
+    @classmethod
+    def resolve(cls, conversation, context=None):
+        """Retourne le contexte fourni, ou le charge pour cette conversation."""
+        if context is not None:
+            return context
+        return cls.load(conversation.pk)
+
+    @property
+    def ai_enabled(self):
+        return bool(self.settings and self.settings.is_active)
+
+    @property
+    def merchant_recently_in_chat(self):
+        recent = getattr(self.conversation, 'merchant_recently_in_chat', None)
+        if recent is None:
+            # Conversation chargée sans l'annotation
+            recent = Message.objects.filter(
+                conversation=self.conversation,
+                sender=self.merchant.user,
+                timestamp__gte=timezone.now() - self.MERCHANT_CHAT_WINDOW
+            ).exists()
+        return recent
+
+    @property
+    def min_price(self):
+        """Prix minimum acceptable (70% du prix si non défini)."""
+        if self.settings and self.settings.min_price_threshold:
+            return self.settings.min_price_threshold
+        return Decimal(self.product.price * Decimal('0.7'))
+
+    @property
+    def max_discount(self):
+        if self.settings and self.settings.max_discount_percentage:
+            return self.settings.max_discount_percentage
+        return Decimal('10.00')
+
+def should_use_ai(conversation, context=None):
     """
     Détermine si l'IA doit répondre en fonction de l'activité réelle du commerçant
     """
     try:
+        context = NegotiationContext.resolve(conversation, context)
+
         # Vérifie si la négociation IA est activée
-        try:
-            negotiation_settings = NegotiationSettings.objects.get(shop=conversation.product.shop)
-            if not negotiation_settings.is_active:
-                logger.debug(f"❌ Négociation IA désactivée pour {conversation.merchant}")
-                return False
-        except NegotiationSettings.DoesNotExist:
-            logger.debug(f"❌ Paramètres de négociation non trouvés pour {conversation.merchant.shop}")
+        if context.settings is None:
+            logger.debug(f"❌ Paramètres de négociation non trouvés pour {context.shop}")
+            return False
+        if not context.settings.is_active:
+            logger.debug(f"❌ Négociation IA désactivée pour {context.merchant}")
             return False
 
         # Vérifie l'activité du commerçant
-        try:
-            activity = MerchantActivity.objects.get(merchant=conversation.merchant)
-            
+        activity = context.activity
+        if activity is not None:
             # L'IA n'intervient PAS si :
             # 1. Le commerçant est en ligne ET actif récemment (moins de 2 minutes)
             if activity.is_online and activity.minutes_since_last_seen < 2:
-                logger.debug(f"⏸️ Commerçant {conversation.merchant} en ligne et actif - IA n'intervient pas")
+                logger.debug(f"⏸️ Commerçant {context.merchant} en ligne et actif - IA n'intervient pas")
                 return False
             
             # 2. Le commerçant a été actif dans le chat récemment (moins de 10 minutes)
-            recent_merchant_messages = Message.objects.filter(
-                conversation=conversation,
-                sender=conversation.merchant.user,
-                timestamp__gte=timezone.now() - timedelta(minutes=10)
-            )
-            if recent_merchant_messages.exists():
-                logger.debug(f"⏸️ Commerçant {conversation.merchant} actif dans le chat - IA n'intervient pas")
+            if context.merchant_recently_in_chat:
+                logger.debug(f"⏸️ Commerçant {context.merchant} actif dans le chat - IA n'intervient pas")
                 return False
-                
-        except MerchantActivity.DoesNotExist:
+        else:
             # Si pas d'info d'activité, l'IA peut intervenir
-            logger.debug(f"✅ Aucune activité trouvée pour {conversation.merchant} - IA peut intervenir")
-            pass
+            logger.debug(f"✅ Aucune activité trouvée pour {context.merchant} - IA peut intervenir")
             
         # L'IA intervient seulement si toutes les conditions sont remplies
         logger.info(f"✅ IA autorisée à répondre pour la conversation {conversation.id}")
@@ -263,11 +301,10 @@ Description boutique : {product.shop.description or "Aucune description"}
 """
         
         # Ajoute les variations de produit si elles existent
-        variations = product.variations.filter(is_active=True)
-        if variations.exists():
+        variations = list(product.variations.filter(is_active=True))
+        if variations:
             context += "\n🎨 VARIATIONS DISPONIBLES :\n"
             for variation in variations:
-                variation_price = product.price + variation.price_modifier
                 context += f"- {variation.type} : {variation.value} "
                 if variation.price_modifier != 0:
                     context += f"(+{variation.price_modifier} CFA) "
@@ -276,19 +313,18 @@ Description boutique : {product.shop.description or "Aucune description"}
                 context += "\n"
         
         # Ajoute les médias disponibles
-        images = product.images.all()
-        if images.exists():
-            context += f"\n🖼️ MÉDIAS : {images.count()} image(s) disponible(s)"
+        images_count = product.images.count()
+        if images_count:
+            context += f"\n🖼️ MÉDIAS : {images_count} image(s) disponible(s)"
         
-        videos = product.videos.all()
-        if videos.exists():
-            context += f"\n🎥 VIDÉOS : {videos.count()} vidéo(s) de démonstration"
+        videos_count = product.videos.count()
+        if videos_count:
+            context += f"\n🎥 VIDÉOS : {videos_count} vidéo(s) de démonstration"
         
         # Ajoute les avis si disponibles
-        reviews = product.reviews.all()
-        if reviews.exists():
-            avg_rating = reviews.aggregate(Avg('rating'))['rating__avg'] or 0
-            context += f"\n⭐ AVIS CLIENTS : Note moyenne {avg_rating:.1f}/5 sur {reviews.count()} avis"
+        reviews = product.reviews.aggregate(avg_rating=Avg('rating'), count=Count('id'))
+        if reviews['count']:
+            context += f"\n⭐ AVIS CLIENTS : Note moyenne {reviews['avg_rating']:.1f}/5 sur {reviews['count']} avis"
         
         return context
         
@@ -296,43 +332,41 @@ Description boutique : {product.shop.description or "Aucune description"}
         logger.error(f"❌ Erreur dans build_product_context: {e}")
         return f"Produit: {product.name}, Prix: {product.price} CFA"
 
-def get_negotiation_parameters(conversation):
+def get_product_context(product):
+    """
+    Retourne le contexte produit pour l'IA depuis le cache.
+    La clé contient la version du produit, incrémentée par les signaux à chaque
+    modification du produit, de ses variations, médias ou avis : un tour de
+    négociation sur un produit inchangé ne fait aucune requête.
+    """
+    version = get_version(product_context_namespace(product.pk))
+    cache_key = f"product_context:{product.pk}:v{version}"
+    context = cache.get(cache_key)
+    if context is None:
+        context = build_product_context(product)
+        cache.set(cache_key, context, getattr(settings, 'PRODUCT_CONTEXT_CACHE_TIMEOUT', 300))
+    return context
+
+def get_negotiation_parameters(conversation, context=None):
     """
     Récupère les paramètres de négociation pour une conversation
     """
-    try:
-        negotiation_settings = NegotiationSettings.objects.get(shop=conversation.product.shop)
-        min_price = negotiation_settings.min_price_threshold
-        max_discount = negotiation_settings.max_discount_percentage
-        
-        # Si pas de prix minimum défini, calculer automatiquement (70% du prix)
-        if not min_price or min_price == 0:
-            min_price = Decimal(conversation.product.price * Decimal('0.7'))
-        
-        return {
-            'min_price': min_price,
-            'max_discount': max_discount or Decimal('10.00'),
-            'original_price': conversation.product.price
-        }
-    except NegotiationSettings.DoesNotExist:
-        return {
-            'min_price': Decimal(conversation.product.price * Decimal('0.7')),
-            'max_discount': Decimal('10.00'),
-            'original_price': conversation.product.price
-        }
+    context = NegotiationContext.resolve(conversation, context)
+    return {
+        'min_price': context.min_price,
+        'max_discount': context.max_discount,
+        'original_price': context.product.price
+    }
 
-def get_fallback_response(product, user_message, conversation):
+def get_fallback_response(product, user_message, conversation, context=None):
     """
     Réponse de secours intelligente quand l'IA n'est pas disponible
     """
+    context = NegotiationContext.resolve(conversation, context)
     user_price_offer = extract_price_from_message(user_message)
     
     if user_price_offer is not None:
-        try:
-            negotiation_settings = NegotiationSettings.objects.get(shop=conversation.product.shop)
-            min_price = negotiation_settings.min_price_threshold or Decimal(product.price * Decimal('0.7'))
-        except NegotiationSettings.DoesNotExist:
-            min_price = Decimal(product.price * Decimal('0.7'))
+        min_price = context.min_price
 
         if user_price_offer >= product.price:
             return f"🎉 J'accepte votre offre de {user_price_offer} CFA ! Le produit '{product.name}' est à vous !"
@@ -348,20 +382,27 @@ def get_fallback_response(product, user_message, conversation):
         return f"🔧 Merci pour votre question technique concernant '{product.name}'. Le commerçant vous répondra dès son retour avec les informations détaillées."
         
     elif is_greeting_message(user_message):
-        return f"👋 Bonjour ! Je suis l'assistant de {conversation.merchant.first_name}. Comment puis-je vous aider avec '{product.name}' ?"
+        return f"👋 Bonjour ! Je suis l'assistant de {context.merchant.first_name}. Comment puis-je vous aider avec '{product.name}' ?"
         
     elif "merci" in user_message.lower():
         return "🤝 Je vous en prie ! N'hésitez pas si vous avez d'autres questions."
         
     else:
-        return f"💬 Merci pour votre message concernant '{product.name}'. Le commerçant {conversation.merchant.first_name} vous répondra rapidement."
+        return f"💬 Merci pour votre message concernant '{product.name}'. Le commerçant {context.merchant.first_name} vous répondra rapidement."
 
-def get_ai_negotiation_response(product: Product, user_message: str, conversation: Conversation):
+def get_ai_negotiation_response(product: Product, user_message: str, conversation: Conversation, context=None,
+                                raise_errors=False):
     """
-    Appelle l'API Mistral via OpenRouter pour générer une réponse contextuelle et intelligente
+    Appelle l'API Mistral via OpenRouter pour générer une réponse contextuelle et intelligente.
+    Avec raise_errors=True (worker IA), une erreur de l'API est relevée au lieu d'être
+    remplacée par la réponse de secours : la tâche peut alors être réessayée.
     """
+    context = NegotiationContext.resolve(conversation, context)
+    conversation = context.conversation
+    product = context.product
+
     # Vérifie si l'IA doit répondre
-    if not should_use_ai(conversation):
+    if not should_use_ai(conversation, context):
         logger.debug("⏸️ IA non autorisée à répondre")
         return None
 
@@ -369,23 +410,15 @@ def get_ai_negotiation_response(product: Product, user_message: str, conversatio
     client = get_openai_client()
     if not client:
         logger.error("❌ Impossible d'initialiser le client API - utilisation du mode secours")
-        return get_fallback_response(product, user_message, conversation)
+        return get_fallback_response(product, user_message, conversation, context)
 
     # Récupère les paramètres de négociation
-    try:
-        negotiation_settings = NegotiationSettings.objects.get(shop=conversation.product.shop)
-        min_price = negotiation_settings.min_price_threshold or Decimal(product.price * Decimal('0.7'))
-        max_discount_percentage = negotiation_settings.max_discount_percentage or Decimal('10.00')
-        
-        logger.debug(f"⚙️ Paramètres négociation: min={min_price}, max_discount={max_discount_percentage}%")
-        
-    except NegotiationSettings.DoesNotExist:
-        min_price = Decimal(product.price * Decimal('0.7'))
-        max_discount_percentage = Decimal('10.00')
-        logger.debug("⚙️ Paramètres négociation par défaut utilisés")
+    min_price = context.min_price
+    max_discount_percentage = context.max_discount
+    logger.debug(f"⚙️ Paramètres négociation: min={min_price}, max_discount={max_discount_percentage}%")
 
     # Construit le contexte du produit
-    product_context = build_product_context(product)
+    product_context = get_product_context(product)
     
     # Analyse le message de l'utilisateur
     user_price_offer = extract_price_from_message(user_message)
@@ -398,7 +431,7 @@ def get_ai_negotiation_response(product: Product, user_message: str, conversatio
     # Prépare le prompt système adapté au contexte
     if user_price_offer is not None:
         # Mode négociation de prix
-        system_prompt = f"""Tu es {conversation.merchant.first_name}, assistant commercial intelligent pour la boutique "{conversation.product.shop.description}".
+        system_prompt = f"""Tu es {context.merchant.first_name}, assistant commercial intelligent pour la boutique "{context.shop.description}".
 
 {product_context}
 
@@ -420,7 +453,7 @@ CONSIGNES :
         
     elif is_technical:
         # Mode réponse aux questions techniques
-        system_prompt = f"""Tu es {conversation.merchant.first_name}, expert technique.
+        system_prompt = f"""Tu es {context.merchant.first_name}, expert technique.
 
 {product_context}
 
@@ -435,7 +468,7 @@ CONSIGNES :
         
     elif is_negotiation:
         # Mode initiation de négociation
-        system_prompt = f"""Tu es {conversation.merchant.first_name}, commercial expérimenté.
+        system_prompt = f"""Tu es {context.merchant.first_name}, commercial expérimenté.
 
 {product_context}
 
@@ -450,7 +483,7 @@ CONSIGNES :
         
     elif is_greeting:
         # Mode salutation
-        system_prompt = f"""Tu es {conversation.merchant.first_name}, assistant courtois.
+        system_prompt = f"""Tu es {context.merchant.first_name}, assistant courtois.
 
 {product_context}
 
@@ -465,7 +498,7 @@ CONSIGNES :
         
     else:
         # Mode conversation générale
-        system_prompt = f"""Tu es {conversation.merchant.first_name}, assistant serviable.
+        system_prompt = f"""Tu es {context.merchant.first_name}, assistant serviable.
 
 {product_context}
 
@@ -496,11 +529,13 @@ CONSIGNES :
         )
         
         ai_message = completion.choices[0].message.content.strip()
+        ai_client_registry.record_success()
         logger.info(f"✅ Réponse IA générée: {ai_message}")
         
         return ai_message
         
     except Exception as e:
+        ai_client_registry.record_failure(e)
         logger.error(f"❌ Erreur API OpenRouter: {e}")
         
         # Gestion spécifique des erreurs courantes
@@ -513,7 +548,9 @@ CONSIGNES :
         else:
             logger.error(f"🚨 ERREUR INCONNUE: {e}")
         
-        return get_fallback_response(product, user_message, conversation)
+        if raise_errors:
+            raise
+        return get_fallback_response(product, user_message, conversation, context)
 
 def update_merchant_activity(user):
     """
@@ -541,90 +578,86 @@ def update_merchant_activity(user):
 
 def get_merchant_status(merchant):
     """
-    Retourne le statut détaillé d'un commerçant
+    Retourne le statut détaillé d'un commerçant (présence lue dans le cache)
     """
-    try:
-        activity = MerchantActivity.objects.get(merchant=merchant)
-        
-        if not hasattr(activity, 'minutes_since_last_seen'):
-            # Calcul manuel si la propriété n'existe pas
-            minutes_since_seen = (timezone.now() - activity.last_seen).total_seconds() / 60
-        else:
-            minutes_since_seen = activity.minutes_since_last_seen
-        
-        if activity.is_online:
-            if minutes_since_seen < 1:
-                return {
-                    'status': 'en_ligne_actif',
-                    'label': '🟢 En ligne',
-                    'description': 'Connecté et actif',
-                    'can_use_ai': False
-                }
-            elif minutes_since_seen < 3:
-                return {
-                    'status': 'en_ligne_inactif',
-                    'label': '🟡 En ligne',
-                    'description': 'Connecté mais inactif',
-                    'can_use_ai': False
-                }
-            else:
-                return {
-                    'status': 'en_ligne_absent',
-                    'label': '🟠 Absent',
-                    'description': 'Connecté mais absent',
-                    'can_use_ai': True
-                }
-        else:
-            if minutes_since_seen < 5:
-                return {
-                    'status': 'hors_ligne_recent',
-                    'label': '🔴 Hors ligne',
-                    'description': 'Déconnecté récemment',
-                    'can_use_ai': True
-                }
-            else:
-                return {
-                    'status': 'hors_ligne',
-                    'label': '🔴 Hors ligne',
-                    'description': 'Déconnecté',
-                    'can_use_ai': True
-                }
-                
-    except MerchantActivity.DoesNotExist:
+    return get_status_from_activity(presence_store.get(merchant.id))
+
+def get_status_from_activity(activity):
+    """
+    Calcule le statut d'un commerçant à partir de son activité (None si inconnue)
+    """
+    if activity is None:
         return {
             'status': 'inconnu',
             'label': '⚫ Statut inconnu',
             'description': 'Aucune information disponible',
             'can_use_ai': True
         }
-
-def can_use_ai_for_conversation(conversation):
+    
+    if not hasattr(activity, 'minutes_since_last_seen'):
+        # Calcul manuel si la propriété n'existe pas
+        minutes_since_seen = (timezone.now() - activity.last_seen).total_seconds() / 60
+    else:
+        minutes_since_seen = activity.minutes_since_last_seen
+    
+    if activity.is_online:
+        if minutes_since_seen < 1:
+            return {
+                'status': 'en_ligne_actif',
+                'label': '🟢 En ligne',
+                'description': 'Connecté et actif',
+                'can_use_ai': False
+            }
+        elif minutes_since_seen < 3:
+            return {
+                'status': 'en_ligne_inactif',
+                'label': '🟡 En ligne',
+                'description': 'Connecté mais inactif',
+                'can_use_ai': False
+            }
+        else:
+            return {
+                'status': 'en_ligne_absent',
+                'label': '🟠 Absent',
+                'description': 'Connecté mais absent',
+                'can_use_ai': True
+            }
+    else:
+        if minutes_since_seen < 5:
+            return {
+                'status': 'hors_ligne_recent',
+                'label': '🔴 Hors ligne',
+                'description': 'Déconnecté récemment',
+                'can_use_ai': True
+            }
+        else:
+            return {
+                'status': 'hors_ligne',
+                'label': '🔴 Hors ligne',
+                'description': 'Déconnecté',
+                'can_use_ai': True
+            }
+
+def can_use_ai_for_conversation(conversation, context=None):
     """
     Vérifie si l'IA peut être utilisée pour une conversation spécifique
     """
-    status = get_merchant_status(conversation.merchant)
+    context = NegotiationContext.resolve(conversation, context)
+    status = get_status_from_activity(context.activity)
     
     # Vérifie les paramètres de négociation
-    try:
-        negotiation_settings = NegotiationSettings.objects.get(shop=conversation.merchant.shop)
-        if not negotiation_settings.is_active:
-            return False
-    except NegotiationSettings.DoesNotExist:
+    if not context.ai_enabled:
         return False
     
     return status['can_use_ai']
 
-def get_conversation_ai_status(conversation):
+def get_conversation_ai_status(conversation, context=None):
     """
     Retourne le statut complet de l'IA pour une conversation
     """
-    merchant_status = get_merchant_status(conversation.merchant)
-    
-    try:
-        negotiation_settings = NegotiationSettings.objects.get(shop=conversation.merchant.shop)
-        ai_enabled = negotiation_settings.is_active
-    except NegotiationSettings.DoesNotExist:
-        ai_enabled = False
+    context = NegotiationContext.resolve(conversation, context)
+    merchant_status = get_status_from_activity(context.activity)
+    ai_enabled = context.ai_enabled
     
     # Vérifie si OpenRouter est configuré
     openrouter_configured = bool(os.environ.get("OPENROUTER_API_KEY"))
@@ -633,8 +666,8 @@ def get_conversation_ai_status(conversation):
         'merchant_status': merchant_status,
         'ai_enabled': ai_enabled,
         'can_use_ai': merchant_status['can_use_ai'] and ai_enabled,
-        'merchant_name': f"{conversation.merchant.first_name} {conversation.merchant.last_name}",
-        'shop_name': conversation.merchant.shop.description or "Boutique",
+        'merchant_name': f"{context.merchant.first_name} {context.merchant.last_name}",
+        'shop_name': context.shop.description or "Boutique",
         'openrouter_configured': openrouter_configured
     }
 
@@ -648,7 +681,8 @@ def test_openai_connection():
         return {
             'success': False,
             'message': '❌ Client OpenAI non configuré',
-            'details': 'Vérifiez la variable OPENROUTER_API_KEY'
+            'details': 'Vérifiez la variable OPENROUTER_API_KEY',
+            'health': get_ai_client_health()
         }
     
     try:
@@ -665,20 +699,28 @@ def test_openai_connection():
             'success': True,
             'message': '✅ Connexion OpenAI/OpenRouter fonctionnelle',
             'response': response_text,
-            'details': 'L\'IA est correctement configurée avec la bibliothèque OpenAI'
+            'details': 'L\'IA est correctement configurée avec la bibliothèque OpenAI',
+            'health': get_ai_client_health()
         }
         
     except Exception as e:
         return {
             'success': False,
             'message': '❌ Erreur de connexion OpenAI',
-            'details': str(e)
+            'details': str(e),
+            'health': get_ai_client_health()
         }
 
-# Initialisation au chargement du module
-logger.info("🔄 Initialisation des services IA avec OpenAI...")
-client = get_openai_client()
-if client:
-    logger.info("✅ Service OpenAI/OpenRouter configuré avec succès")
-else:
-    logger.warning("⚠️ Service OpenAI/OpenRouter non configuré - mode secours activé")
\ No newline at end of file
+def warm_up_ai_services():
+    """
+    Initialise le client IA à l'avance (appelé au démarrage du worker IA).
+    L'import de ce module ne fait aucun appel réseau : sans warm-up, le
+    client est créé au premier message à traiter.
+    """
+    logger.info("🔄 Initialisation des services IA avec OpenAI...")
+    client = get_openai_client()
+    if client:
+        logger.info("✅ Service OpenAI/OpenRouter configuré avec succès")
+    else:
+        logger.warning("⚠️ Service OpenAI/OpenRouter non configuré - mode secours activé")
+    return client is not None
@@ -0,0 +1,121 @@
+# Fichier : shop/signals.py
+"""
+Récepteurs de signaux qui invalident les données dérivées mises en cache
+ou maintiennent les champs dénormalisés. Enregistrés dans ShopConfig.ready().
+"""
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache_utils import bump_version
+from .models import (
+    Product, ProductVariation, ProductImage, ProductVideo, Review, Conversation, Message, Category, SubCategory, Shop,
+    ShopSettings, HeroSlide
+)
+from . import page_cache
+from .facets import FACET_NAMESPACE
+from .realtime import publish_message
+from .search import index_product, unindex_product
+
+
+def product_context_namespace(product_id):
+    return f"product_context:{product_id}"
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_context(sender, instance, **kwargs):
+    bump_version(product_context_namespace(instance.pk))
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, using, **kwargs):
+    index_product(instance, using=using)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_search_index(sender, instance, using, **kwargs):
+    unindex_product(instance.pk, using=using)
+
+
+@receiver([post_save, post_delete], sender=ProductVariation)
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=ProductVideo)
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_product_context_from_related(sender, instance, **kwargs):
+    bump_version(product_context_namespace(instance.product_id))
+
+
+@receiver([post_save, post_delete], sender=Review)
+def update_product_rating_summary(sender, instance, **kwargs):
+    # Recalcul plutôt qu'incrément : couvre aussi la modification d'une note
+    Product.refresh_rating_summary([instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Review)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=SubCategory)
+@receiver([post_save, post_delete], sender=Shop)
+def invalidate_facet_index(sender, **kwargs):
+    # Reconstruit par chaque processus à la prochaine lecture (voir shop/facets.py)
+    bump_version(FACET_NAMESPACE)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_pages(sender, instance, **kwargs):
+    # Catalogue et page de la boutique du produit ; les autres boutiques restent en cache
+    bump_version(page_cache.PRODUCTS)
+    bump_version(page_cache.shop_namespace(instance.shop_id))
+
+
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_rated_product_pages(sender, instance, **kwargs):
+    # La note moyenne est affichée dans le catalogue (filtre et tri par note)
+    bump_version(page_cache.PRODUCTS)
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=SubCategory)
+def invalidate_category_pages(sender, **kwargs):
+    bump_version(page_cache.CATEGORIES)
+
+
+@receiver([post_save, post_delete], sender=HeroSlide)
+def invalidate_hero_pages(sender, **kwargs):
+    bump_version(page_cache.HERO)
+
+
+@receiver([post_save, post_delete], sender=Shop)
+def invalidate_shop_pages(sender, instance, **kwargs):
+    bump_version(page_cache.SHOPS)
+    bump_version(page_cache.shop_namespace(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=ShopSettings)
+def invalidate_shop_settings_pages(sender, instance, **kwargs):
+    # Visibilité ou lien partageable modifiés
+    bump_version(page_cache.shop_namespace(instance.shop_id))
+
+
+@receiver(post_save, sender=Message)
+def broadcast_new_message(sender, instance, created, **kwargs):
+    # Publié après le commit : le flux SSE doit pouvoir relire le message
+    if created:
+        transaction.on_commit(lambda: publish_message(instance))
+
+
+@receiver(post_save, sender=Message)
+def update_conversation_summary(sender, instance, created, **kwargs):
+    # Un seul UPDATE : dernier message et compteur non lu du destinataire
+    if not created:
+        return
+    if instance.sender_id == instance.conversation.client_id:
+        unread_field = 'merchant_unread_count'
+    else:
+        unread_field = 'client_unread_count'
+    Conversation.objects.filter(pk=instance.conversation_id).update(
+        last_message_at=instance.timestamp,
+        last_message_preview=instance.text[:Conversation.PREVIEW_LENGTH],
+        **{unread_field: F(unread_field) + 1}
+    )
@@ -2,17 +2,29 @@
 from django.utils import timezone
 from datetime import timedelta
 from django.contrib.sessions.models import Session
-from .models import MerchantActivity, Message, Conversation
+from django.conf import settings
+from .cache_utils import shared_cache
+from .models import Merchant, MerchantActivity, Message, Conversation
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# Moteurs de session qui stockent les sessions en base (les seuls à purger)
+DB_SESSION_ENGINES = (
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+)
+
 def update_merchant_online_status():
     """
     Tâche principale qui met à jour le statut en ligne/hors ligne des commerçants
     """
     try:
-        # Ton code existant...
+        # Écrit d'abord les battements de présence encore en mémoire
+        from .presence import presence_tracker
+        presence_tracker.flush()
+        
         online_threshold = timezone.now() - timedelta(minutes=2)
         offline_threshold = timezone.now() - timedelta(minutes=5)
         
@@ -26,32 +38,102 @@ def update_merchant_online_status():
             is_online=False
         ).update(is_online=True)
         
-        expired_sessions = Session.objects.filter(expire_date__lt=timezone.now())
-        expired_count = expired_sessions.count()
-        expired_sessions.delete()
-        
-        logger.info(f"Statut mis à jour: {online_count} en ligne, {offline_count} hors ligne, {expired_count} sessions expirées")
+        logger.info(f"Statut mis à jour: {online_count} en ligne, {offline_count} hors ligne")
         
     except Exception as e:
         logger.error(f"Erreur dans update_merchant_online_status: {e}")
 
+def record_task_run(name, started, **stats):
+    """
+    Journalise la durée d'une exécution et la garde dans le cache partagé
+    (dernier passage) : les tâches tournent dans runscheduler, lues ailleurs.
+    """
+    duration_ms = (time.perf_counter() - started) * 1000
+    shared_cache().set(f"tasks:{name}:last_run", {
+        'finished_at': timezone.now(),
+        'duration_ms': duration_ms,
+        **stats,
+    }, timeout=None)
+    details = ', '.join(f"{key}={value}" for key, value in stats.items())
+    logger.info(f"⏱️ {name} : {duration_ms:.1f} ms ({details})")
+    return duration_ms
+
+def last_task_run(name):
+    """Dernier passage enregistré par record_task_run, None si la tâche n'a pas encore tourné."""
+    return shared_cache().get(f"tasks:{name}:last_run")
+
+def purge_expired_sessions(batch_size=None, time_budget=None, pause=None):
+    """
+    Supprime les sessions expirées par lots bornés, triés par clé primaire,
+    dans un budget de temps : chaque lot est une transaction courte et la
+    tâche laisse la base aux requêtes entre deux lots. Le reste éventuel
+    est repris au passage suivant. Retourne le nombre de sessions purgées.
+    """
+    batch_size = batch_size or getattr(settings, 'SESSION_PURGE_BATCH_SIZE', 500)
+    time_budget = time_budget if time_budget is not None else getattr(settings, 'SESSION_PURGE_TIME_BUDGET', 5)
+    pause = pause if pause is not None else getattr(settings, 'SESSION_PURGE_PAUSE', 0.05)
+    
+    if settings.SESSION_ENGINE not in DB_SESSION_ENGINES:
+        return 0
+    
+    started = time.perf_counter()
+    now = timezone.now()
+    purged = batches = 0
+    complete = False
+    try:
+        while time.perf_counter() - started < time_budget:
+            keys = list(
+                Session.objects.filter(expire_date__lt=now)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if keys:
+                purged += Session.objects.filter(pk__in=keys, expire_date__lt=now).delete()[0]
+                batches += 1
+            if len(keys) < batch_size:
+                complete = True
+                break
+            time.sleep(pause)
+    except Exception as e:
+        logger.error(f"Erreur dans purge_expired_sessions: {e}")
+    
+    record_task_run('purge_expired_sessions', started, purged=purged, batches=batches, complete=complete)
+    return purged
+
 def check_chat_activity():
     """
-    Vérifie l'activité spécifique dans les conversations
+    Vérifie l'activité spécifique dans les conversations.
+    Différentiel : seules les lignes dont is_active_in_chat change sont écrites.
     """
     try:
-        # Ton code existant...
+        started = time.perf_counter()
         chat_active_threshold = timezone.now() - timedelta(minutes=10)
         
-        recent_chat_merchants = Message.objects.filter(
-            timestamp__gte=chat_active_threshold,
-            sender__merchant__isnull=False
-        ).values_list('sender__merchant', flat=True).distinct()
+        # Auteurs de messages récents (index shop_msg_ts_sender_idx), évalué en sous-requête
+        recent_senders = Message.objects.filter(
+            timestamp__gte=chat_active_threshold
+        ).values('sender_id')
+        
+        activated = MerchantActivity.objects.filter(
+            is_active_in_chat=False,
+            merchant__user_id__in=recent_senders
+        ).update(is_active_in_chat=True)
+        
+        deactivated = MerchantActivity.objects.filter(
+            is_active_in_chat=True
+        ).exclude(
+            merchant__user_id__in=recent_senders
+        ).update(is_active_in_chat=False)
         
-        MerchantActivity.objects.filter(merchant_id__in=recent_chat_merchants).update(is_active_in_chat=True)
-        MerchantActivity.objects.exclude(merchant_id__in=recent_chat_merchants).update(is_active_in_chat=False)
+        from .presence import presence_store
+        active_merchants = presence_store.set_chat_active_merchants(
+            Merchant.objects.filter(user_id__in=recent_senders).values_list('id', flat=True)
+        )
         
-        logger.info(f"Activité chat vérifiée: {len(recent_chat_merchants)} commerçants actifs")
+        record_task_run(
+            'check_chat_activity', started,
+            active=len(active_merchants), activated=activated, deactivated=deactivated
+        )
         
     except Exception as e:
-        logger.error(f"Erreur dans check_chat_activity: {e}")
\ No newline at end of file
+        logger.error(f"Erreur dans check_chat_activity: {e}")
@@ -1,3 +1,1190 @@
-from django.test import TestCase
+import json
+import sys
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.http import QueryDict
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Merchant, Shop, Product, Conversation, Message, NegotiationSettings, MerchantActivity,
+    SchedulerLease, Review, Category, HeroSlide, ShopSettings, Cart, CartItem, ProductVariation, Order, OrderItem,
+    StockReservation, AIReplyJob, ProductImage, ProductVideo
+)
+from .services import (
+    NegotiationContext, should_use_ai, get_negotiation_parameters, get_fallback_response,
+    get_conversation_ai_status, get_ai_negotiation_response, get_product_context,
+    get_merchant_status
+)
+from .pagination import keyset_paginate, InvalidCursor
+from .presence import PresenceTracker, presence_store
+from .search import matching_products, search_products, search_backend
+from . import facets as facets_module
+from .facets import facet_counts, reset_facet_index
+from .checkout import place_order, OutOfStock
+from .reservations import hold_cart, expire_reservations, with_available_stock
+from . import page_cache
+from .cache_utils import get_version, get_versions
+from .page_cache import normalized_params
+from .scheduler import acquire_lease, release_lease, run_as_leader
+from .tasks import check_chat_activity, last_task_run, purge_expired_sessions
+from .realtime import bump_sequence, conversation_channel, publish_message
+import shop as shop_module
+from .apps import ShopConfig
+from .ai_client import AIClientRegistry, KEY_INVALID, KEY_UNCONFIGURED, KEY_VALID
+from .ai_jobs import enqueue_ai_reply, claim_next_job, process_job, requeue_stale_jobs
+
+
+def create_conversation():
+    merchant_user = User.objects.create_user('marchand', password='x')
+    client_user = User.objects.create_user('client', password='x')
+    merchant = Merchant.objects.create(
+        user=merchant_user, first_name='Awa', last_name='Traoré',
+        email='awa@example.com', phone='70000000', country='Mali'
+    )
+    shop = Shop.objects.create(merchant=merchant, description='Boutique Awa')
+    product = Product.objects.create(shop=shop, name='Boubou', price=Decimal('10000'), stock=3)
+    conversation = Conversation.objects.create(product=product, client=client_user, merchant=merchant)
+    return conversation
+
+
+def clear_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+@override_settings(OPENROUTER_API_KEY=None)
+@mock.patch.dict('os.environ', {'OPENROUTER_API_KEY': ''})
+class NegotiationContextQueryCountTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.conversation = create_conversation()
+        shop = self.conversation.product.shop
+        NegotiationSettings.objects.create(shop=shop, is_active=True, min_price_threshold=Decimal('8000'))
+        MerchantActivity.objects.create(merchant=self.conversation.merchant)
+        # Commerçant hors ligne depuis une heure : l'IA répond
+        MerchantActivity.objects.update(last_seen=timezone.now() - timedelta(hours=1))
+        for i in range(5):
+            Message.objects.create(conversation=self.conversation, sender=self.conversation.client, text=f'message {i}')
+
+    def run_chat_message_helpers(self):
+        context = NegotiationContext.load(self.conversation.id)
+        conversation = context.conversation
+        should_use_ai(conversation, context)
+        get_negotiation_parameters(conversation, context)
+        get_fallback_response(context.product, 'Je propose 9000 CFA', conversation, context)
+        get_conversation_ai_status(conversation, context)
+        return get_ai_negotiation_response(context.product, 'Je propose 9000 CFA', conversation, context)
+
+    def warm_caches(self):
+        get_product_context(self.conversation.product)
+        presence_store.get(self.conversation.merchant.id)
+
+    def test_chat_message_helpers_run_in_a_single_query(self):
+        self.warm_caches()
+        with self.assertNumQueries(1):
+            response = self.run_chat_message_helpers()
+        self.assertIn('9000', response)
+
+    def test_query_count_does_not_depend_on_history_length(self):
+        self.warm_caches()
+        for i in range(20):
+            Message.objects.create(conversation=self.conversation, sender=self.conversation.merchant.user, text=f'réponse {i}')
+        with self.assertNumQueries(1):
+            self.run_chat_message_helpers()
+
+    def test_context_handles_missing_settings_and_activity(self):
+        NegotiationSettings.objects.all().delete()
+        MerchantActivity.objects.all().delete()
+        context = NegotiationContext.load(self.conversation.id)
+        self.assertIsNone(context.settings)
+        self.assertIsNone(context.activity)
+        self.assertFalse(should_use_ai(context.conversation, context))
+        self.assertEqual(context.min_price, Decimal('7000.00'))
+
+
+class ProductContextCacheTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.product = create_conversation().product
+
+    def assert_invalidated_by(self, create, expected):
+        context = get_product_context(self.product)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_product_context(self.product), context)
+
+        related = create()
+        self.assertIn(expected, get_product_context(self.product))
+        with self.assertNumQueries(0):
+            get_product_context(self.product)
+
+        related.delete()
+        self.assertEqual(get_product_context(self.product), context)
+
+    def test_variation_save_and_delete(self):
+        self.assert_invalidated_by(lambda: ProductVariation.objects.create(
+            product=self.product, type='Taille', value='XL', price_modifier=Decimal('500')
+        ), 'Taille : XL (+500')
+
+    def test_image_save_and_delete(self):
+        self.assert_invalidated_by(
+            lambda: ProductImage.objects.create(product=self.product, image='product_images/boubou.jpg'),
+            '1 image(s)'
+        )
+
+    def test_video_save_and_delete(self):
+        self.assert_invalidated_by(
+            lambda: ProductVideo.objects.create(product=self.product, video='product_videos/boubou.mp4'),
+            '1 vidéo(s)'
+        )
+
+    def test_review_save_and_delete(self):
+        self.assert_invalidated_by(
+            lambda: Review.objects.create(product=self.product, user=User.objects.get(username='client'), rating=4),
+            'Note moyenne 4.0/5 sur 1 avis'
+        )
+
+    def test_variation_update_is_seen(self):
+        variation = ProductVariation.objects.create(product=self.product, type='Couleur', value='Bleu')
+        self.assertIn('Couleur : Bleu', get_product_context(self.product))
+        variation.value = 'Rouge'
+        variation.save()
+        self.assertIn('Couleur : Rouge', get_product_context(self.product))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.conversation = create_conversation()
+        same_time = timezone.now()
+        # Horodatages identiques : l'id départage les messages d'une page à l'autre
+        for i in range(7):
+            Message.objects.create(conversation=self.conversation, sender=self.conversation.client, text=f'm{i}')
+        Message.objects.filter(conversation=self.conversation).update(timestamp=same_time)
+
+    def test_pages_cover_history_without_gaps_or_duplicates(self):
+        seen = []
+        cursor = None
+        while True:
+            page = keyset_paginate(self.conversation.messages.all(), ('-timestamp', '-id'), cursor, per_page=3)
+            seen.extend(m.id for m in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        expected = list(self.conversation.messages.order_by('-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_is_rejected(self):
+        with self.assertRaises(InvalidCursor):
+            keyset_paginate(self.conversation.messages.all(), ('-timestamp', '-id'), 'pas-un-curseur')
+
+
+class ConversationInboxSummaryTests(TestCase):
+    def setUp(self):
+        self.conversation = create_conversation()
+        self.client_user = self.conversation.client
+        self.merchant_user = self.conversation.merchant.user
+
+    def test_new_message_updates_summary_and_recipient_counter(self):
+        Message.objects.create(conversation=self.conversation, sender=self.client_user, text='Bonjour')
+        message = Message.objects.create(conversation=self.conversation, sender=self.client_user, text='Je propose 9000 CFA')
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_message_at, message.timestamp)
+        self.assertEqual(self.conversation.last_message_preview, 'Je propose 9000 CFA')
+        self.assertEqual(self.conversation.merchant_unread_count, 2)
+        self.assertEqual(self.conversation.client_unread_count, 0)
+
+        self.conversation.mark_read(self.merchant_user)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.merchant_unread_count, 0)
+
+    def test_inbox_query_count_does_not_depend_on_thread_count(self):
+        self.client.force_login(self.merchant_user)
+        product = self.conversation.product
+
+        def add_threads(count):
+            for i in range(count):
+                buyer = User.objects.create_user(f'acheteur{User.objects.count()}', password='x')
+                conversation = Conversation.objects.create(product=product, client=buyer, merchant=self.conversation.merchant)
+                Message.objects.create(conversation=conversation, sender=buyer, text=f'offre {i}')
+
+        add_threads(2)
+        # Premier passage : le middleware crée l'activité du commerçant
+        self.client.get(reverse('list_conversations'))
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('list_conversations'))
+        add_threads(10)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('list_conversations'))
+        self.assertEqual(len(few), len(many))
+        self.assertContains(response, 'offre 9')
+
+
+class PresenceTrackerTests(TestCase):
+    def setUp(self):
+        self.tracker = PresenceTracker()
+        self.merchants = []
+        for i in range(3):
+            user = User.objects.create_user(f'marchand{i}', password='x')
+            self.merchants.append(Merchant.objects.create(
+                user=user, first_name=f'M{i}', last_name='Test',
+                email=f'm{i}@example.com', phone=f'7000000{i}', country='Mali'
+            ))
+
+    @override_settings(PRESENCE_WRITE_GRANULARITY=30, PRESENCE_FLUSH_INTERVAL=5)
+    def test_heartbeats_within_granularity_are_not_written(self):
+        merchant = self.merchants[0]
+        now = timezone.now()
+        self.assertTrue(self.tracker.record(merchant.id, 'session', now=now))
+        with self.assertNumQueries(0):
+            for seconds in range(1, 30):
+                self.assertFalse(self.tracker.record(merchant.id, 'session', now=now + timedelta(seconds=seconds)))
+        self.assertTrue(self.tracker.record(merchant.id, 'session', now=now + timedelta(seconds=31)))
+
+    @override_settings(PRESENCE_FLUSH_INTERVAL=30)
+    def test_pending_heartbeats_are_flushed_once_the_interval_elapses(self):
+        now = timezone.now()
+        self.tracker._last_flush = now
+        self.tracker.record(self.merchants[0].id, now=now)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.tracker.flush_if_due(now + timedelta(seconds=10)), 0)
+        self.assertEqual(self.tracker.flush_if_due(now + timedelta(seconds=31)), 1)
+        self.assertTrue(MerchantActivity.objects.filter(merchant=self.merchants[0]).exists())
+
+    @override_settings(PRESENCE_WRITE_GRANULARITY=30, PRESENCE_FLUSH_INTERVAL=3600)
+    def test_pending_heartbeats_are_flushed_with_one_update(self):
+        now = timezone.now()
+        for merchant in self.merchants:
+            MerchantActivity.objects.create(merchant=merchant)
+        MerchantActivity.objects.update(is_online=False, last_seen=now - timedelta(hours=1))
+        self.tracker._last_flush = now
+        for merchant in self.merchants:
+            self.tracker.record(merchant.id, f'session-{merchant.id}', now=now)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.tracker.flush(), 3)
+        for activity in MerchantActivity.objects.all():
+            self.assertTrue(activity.is_online)
+            self.assertEqual(activity.last_seen, now)
+            self.assertEqual(activity.last_login, now)
+            self.assertEqual(activity.current_session_key, f'session-{activity.merchant_id}')
+
+    def test_missing_activities_are_created(self):
+        for merchant in self.merchants:
+            self.tracker.record(merchant.id)
+        self.tracker.flush()
+        self.assertEqual(MerchantActivity.objects.filter(is_online=True).count(), 3)
+
+
+class PresenceStoreTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.merchants = []
+        for i in range(3):
+            user = User.objects.create_user(f'marchand{i}', password='x')
+            self.merchants.append(Merchant.objects.create(
+                user=user, first_name=f'M{i}', last_name='Test',
+                email=f'm{i}@example.com', phone=f'7100000{i}', country='Mali'
+            ))
+        self.ids = [merchant.id for merchant in self.merchants]
+
+    def test_statuses_are_served_from_cache(self):
+        presence_store.set_chat_active_merchants([])
+        tracker = PresenceTracker()
+        tracker.record(self.ids[0])
+        presence_store.get_many(self.ids)
+        with self.assertNumQueries(0):
+            presences = presence_store.get_many(self.ids)
+            status = get_merchant_status(self.merchants[0])
+        self.assertTrue(presences[self.ids[0]].is_online)
+        self.assertIsNone(presences[self.ids[1]])
+        self.assertEqual(status['status'], 'en_ligne_actif')
+
+    def test_cache_miss_falls_back_to_database_copy(self):
+        seen = timezone.now() - timedelta(minutes=2)
+        for merchant in self.merchants:
+            MerchantActivity.objects.create(merchant=merchant)
+        MerchantActivity.objects.update(last_seen=seen, is_active_in_chat=True)
+        with self.assertNumQueries(2):
+            presences = presence_store.get_many(self.ids)
+        self.assertEqual(presences[self.ids[2]].last_seen, seen)
+        self.assertTrue(presences[self.ids[2]].is_active_in_chat)
+
+    def test_bulk_status_endpoint(self):
+        PresenceTracker().record(self.ids[1])
+        ids = ','.join(str(merchant_id) for merchant_id in self.ids)
+        self.assertEqual(self.client.get(reverse('merchants_status_api'), {'ids': ids}).status_code, 302)
+        self.client.force_login(self.merchants[0].user)
+        response = self.client.get(reverse('merchants_status_api'), {'ids': ids})
+        statuses = response.json()['statuses']
+        self.assertEqual(set(statuses), {str(merchant_id) for merchant_id in self.ids})
+        self.assertTrue(statuses[str(self.ids[1])]['is_online'])
+        self.assertEqual(statuses[str(self.ids[0])]['status']['status'], 'inconnu')
+        self.assertEqual(self.client.get(reverse('merchants_status_api'), {'ids': 'a,b'}).status_code, 400)
+
+    def test_status_of_unknown_merchant_is_not_found(self):
+        self.client.force_login(self.merchants[0].user)
+        self.assertEqual(self.client.get(reverse('merchant_status_api', args=[self.ids[1]])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('merchant_status_api', args=[max(self.ids) + 1])).status_code, 404)
+
+    def test_negotiation_context_reads_presence_from_cache(self):
+        conversation = create_conversation()
+        MerchantActivity.objects.create(merchant=conversation.merchant)
+        MerchantActivity.objects.update(last_seen=timezone.now() - timedelta(hours=1))
+        # Battement en cache, pas encore écrit en base : l'IA voit le commerçant en ligne
+        presence_store.touch(conversation.merchant.id, timezone.now())
+        context = NegotiationContext.load(conversation.id)
+        self.assertEqual(get_conversation_ai_status(conversation, context)['merchant_status']['status'], 'en_ligne_actif')
+
+
+@override_settings(AI_REPLY_JOB_MAX_ATTEMPTS=3, AI_REPLY_JOB_RETRY_DELAY=30, AI_REPLY_JOB_LOCK_TIMEOUT=300)
+class AIReplyJobTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.conversation = create_conversation()
+        NegotiationSettings.objects.create(shop=self.conversation.product.shop, is_active=True)
+        self.message = Message.objects.create(
+            conversation=self.conversation, sender=self.conversation.client, text='Bonjour, je propose 9000 CFA'
+        )
+
+    def failing_client(self):
+        client = mock.Mock()
+        client.chat.completions.create.side_effect = Exception('timeout')
+        return mock.patch('shop.services.get_openai_client', return_value=client)
+
+    def test_enqueue_and_claim(self):
+        job = enqueue_ai_reply(self.conversation, self.message)
+        self.assertEqual((job.status, job.attempts, job.max_attempts), (AIReplyJob.STATUS_PENDING, 0, 3))
+        claimed = claim_next_job()
+        self.assertEqual((claimed.pk, claimed.status, claimed.attempts), (job.pk, AIReplyJob.STATUS_RUNNING, 1))
+        self.assertIsNone(claim_next_job())
+
+    def test_two_workers_racing_claim_different_jobs(self):
+        first = enqueue_ai_reply(self.conversation, self.message)
+        second = enqueue_ai_reply(self.conversation, self.message)
+        update = QuerySet.update
+        rival = {}
+
+        def racing_update(queryset, **kwargs):
+            if 'job' not in rival:
+                # L'autre worker réserve la même tâche entre la lecture et l'UPDATE
+                rival['job'] = None
+                rival['job'] = claim_next_job()
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', racing_update):
+            claimed = claim_next_job()
+        self.assertEqual((rival['job'].pk, claimed.pk), (first.pk, second.pk))
+        self.assertEqual(list(AIReplyJob.objects.values_list('attempts', flat=True)), [1, 1])
+
+    def test_api_errors_are_retried_with_backoff(self):
+        job = enqueue_ai_reply(self.conversation, self.message)
+        with self.failing_client():
+            for attempt, delay in [(1, 30), (2, 60)]:
+                job = claim_next_job(now=job.run_after)
+                self.assertEqual(process_job(job), AIReplyJob.STATUS_PENDING)
+                job.refresh_from_db()
+                self.assertEqual(job.attempts, attempt)
+                self.assertAlmostEqual((job.run_after - timezone.now()).total_seconds(), delay, delta=5)
+                self.assertIsNone(claim_next_job())
+            job = claim_next_job(now=job.run_after)
+            self.assertEqual(process_job(job), AIReplyJob.STATUS_FAILED)
+        job.refresh_from_db()
+        self.assertEqual(job.last_error, 'timeout')
+        # Après le dernier essai, le client reçoit la réponse de secours
+        self.assertTrue(job.reply_message.is_ai_response)
+
+    def test_stale_jobs_are_requeued_until_attempts_are_exhausted(self):
+        retried = enqueue_ai_reply(self.conversation, self.message)
+        exhausted = enqueue_ai_reply(self.conversation, self.message)
+        locked_at = timezone.now() - timedelta(minutes=10)
+        AIReplyJob.objects.filter(pk=retried.pk).update(status=AIReplyJob.STATUS_RUNNING, locked_at=locked_at, attempts=1)
+        AIReplyJob.objects.filter(pk=exhausted.pk).update(status=AIReplyJob.STATUS_RUNNING, locked_at=locked_at, attempts=3)
+        self.assertEqual(requeue_stale_jobs(), 1)
+        retried.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(retried.status, AIReplyJob.STATUS_PENDING)
+        self.assertEqual(exhausted.status, AIReplyJob.STATUS_FAILED)
+
+    @override_settings(OPENROUTER_API_KEY=None)
+    @mock.patch.dict('os.environ', {'OPENROUTER_API_KEY': ''})
+    def test_worker_command_replies_once(self):
+        job = enqueue_ai_reply(self.conversation, self.message)
+        out = StringIO()
+        call_command('run_ai_worker', '--once', stdout=out)
+        self.assertIn('1 tâche(s)', out.getvalue())
+        job.refresh_from_db()
+        self.assertEqual(job.status, AIReplyJob.STATUS_DONE)
+        self.assertEqual(job.reply_message.sender, self.conversation.merchant.user)
+        self.assertIn('9000', job.reply_message.text)
+
+
+@override_settings(CHAT_STREAM_SIGNAL_INTERVAL=0.01, CHAT_STREAM_POLL_INTERVAL=3600, CHAT_STREAM_MAX_DURATION=2)
+class ConversationStreamTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.conversation = create_conversation()
+        self.first, self.second = [
+            Message.objects.create(conversation=self.conversation, sender=self.conversation.client, text=text)
+            for text in ('Bonjour', 'Je propose 9000 CFA')
+        ]
+        self.url = reverse('conversation_stream', args=[self.conversation.id])
+
+    async def open_stream(self, **extra):
+        client = AsyncClient()
+        await client.aforce_login(self.conversation.client)
+        response = await client.get(self.url, **extra)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return response.streaming_content
+
+    async def next_event_id(self, stream):
+        async for chunk in stream:
+            chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+            if chunk.startswith('id: '):
+                return int(chunk.split('\n')[0][4:])
+        return None
+
+    async def test_stream_resumes_after_since_id(self):
+        stream = await self.open_stream(data={'since_id': self.first.id})
+        self.assertEqual(await self.next_event_id(stream), self.second.id)
+        await stream.aclose()
+
+        stream = await self.open_stream(headers={'last-event-id': str(self.second.id)})
+        reply = await Message.objects.acreate(
+            conversation=self.conversation, sender=self.conversation.merchant.user, text='Offre acceptée'
+        )
+        await sync_to_async(publish_message)(reply)
+        self.assertEqual(await self.next_event_id(stream), reply.id)
+        await stream.aclose()
+
+    async def test_messages_from_other_processes_arrive_through_the_shared_sequence(self):
+        stream = await self.open_stream(data={'since_id': self.second.id})
+        # Message écrit par le worker IA : pas de publication dans ce processus,
+        # seulement la séquence du cache partagé
+        reply, = await Message.objects.abulk_create([Message(
+            conversation=self.conversation, sender=self.conversation.merchant.user, text='Réponse IA', is_ai_response=True
+        )])
+        bump_sequence(conversation_channel(self.conversation.id))
+        self.assertEqual(await self.next_event_id(stream), reply.id)
+        await stream.aclose()
+
+
+class ChatMessagesApiTests(TestCase):
+    def setUp(self):
+        self.conversation = create_conversation()
+        self.first, self.second = [
+            Message.objects.create(conversation=self.conversation, sender=self.conversation.client, text=text)
+            for text in ('Bonjour', 'Je propose 9000 CFA')
+        ]
+        self.client.force_login(self.conversation.client)
+        self.url = reverse('chat_messages_api', args=[self.conversation.id])
+
+    def test_since_id_returns_only_newer_messages(self):
+        data = self.client.get(self.url, {'since_id': self.first.id}).json()
+        self.assertEqual([message['id'] for message in data['messages']], [self.second.id])
+        self.assertEqual((data['last_id'], data['has_more']), (self.second.id, False))
+        data = self.client.get(self.url, {'since_id': self.second.id}).json()
+        self.assertEqual((data['messages'], data['last_id']), ([], self.second.id))
+
+    def test_matching_etag_is_not_modified_without_loading_messages(self):
+        etag = self.client.get(self.url, {'since_id': self.first.id})['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'since_id': self.second.id}, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        message_queries = [q['sql'] for q in queries if '"shop_message"' in q['sql']]
+        # Seul le MAX(id) lu dans l'index touche la table des messages
+        self.assertEqual(len(message_queries), 1)
+        self.assertIn('MAX(', message_queries[0])
+
+        Message.objects.create(conversation=self.conversation, sender=self.conversation.merchant.user, text='Réponse')
+        response = self.client.get(self.url, {'since_id': self.second.id}, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['messages']), 1)
+
+
+@override_settings(AI_KEY_CHECK_TTL=600)
+@mock.patch.dict('os.environ', {'OPENROUTER_API_KEY': 'sk-test'})
+class AIClientRegistryTests(TestCase):
+    def setUp(self):
+        self.registry = AIClientRegistry()
+        self.build = mock.patch.object(AIClientRegistry, '_build_client', side_effect=lambda key: mock.Mock())
+        self.build.start()
+        self.addCleanup(self.build.stop)
+
+    def check_key(self, status):
+        return mock.patch.object(AIClientRegistry, '_check_key', return_value=(status, ''))
+
+    def test_client_and_key_check_are_reused(self):
+        with self.check_key(KEY_VALID) as check:
+            client = self.registry.get_client()
+            self.assertIs(self.registry.get_client(), client)
+        self.assertEqual(check.call_count, 1)
+        self.assertEqual(self.registry.health()['key_status'], KEY_VALID)
+
+    def test_invalid_key_falls_back_until_rechecked(self):
+        with self.check_key(KEY_INVALID):
+            self.assertIsNone(self.registry.get_client())
+        with self.check_key(KEY_VALID) as check:
+            self.assertIsNone(self.registry.get_client())
+            self.registry.invalidate()
+            self.assertIsNotNone(self.registry.get_client())
+        self.assertEqual(check.call_count, 1)
+
+    def test_key_change_rebuilds_the_client(self):
+        with self.check_key(KEY_VALID):
+            client = self.registry.get_client()
+            with mock.patch.dict('os.environ', {'OPENROUTER_API_KEY': 'sk-other'}):
+                self.assertIsNot(self.registry.get_client(), client)
+
+    @mock.patch.dict('os.environ', {'OPENROUTER_API_KEY': ''})
+    @override_settings(OPENROUTER_API_KEY=None)
+    def test_missing_key_returns_no_client(self):
+        self.assertIsNone(self.registry.get_client())
+        self.assertEqual(self.registry.health()['key_status'], KEY_UNCONFIGURED)
+
+    def test_key_check_runs_outside_the_lock(self):
+        held = []
+
+        def check(client):
+            held.append(self.registry._lock.locked())
+            # Un autre thread pendant la vérification : client rendu sans attendre ni revérifier
+            self.assertIsNotNone(self.registry.get_client())
+            return KEY_VALID, ''
+
+        with mock.patch.object(AIClientRegistry, '_check_key', side_effect=check) as checked:
+            self.registry.get_client()
+        self.assertEqual((held, checked.call_count), ([False], 1))
+
+
+class StartupTests(TestCase):
+    def ready(self, argv):
+        """ready() d'une configuration neuve : scheduler, atexit et client IA simulés."""
+        config = ShopConfig('shop', shop_module)
+        with mock.patch.object(sys, 'argv', argv), \
+                mock.patch('shop.apps.BackgroundScheduler') as scheduler, \
+                mock.patch('shop.apps.atexit'), \
+                mock.patch.object(AIClientRegistry, '_build_client') as build:
+            config.ready()
+        build.assert_not_called()
+        return scheduler
+
+    def test_management_commands_start_nothing(self):
+        for command in ('migrate', 'shell', 'test'):
+            self.ready(['manage.py', command]).assert_not_called()
+
+    def test_web_process_starts_the_scheduler_without_the_ai_client(self):
+        scheduler = self.ready(['manage.py', 'runserver'])
+        scheduler.return_value.start.assert_called_once_with()
+        job_ids = [call.kwargs.get('id') for call in scheduler.return_value.add_job.call_args_list]
+        self.assertIn('warm_up_facet_index', job_ids)
+        # Le client IA n'est initialisé que par le worker (run_ai_worker)
+        self.assertNotIn('warm_up_ai_services', job_ids)
+
+    def test_fresh_registry_has_no_client(self):
+        with mock.patch.object(AIClientRegistry, '_build_client') as build:
+            self.assertFalse(AIClientRegistry().health()['client_ready'])
+        build.assert_not_called()
+
+
+class SchedulerLeaseTests(TestCase):
+    def test_only_one_holder_leads_until_the_lease_expires(self):
+        now = timezone.now()
+        self.assertTrue(acquire_lease('test', 'web-1', ttl=90, now=now))
+        self.assertFalse(acquire_lease('test', 'web-2', ttl=90, now=now + timedelta(seconds=30)))
+        self.assertTrue(acquire_lease('test', 'web-1', ttl=90, now=now + timedelta(seconds=30)))
+        self.assertTrue(acquire_lease('test', 'web-2', ttl=90, now=now + timedelta(seconds=121)))
+        self.assertEqual(SchedulerLease.objects.get(name='test').holder, 'web-2')
+
+    def test_release_lets_another_process_take_over(self):
+        self.assertTrue(acquire_lease('test', 'web-1'))
+        release_lease('test', 'web-1')
+        self.assertTrue(acquire_lease('test', 'web-2'))
+
+    def test_scheduled_job_runs_once_across_workers(self):
+        job = mock.Mock()
+        with mock.patch('shop.scheduler.import_string', return_value=job):
+            for holder in ('web-1', 'web-2', 'web-3'):
+                with mock.patch('shop.scheduler.get_holder_id', return_value=holder):
+                    run_as_leader('shop.tasks.check_chat_activity')
+        self.assertEqual(job.call_count, 1)
+
+
+class CheckChatActivityTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.conversation = create_conversation()
+        self.merchant = self.conversation.merchant
+        self.activity = MerchantActivity.objects.create(merchant=self.merchant)
+        idle_user = User.objects.create_user('inactif', password='x')
+        self.idle = Merchant.objects.create(
+            user=idle_user, first_name='Idle', last_name='Test',
+            email='idle@example.com', phone='70000009', country='Mali'
+        )
+        self.idle_activity = MerchantActivity.objects.create(merchant=self.idle, is_active_in_chat=True)
+
+    def test_only_flipped_rows_are_updated(self):
+        Message.objects.create(conversation=self.conversation, sender=self.merchant.user, text='Bonjour')
+        check_chat_activity()
+        self.activity.refresh_from_db()
+        self.idle_activity.refresh_from_db()
+        self.assertTrue(self.activity.is_active_in_chat)
+        self.assertFalse(self.idle_activity.is_active_in_chat)
+        self.assertEqual(last_task_run('check_chat_activity')['activated'], 1)
+
+        check_chat_activity()
+        last_run = last_task_run('check_chat_activity')
+        self.assertEqual((last_run['activated'], last_run['deactivated']), (0, 0))
+        self.assertEqual(presence_store.chat_active_merchants(), {self.merchant.id})
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db')
+class PurgeExpiredSessionsTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        expired = timezone.now() - timedelta(days=1)
+        Session.objects.bulk_create(
+            [Session(session_key=f'expired{i:04d}', session_data='', expire_date=expired) for i in range(25)]
+            + [Session(session_key='active', session_data='', expire_date=timezone.now() + timedelta(days=1))]
+        )
+
+    def test_expired_sessions_are_purged_in_batches(self):
+        self.assertEqual(purge_expired_sessions(batch_size=10, pause=0), 25)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['active'])
+        last_run = last_task_run('purge_expired_sessions')
+        self.assertEqual((last_run['batches'], last_run['complete']), (3, True))
+        # Cache partagé : visible du web, pas seulement du processus runscheduler
+        self.assertEqual(caches['shared'].get('tasks:purge_expired_sessions:last_run'), last_run)
+        self.assertIsNone(cache.get('tasks:purge_expired_sessions:last_run'))
+
+    def test_time_budget_leaves_the_rest_for_the_next_run(self):
+        self.assertEqual(purge_expired_sessions(batch_size=10, time_budget=0, pause=0), 0)
+        self.assertFalse(last_task_run('purge_expired_sessions')['complete'])
+        self.assertEqual(purge_expired_sessions(batch_size=10, pause=0), 25)
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+class CachedSessionProfileTests(TestCase):
+    def test_authenticated_requests_do_not_read_the_session_table(self):
+        caches['sessions'].clear()
+        conversation = create_conversation()
+        self.client.force_login(conversation.client)
+        url = reverse('chat_messages_api', args=[conversation.id])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse([q for q in queries if 'django_session' in q['sql']])
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.conversation = create_conversation()
+        self.shop = self.conversation.product.shop
+        self.described = Product.objects.create(
+            shop=self.shop, name='Pagne wax', description='Se porte avec un boubou brodé', price=Decimal('5000'), stock=3
+        )
+
+    def search(self, query):
+        return list(search_products(Product.objects.all(), query).values_list('name', flat=True))
+
+    def test_index_is_available(self):
+        self.assertEqual(search_backend(), connection.vendor)
+
+    def test_name_match_ranks_before_description_match(self):
+        self.assertEqual(self.search('boubou'), ['Boubou', 'Pagne wax'])
+
+    def test_prefix_and_accent_insensitive_search(self):
+        self.assertEqual(self.search('brode'), ['Pagne wax'])
+        self.assertEqual(self.search('pag'), ['Pagne wax'])
+
+    def test_index_follows_product_changes(self):
+        self.described.name = 'Tissu bazin'
+        self.described.save()
+        self.assertEqual(self.search('bazin'), ['Tissu bazin'])
+        self.assertEqual(self.search('pagne'), [])
+        self.described.delete()
+        self.assertEqual(self.search('bazin'), [])
+
+    def test_search_operators_are_not_interpreted(self):
+        self.assertEqual(self.search('"boubou" * ('), ['Boubou', 'Pagne wax'])
+
+    @override_settings(SEARCH_MAX_RESULTS=3, SEARCH_RANK_CANDIDATES=3)
+    def test_filters_apply_before_the_result_limit(self):
+        clothes = Category.objects.create(name='Vêtements', slug='vetements')
+        Product.objects.filter(pk=self.described.pk).update(category=clothes)
+        # Produits plus récents et mieux classés, hors du filtre
+        for i in range(5):
+            Product.objects.create(shop=self.shop, name=f'Boubou {i}', price=Decimal('1000'), stock=1)
+        filtered = search_products(Product.objects.filter(category=clothes), 'boubou')
+        self.assertEqual([product.name for product in filtered], ['Pagne wax'])
+        self.assertEqual(matching_products(Product.objects.all(), 'boubou').count(), 7)
+
+
+class ProductRatingSummaryTests(TestCase):
+    def setUp(self):
+        self.product = create_conversation().product
+        self.other = Product.objects.create(shop=self.product.shop, name='Pagne', price=Decimal('5000'), stock=3)
+
+    def test_summary_follows_reviews(self):
+        client = User.objects.get(username='client')
+        review = Review.objects.create(product=self.product, user=client, rating=5)
+        Review.objects.create(product=self.product, user=self.product.shop.merchant.user, rating=2)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_avg, self.product.rating_count), (3.5, 2))
+
+        review.rating = 3
+        review.save()
+        review.delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_avg, self.product.rating_count), (2.0, 1))
+
+    def test_rating_filter_and_sort_do_not_read_reviews(self):
+        Review.objects.create(product=self.other, user=User.objects.get(username='client'), rating=4)
+        Product.objects.update(rating_avg=0, rating_count=0)
+        Product.refresh_rating_summary()
+        url = reverse('product_list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'min_rating': 4, 'sort_by': 'rating_desc'})
+        self.assertEqual([product.name for product in response.context['page_obj']], ['Pagne'])
+        self.assertFalse([q for q in queries if 'shop_review' in q['sql']])
+
+
+class CatalogKeysetPaginationTests(TestCase):
+    def setUp(self):
+        shop = create_conversation().product.shop
+        # Prix en double : le tri doit départager par id
+        Product.objects.bulk_create([
+            Product(shop=shop, name=f'Produit {i:02d}', price=Decimal(1000 + (i // 2) * 100), stock=1)
+            for i in range(25)
+        ])
+        self.url = reverse('product_list')
+
+    def names(self, response):
+        return [product.name for product in response.context['page_obj']]
+
+    def test_pages_cover_the_catalog_once(self):
+        seen, params = [], {'sort_by': 'price_desc'}
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url, params)
+            self.assertFalse([q for q in queries if 'OFFSET' in q['sql']])
+            page_obj = response.context['page_obj']
+            seen += self.names(response)
+            if not page_obj.has_next:
+                break
+            params['after'] = page_obj.next_cursor
+        expected = list(Product.objects.order_by('-price', '-id').values_list('name', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_previous_and_last_pages(self):
+        first = self.client.get(self.url)
+        second = self.client.get(self.url, {'after': first.context['page_obj'].next_cursor})
+        back = self.client.get(self.url, {'before': second.context['page_obj'].previous_cursor})
+        self.assertEqual(self.names(back), self.names(first))
+        self.assertFalse(back.context['page_obj'].has_previous)
+
+        last = self.client.get(self.url, {'last': 1})
+        self.assertEqual(self.names(last)[-1], 'Produit 24')
+        self.assertFalse(last.context['page_obj'].has_next)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        first = self.client.get(self.url)
+        cursor = first.context['page_obj'].next_cursor
+        # Curseur d'un autre tri : première page de ce tri
+        response = self.client.get(self.url, {'after': cursor, 'sort_by': 'rating_desc'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['page_obj'].has_previous)
+
+    @override_settings(CATALOG_COUNT_CAP=20)
+    def test_count_is_capped(self):
+        page_obj = self.client.get(self.url).context['page_obj']
+        self.assertEqual((page_obj.count, page_obj.count_capped), (20, True))
+
+
+@override_settings(FACET_INDEX_MIN_AGE=0, FACET_INDEX_BACKGROUND_REBUILD=False, FACET_PRICE_BANDS=[5000, 20000])
+class FacetCountTests(TestCase):
+    def setUp(self):
+        reset_facet_index()
+        self.shop = create_conversation().product.shop
+        self.clothes = Category.objects.create(name='Vêtements', slug='vetements')
+        self.crafts = Category.objects.create(name='Artisanat', slug='artisanat')
+        Product.objects.filter(name='Boubou').update(category=self.clothes)
+        for name, price, category, rating in [
+            ('Pagne', 4000, self.clothes, 4.5),
+            ('Bazin', 25000, self.clothes, 3.0),
+            ('Panier', 3000, self.crafts, 0),
+        ]:
+            Product.objects.create(shop=self.shop, name=name, price=Decimal(price), stock=1,
+                                   category=category, rating_avg=rating)
+
+    def counts(self, facets, facet):
+        return {entry['label']: entry['count'] for entry in facets[facet]}
+
+    def test_counts_match_the_catalog(self):
+        facets = facet_counts()
+        self.assertEqual(self.counts(facets, 'category'), {'Vêtements': 3, 'Artisanat': 1})
+        self.assertEqual(self.counts(facets, 'price_band'), {'Moins de 5 000': 2, '5 000 – 20 000': 1, '20 000 et plus': 1})
+        self.assertEqual(self.counts(facets, 'rating'), {'4 ★ et plus': 1, '3 ★ et plus': 2, '2 ★ et plus': 2, '1 ★ et plus': 2})
+
+    def test_counts_apply_the_other_filters(self):
+        facets = facet_counts(category_slug='vetements', max_price=Decimal('10000'))
+        # La facette catégorie ignore son propre filtre, pas celui du prix
+        self.assertEqual(self.counts(facets, 'category'), {'Vêtements': 2, 'Artisanat': 1})
+        self.assertEqual(self.counts(facets, 'price_band'), {'Moins de 5 000': 1, '5 000 – 20 000': 1})
+        self.assertTrue(facets['category'][0]['selected'])
+
+    def test_free_price_range_matches_the_database(self):
+        Product.objects.bulk_create([
+            Product(shop=self.shop, name=f'Lot {i}', price=Decimal(100 * i), stock=1) for i in range(300)
+        ])
+        reset_facet_index()
+        for min_price, max_price in [(0, 100), (150, 15000), (2500, None), (None, 99), (29900, 29900)]:
+            expected = Product.objects.all()
+            if min_price is not None:
+                expected = expected.filter(price__gte=min_price)
+            if max_price is not None:
+                expected = expected.filter(price__lte=max_price)
+            facets = facet_counts(min_price=min_price, max_price=max_price)
+            self.assertEqual(sum(entry['count'] for entry in facets['price_band']), expected.count())
+
+    def test_search_results_restrict_counts(self):
+        ids = Product.objects.filter(name__in=['Pagne', 'Panier']).values_list('pk', flat=True)
+        self.assertEqual(self.counts(facet_counts(product_ids=ids), 'category'), {'Vêtements': 1, 'Artisanat': 1})
+
+    def test_index_follows_catalog_changes(self):
+        facet_counts()
+        Product.objects.create(shop=self.shop, name='Masque', price=Decimal('8000'), stock=1, category=self.crafts)
+        self.assertEqual(self.counts(facet_counts(), 'category')['Artisanat'], 2)
+
+    def test_rebuild_runs_outside_the_lock(self):
+        facet_counts()
+        Product.objects.create(shop=self.shop, name='Masque', price=Decimal('8000'), stock=1, category=self.crafts)
+        build = facets_module.FacetIndex.build
+        held = []
+
+        def observed_build():
+            held.append(facets_module._lock.locked())
+            return build()
+
+        with mock.patch.object(facets_module.FacetIndex, 'build', side_effect=observed_build):
+            self.assertEqual(self.counts(facet_counts(), 'category')['Artisanat'], 2)
+        self.assertEqual(held, [False])
+
+    def test_product_list_and_api(self):
+        response = self.client.get(reverse('product_list'), {'category_slug': 'artisanat'})
+        self.assertEqual([product.name for product in response.context['page_obj']], ['Panier'])
+        self.assertEqual(self.counts(response.context['facets'], 'category'), {'Vêtements': 3, 'Artisanat': 1})
+        data = self.client.get(reverse('catalog_facets_api'), {'price_band': 0}).json()
+        self.assertEqual({entry['label']: entry['count'] for entry in data['facets']['category']}, {'Vêtements': 1, 'Artisanat': 1})
+
+
+@override_settings(FACET_INDEX_MIN_AGE=0, FACET_INDEX_BACKGROUND_REBUILD=False)
+class CatalogPageCacheTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        reset_facet_index()
+        self.product = create_conversation().product
+        self.shop = self.product.shop
+        ShopSettings.objects.create(shop=self.shop, shareable_link_slug='boutique-awa')
+        self.shop_url = reverse('shop_detail_by_slug', args=['boutique-awa'])
+
+    def test_anonymous_hit_does_not_touch_the_database(self):
+        first = self.client.get(reverse('product_list'), {'sort': 'name'})
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('product_list'), {'sort': 'name', 'q': ''})
+        self.assertEqual(first.content, second.content)
+
+    def test_product_change_refreshes_catalog_and_shop_page(self):
+        self.client.get(reverse('product_list'))
+        self.client.get(self.shop_url)
+        Product.objects.filter(pk=self.product.pk).first().save(update_fields=['name'])
+        Product.objects.create(shop=self.shop, name='Pagne tissé', price=Decimal('4000'), stock=2)
+        self.assertContains(self.client.get(reverse('product_list')), 'Pagne tissé')
+        self.assertContains(self.client.get(self.shop_url), 'Pagne tissé')
+
+    def test_hero_change_keeps_shop_page_cached(self):
+        self.client.get(self.shop_url)
+        HeroSlide.objects.create(title='Soldes', image='hero_slides/soldes.jpg')
+        with self.assertNumQueries(0):
+            self.client.get(self.shop_url)
+        self.assertContains(self.client.get(reverse('product_list')), 'Soldes')
+
+    def test_logged_in_users_are_not_served_from_cache(self):
+        self.client.get(reverse('product_list'))
+        self.client.force_login(User.objects.get(username='client'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('product_list'))
+        self.assertGreater(len(queries), 0)
+
+    def test_category_page_filters_the_catalog(self):
+        crafts = Category.objects.create(name='Artisanat', slug='artisanat')
+        Product.objects.create(shop=self.shop, name='Panier', price=Decimal('3000'), stock=1, category=crafts)
+        response = self.client.get(reverse('products_by_category', args=['artisanat']))
+        self.assertEqual([product.name for product in response.context['page_obj']], ['Panier'])
+
+    def test_params_are_normalized(self):
+        request = mock.Mock(GET=QueryDict('sort=price_asc&category_slug=&q=pagne'))
+        self.assertEqual(normalized_params(request), 'q=pagne&sort=price_asc')
+
+
+class CheckoutTests(TestCase):
+    shipping = {'full_name': 'Fanta Diallo', 'email': 'fanta@example.com', 'city': 'Bamako',
+                'address': 'Rue 12', 'zipcode': '0000'}
+
+    def setUp(self):
+        self.product = create_conversation().product
+        self.buyer = User.objects.get(username='client')
+        self.cart = Cart.objects.create(user=self.buyer)
+
+    def fill_cart(self, size):
+        for i in range(size):
+            product = Product.objects.create(shop=self.product.shop, name=f'Pagne {i}', price=Decimal('2000'), stock=5)
+            variation = ProductVariation.objects.create(product=product, type='Taille', value='M', stock_variation=3)
+            item = CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+            item.selected_variations.set([variation])
+
+    def checkout_queries(self, size):
+        self.fill_cart(size)
+        with CaptureQueriesContext(connection) as queries:
+            place_order(self.cart, self.buyer, self.shipping)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        self.assertEqual(self.checkout_queries(1), self.checkout_queries(6))
+
+    def test_order_copies_cart_and_decrements_stock(self):
+        self.fill_cart(2)
+        order = place_order(self.cart, self.buyer, self.shipping)
+        self.assertEqual(order.city, 'Bamako')
+        self.assertEqual(list(Product.objects.filter(name__startswith='Pagne').values_list('stock', flat=True)), [3, 3])
+        self.assertEqual(list(ProductVariation.objects.values_list('stock_variation', flat=True)), [1, 1])
+        item = OrderItem.objects.filter(order=order).first()
+        self.assertEqual(item.selected_variations.get().value, 'M')
+        self.assertEqual(item.variations_data['variations'][0]['type'], 'Taille')
+        self.assertFalse(self.cart.items.exists())
+
+    def test_order_invalidates_only_sold_out_shop_pages(self):
+        shop_namespace = page_cache.shop_namespace(self.product.shop_id)
+        self.fill_cart(1)
+        versions = get_versions([page_cache.PRODUCTS, shop_namespace])
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(self.cart, self.buyer, self.shipping)
+        self.assertEqual(get_versions([page_cache.PRODUCTS, shop_namespace]), versions)
+
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(self.cart, self.buyer, self.shipping)
+        self.assertEqual(get_version(page_cache.PRODUCTS), versions[page_cache.PRODUCTS])
+        self.assertNotEqual(get_version(shop_namespace), versions[shop_namespace])
+
+    def test_insufficient_stock_writes_nothing(self):
+        self.fill_cart(1)
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=4)
+        with self.assertRaises(OutOfStock) as raised:
+            place_order(self.cart, self.buyer, self.shipping)
+        self.assertEqual(raised.exception.products, [('Boubou', 3, 4)])
+        self.assertEqual(Product.objects.get(name='Pagne 0').stock, 5)
+        self.assertEqual(self.cart.items.count(), 2)
+        self.assertFalse(OrderItem.objects.exists())
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.product = create_conversation().product  # stock : 3
+        self.first = Cart.objects.create(user=User.objects.get(username='client'))
+        self.second = Cart.objects.create(user=User.objects.create_user('cliente2', password='x'))
+        CartItem.objects.create(cart=self.first, product=self.product, quantity=3)
+        CartItem.objects.create(cart=self.second, product=self.product, quantity=1)
+
+    def available(self):
+        return with_available_stock(Product.objects.filter(pk=self.product.pk)).get().available_stock
+
+    def test_hold_blocks_other_carts_until_it_expires(self):
+        hold_cart(self.first)
+        self.assertEqual(self.available(), 0)
+        with self.assertRaises(OutOfStock):
+            hold_cart(self.second)
+        with self.assertRaises(OutOfStock):
+            place_order(self.second, self.second.user, {})
+        # Une réservation expirée ne compte plus, avant même d'être purgée
+        hold_cart(self.second, now=timezone.now() + timedelta(hours=1))
+        self.assertEqual(StockReservation.objects.filter(cart=self.second).count(), 1)
+
+    def test_holder_can_place_the_order(self):
+        hold_cart(self.first)
+        place_order(self.first, self.first.user, {})
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_reloading_checkout_does_not_extend_the_hold(self):
+        started = timezone.now()
+        expires_at = hold_cart(self.first, now=started)
+        self.assertEqual(hold_cart(self.first, now=started + timedelta(minutes=10)), expires_at)
+        self.assertEqual(StockReservation.objects.get(cart=self.first).expires_at, expires_at)
+        # Panier modifié : nouvelle réservation
+        self.first.items.update(quantity=2)
+        self.assertGreater(hold_cart(self.first, now=started + timedelta(minutes=10)), expires_at)
+        self.assertEqual(StockReservation.objects.get(cart=self.first).quantity, 2)
+
+    def test_product_page_ignores_the_visitor_own_hold(self):
+        hold_cart(self.first)
+        url = reverse('product_detail', args=[self.product.pk])
+        self.client.force_login(self.first.user)
+        self.assertEqual(self.client.get(url).context['product'].available_stock, 3)
+        self.client.force_login(self.second.user)
+        self.assertEqual(self.client.get(url).context['product'].available_stock, 0)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).context['product'].available_stock, 0)
+
+    def test_janitor_removes_expired_holds_in_batches(self):
+        hold_cart(self.first, ttl=60, now=timezone.now() - timedelta(minutes=5))
+        hold_cart(self.second)
+        expired = expire_reservations(batch_size=1)
+        self.assertEqual(expired, 1)
+        self.assertEqual(list(StockReservation.objects.values_list('cart', flat=True)), [self.second.pk])
+
+
+class AddToCartTests(TestCase):
+    def setUp(self):
+        self.product = create_conversation().product
+        self.size = ProductVariation.objects.create(product=self.product, type='Taille', value='M', stock_variation=2)
+        self.color = ProductVariation.objects.create(product=self.product, type='Couleur', value='Bleu', stock_variation=2)
+        self.client.force_login(User.objects.get(username='client'))
+        self.url = reverse('add_to_cart', args=[self.product.id])
+
+    def test_same_variations_share_one_line(self):
+        self.client.post(self.url, {'variations': [self.size.id, self.color.id]})
+        self.client.post(self.url, {'variations': [self.color.id, self.size.id]})
+        self.client.post(self.url, {'variations': [self.size.id]})
+        lines = CartItem.objects.order_by('pk')
+        self.assertEqual([(line.variation_signature, line.quantity) for line in lines], [
+            (CartItem.signature_for([self.size.id, self.color.id]), 2), (str(self.size.id), 1),
+        ])
+        self.assertEqual(set(lines[0].selected_variations.all()), {self.size, self.color})
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        def queries_for_one_click():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(self.url, {'variations': [self.size.id]})
+            return len(queries)
+
+        queries_for_one_click()
+        before = queries_for_one_click()
+        for i in range(5):
+            other = Product.objects.create(shop=self.product.shop, name=f'Pagne {i}', price=Decimal('2000'), stock=5)
+            self.client.post(reverse('add_to_cart', args=[other.id]))
+        self.assertEqual(queries_for_one_click(), before)
+
+
+class LineTotalsTests(TestCase):
+    def setUp(self):
+        self.product = create_conversation().product  # 10000 CFA
+        self.buyer = User.objects.get(username='client')
+        self.cart = Cart.objects.create(user=self.buyer)
+        self.client.force_login(self.buyer)
+
+    def add_lines(self, count):
+        for i in range(count):
+            product = Product.objects.create(shop=self.product.shop, name=f'Pagne {i}', price=Decimal('1000'), stock=100)
+            variation = ProductVariation.objects.create(
+                product=product, type='Taille', value='XL', price_modifier=Decimal('250'), stock_variation=5
+            )
+            item = CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+            item.selected_variations.set([variation])
+
+    def test_totals_include_variations(self):
+        self.add_lines(2)
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        self.assertEqual(sorted(item.line_total for item in CartItem.objects.with_totals()),
+                         [Decimal('2500'), Decimal('2500'), Decimal('10000')])
+        order = place_order(self.cart, self.buyer, {})
+        order = Order.objects.with_totals().get(pk=order.pk)
+        self.assertEqual((order.get_cart_total, order.get_cart_items), (Decimal('15000'), 5))
+        self.assertEqual(Order.objects.get(pk=order.pk).get_cart_total, Decimal('15000'))
+
+    def test_cart_pages_render_in_constant_queries(self):
+        counts = []
+        for lines in (2, 48):
+            self.add_lines(lines)
+            for name in ('cart_detail', 'checkout_view'):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+                counts.append(len(queries))
+        self.assertEqual(counts[:2], counts[2:])
+
+
+class OrderPriceSnapshotTests(TestCase):
+    def setUp(self):
+        self.product = create_conversation().product  # 10000 CFA
+        self.buyer = User.objects.get(username='client')
+        cart = Cart.objects.create(user=self.buyer)
+        variation = ProductVariation.objects.create(
+            product=self.product, type='Taille', value='XL', price_modifier=Decimal('500'), stock_variation=1
+        )
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2).selected_variations.set([variation])
+        self.order = place_order(cart, self.buyer, {})
+
+    def test_price_change_does_not_rewrite_history(self):
+        Product.objects.filter(pk=self.product.pk).update(price=Decimal('99999'))
+        item = OrderItem.objects.get(order=self.order)
+        self.assertEqual((item.unit_price, item.variation_total, item.line_total),
+                         (Decimal('10000'), Decimal('500'), Decimal('21000')))
+        self.client.force_login(User.objects.get(username='marchand'))
+        context = self.client.get(reverse('dashboard')).context
+        self.assertEqual(context['total_revenue'], Decimal('21000'))
+        self.assertEqual(json.loads(context['top_products_data_json']), [{'name': 'Boubou', 'quantity': 2}])
+
+    def test_lines_created_outside_checkout_are_priced_on_save(self):
+        # Ligne ajoutée depuis l'admin : prix figés à l'enregistrement, comptés dans les totaux
+        item = OrderItem.objects.create(order=self.order, product=self.product, quantity=1)
+        self.assertEqual((item.shop_id, item.unit_price, item.line_total),
+                         (self.product.shop_id, Decimal('10000'), Decimal('10000')))
+        self.assertEqual(Order.objects.with_totals().get(pk=self.order.pk).cart_total, Decimal('31000'))
+
+    def test_quantity_change_updates_the_line_total(self):
+        item = OrderItem.objects.get(order=self.order)
+        Product.objects.filter(pk=self.product.pk).update(price=Decimal('99999'))
+        item.quantity = 3
+        item.save(update_fields=['quantity'])
+        item.refresh_from_db()
+        self.assertEqual((item.unit_price, item.variation_total, item.line_total),
+                         (Decimal('10000'), Decimal('500'), Decimal('31500')))
+
+    def test_admin_line_prices_its_variations(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        variation = ProductVariation.objects.get(product=self.product)
+        response = self.client.post(reverse('admin:shop_orderitem_add'), {
+            'product': self.product.pk, 'order': self.order.pk, 'quantity': 2, 'variations_data': '{}',
+            'orderitemvariation_set-TOTAL_FORMS': 1, 'orderitemvariation_set-INITIAL_FORMS': 0,
+            'orderitemvariation_set-0-variation': variation.pk,
+        })
+        self.assertEqual(response.status_code, 302)
+        item = OrderItem.objects.latest('pk')
+        self.assertEqual((item.variation_total, item.line_total), (Decimal('500'), Decimal('21000')))
+
+    def test_backfill_command_prices_lines_loaded_without_save(self):
+        item, = OrderItem.objects.bulk_create([OrderItem(
+            order=self.order, product=self.product, quantity=3,
+            unit_price=Decimal('10000'), variation_total=Decimal('0'), line_total=Decimal('0'),
+        )])
+        out = StringIO()
+        call_command('backfill_order_prices', stdout=out)
+        item.refresh_from_db()
+        self.assertEqual((item.shop_id, item.line_total), (self.product.shop_id, Decimal('30000')))
+        self.assertIn('1 lignes de commande figées', out.getvalue())
+        # Les lignes déjà cohérentes ne sont pas touchées
+        call_command('backfill_order_prices', stdout=out)
+        self.assertIn('0 lignes de commande figées', out.getvalue())
@@ -46,6 +46,9 @@ urlpatterns = [
     path('chat/<int:conversation_id>/', views.conversation_detail_view, name='conversation_detail'),
     path('chat/', views.list_conversations_view, name='list_conversations'),
     path('api/chat/<int:conversation_id>/', views.chat_api, name='chat_api'),
+    path('api/chat/<int:conversation_id>/messages/', views.chat_messages_api, name='chat_messages_api'),
+    path('api/chat/<int:conversation_id>/messages/older/', views.chat_older_messages_api, name='chat_older_messages_api'),
+    path('api/chat/<int:conversation_id>/stream/', views.conversation_stream, name='conversation_stream'),
     # Ajoutez cette ligne dans urlpatterns
     path('chat/<int:conversation_id>/negocier/', views.negotiation_chat, name='negotiation_chat'),
     # Ajoutez cette ligne dans urlpatterns
@@ -71,6 +74,8 @@ urlpatterns = [
     path('ma-commande/<int:order_id>/', views.client_order_detail, name='client_order_detail'),
     path('api/product/<int:product_id>/variations/', views.get_product_variations, name='product_variations_api'),
     path('api/merchant/<int:merchant_id>/status/', views.merchant_status_api, name='merchant_status_api'),
+    path('api/merchants/status/', views.merchants_status_api, name='merchants_status_api'),
+    path('api/catalog/facets/', views.catalog_facets_api, name='catalog_facets_api'),
     path('api/my-status/', views.my_status_api, name='my_status_api'),
     path('test-ai/', views.test_ai_service, name='test_ai_service'),
 
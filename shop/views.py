@@ -2,19 +2,19 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from .models import Product, Conversation, Message, Merchant, HeroSlide, Client
-from django.http import JsonResponse, HttpResponseForbidden
+from django.http import Http404, JsonResponse, HttpResponseForbidden, HttpResponseNotModified, StreamingHttpResponse
 import json
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.db import IntegrityError
-from django.db.models import Sum, F, Avg, Q
-from .models import Merchant, Shop, Product, ProductImage, ProductVideo, Cart, CartItem, Order, OrderItem, Category, SubCategory, Review, NegotiationSettings, ShopSettings, Client, ProductVariation, VariationOption,VariationGroup
+from django.db import IntegrityError, transaction
+from django.db.models import Sum, F, Avg, Max, Prefetch
+from .models import Merchant, Shop, Product, ProductImage, ProductVideo, Cart, CartItem, Order, OrderItem, Category, SubCategory, Review, NegotiationSettings, ShopSettings, Client, ProductVariation, VariationOption,VariationGroup, CartItemVariation
 from django.core.files.storage import FileSystemStorage
 from decimal import Decimal, InvalidOperation
 import json
-from datetime import date, timedelta
+from datetime import timedelta
 from django.views.decorators.http import require_POST
 from django.db.models.functions import TruncDay
 from django.core.paginator import Paginator
@@ -23,10 +23,44 @@ from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth import login, authenticate, logout
 import re
+import asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
+from .realtime import get_broker, channel_sequence, conversation_channel
+from .pagination import keyset_paginate, paginate_request, capped_count, InvalidCursor
+from .presence import presence_store
+from .search import matching_products, search_products
+from .facets import facet_counts, price_band_range
+from .checkout import place_order, OutOfStock
+from .reservations import hold_cart, with_available_stock
+from . import page_cache
+from .page_cache import cached_catalog_page, catalog_namespaces, shop_page_namespaces, cached_list
 
 # Configuration du logger
 logger = logging.getLogger(__name__)
 
+# Nombre maximum de messages renvoyés par un appel à l'API de chat incrémentale
+CHAT_MESSAGES_API_LIMIT = 100
+# Nombre de messages récents affichés à l'ouverture d'une conversation (puis "charger plus")
+CHAT_HISTORY_PAGE_SIZE = 50
+# Nombre de conversations par page de la boîte de réception
+INBOX_PAGE_SIZE = 30
+# Nombre de produits par page du catalogue
+CATALOG_PAGE_SIZE = 12
+SHOP_CATALOG_PAGE_SIZE = 20
+# Tris du catalogue (paramètre sort_by) : le dernier champ, unique, départage les ex aequo
+CATALOG_ORDERINGS = {
+    'name': ('name', 'id'),
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+    'rating_desc': ('-rating_avg', '-rating_count', '-id'),
+    'oldest': ('id',),
+}
+# Tri d'une recherche indexée (voir shop/search.py)
+CATALOG_RELEVANCE_ORDERING = ('search_rank', 'id')
+
 # Fonctions utilitaires pour vérifier le type d'utilisateur
 def is_merchant(user):
     return user.is_authenticated and hasattr(user, 'merchant')
@@ -133,13 +167,11 @@ def dashboard(request):
         
         # Récupère les statistiques
         total_products = Product.objects.filter(shop=shop).count()
-        total_orders = Order.objects.filter(orderitem__product__shop=shop).distinct().count()
+        total_orders = Order.objects.filter(orderitem__shop=shop).distinct().count()
         
-        # Calcul du revenu total
-        order_items = OrderItem.objects.filter(product__shop=shop, order__complete=True)
-        total_revenue = order_items.aggregate(
-            total=Sum(F('product__price') * F('quantity'))
-        )['total'] or 0
+        # Calcul du revenu total (prix figés à la commande, voir OrderItem.line_total)
+        order_items = OrderItem.objects.filter(shop=shop, order__complete=True)
+        total_revenue = order_items.aggregate(total=Sum('line_total'))['total'] or 0
         
         # Données pour les graphiques (exemple des 7 derniers jours)
         from django.db.models.functions import TruncDay
@@ -150,13 +182,13 @@ def dashboard(request):
         
         revenue_data = (
             OrderItem.objects.filter(
-                product__shop=shop,
+                shop=shop,
                 order__complete=True,
                 date_added__gte=start_date
             )
             .annotate(day=TruncDay('date_added'))
             .values('day')
-            .annotate(revenue=Sum(F('product__price') * F('quantity')))
+            .annotate(revenue=Sum('line_total'))
             .order_by('day')
         )
         
@@ -168,17 +200,25 @@ def dashboard(request):
                 'revenue': float(item['revenue']) if item['revenue'] else 0.0
             })
         
-        # Produits les plus vendus
-        top_products = (
-            OrderItem.objects.filter(product__shop=shop, order__complete=True)
-            .values('product__name')
+        # Produits les plus vendus : regroupés par product_id (sans jointure), noms lus ensuite
+        top_products = list(
+            OrderItem.objects.filter(shop=shop, order__complete=True)
+            .values('product_id')
             .annotate(quantity=Sum('quantity'))
             .order_by('-quantity')[:5]
         )
+        product_names = Product.objects.only('name').in_bulk([row['product_id'] for row in top_products if row['product_id']])
+        top_products_data = [
+            {
+                'name': product_names[row['product_id']].name if row['product_id'] in product_names else 'Produit supprimé',
+                'quantity': row['quantity'],
+            }
+            for row in top_products
+        ]
         
         # Conversion en JSON pour le template
         revenue_data_json = json.dumps(revenue_data_list)
-        top_products_data_json = json.dumps(list(top_products))
+        top_products_data_json = json.dumps(top_products_data)
         
         context = {
             'is_merchant': True,
@@ -467,7 +507,7 @@ def manage_orders(request):
     try:
         merchant = request.user.merchant
         shop = merchant.shop
-        orders = Order.objects.filter(orderitem__product__shop=shop).distinct().order_by('-date_ordered')
+        orders = Order.objects.with_totals().filter(orderitem__shop=shop).distinct().order_by('-date_ordered')
         context = {
             'orders': orders,
             'is_merchant': True,
@@ -572,16 +612,33 @@ def configure_negotiation(request):
     }
     return render(request, 'configure_negotiation.html', context)
 
+def catalog_page(request, products, default_sort='name', per_page=CATALOG_PAGE_SIZE):
+    """
+    Page du catalogue par curseur (?after / ?before / ?last), triée selon
+    ?sort_by ; une recherche indexée est triée par pertinence par défaut.
+    Le total affiché est plafonné à CATALOG_COUNT_CAP (0 : pas de total).
+    """
+    ordering = CATALOG_ORDERINGS.get(request.GET.get('sort_by'))
+    if ordering is None:
+        if 'search_rank' in products.query.annotations:
+            ordering = CATALOG_RELEVANCE_ORDERING
+        else:
+            ordering = CATALOG_ORDERINGS[default_sort]
+    page_obj = paginate_request(request, products, ordering, per_page)
+    count_cap = getattr(settings, 'CATALOG_COUNT_CAP', 0)
+    if count_cap:
+        page_obj.count, page_obj.count_capped = capped_count(products, count_cap)
+    return page_obj
+
 def product_search_list(request):
     query = request.GET.get('q')
     products = Product.objects.all()
     
     if query:
-        products = products.filter(Q(name__icontains=query) | Q(description__icontains=query))
+        # Résultats classés par pertinence (index plein texte, voir shop/search.py)
+        products = search_products(products, query)
     
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = catalog_page(request, products)
     
     context = {
         'page_obj': page_obj,
@@ -608,7 +665,10 @@ def visit_shops(request):
 
 # MODIFICATION de product_detail pour inclure les variations organisées
 def product_detail(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
+    # available_stock : stock moins les unités réservées par les paiements en cours
+    # des autres paniers (celles du panier de l'utilisateur restent à lui)
+    cart = Cart.objects.filter(user=request.user).first() if request.user.is_authenticated else None
+    product = get_object_or_404(with_available_stock(Product.objects.all(), exclude_cart=cart), id=product_id)
     
     # Récupération des avis et de la note moyenne
     reviews = Review.objects.filter(product=product).order_by('-date_created')
@@ -666,60 +726,104 @@ def add_review(request, product_id):
     
     return redirect('product_detail', product_id=product_id)
 
-def product_list(request):
-    # Récupération de tous les produits, puis application des filtres
-    products = Product.objects.all().order_by('name')
-    categories = Category.objects.all()
-    
-    # Récupérer les slides hero actifs
-    hero_slides = HeroSlide.objects.filter(is_active=True).order_by('order')[:5]
-    
-    # 1. Filtre par recherche (champ 'q')
-    query = request.GET.get('q')
-    if query:
-        products = products.filter(Q(name__icontains=query) | Q(description__icontains=query))
-
-    # 2. Filtre par prix
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    if min_price:
+def catalog_filters(request):
+    """Filtres du catalogue lus dans la requête GET ; une valeur invalide est ignorée."""
+    params = request.GET
+    filters = {
+        'category_slug': params.get('category_slug') or None,
+        'subcategory_slug': params.get('subcategory_slug') or None,
+        'shop': None,
+        'price_band': None,
+        'min_rating': None,
+        'min_price': None,
+        'max_price': None,
+    }
+    for name in ('shop', 'price_band', 'min_rating'):
         try:
-            products = products.filter(price__gte=Decimal(min_price))
-        except (InvalidOperation, ValueError):
+            filters[name] = int(params[name]) if params.get(name) else None
+        except ValueError:
             pass
-    if max_price:
+    if filters['price_band'] is not None:
         try:
-            products = products.filter(price__lte=Decimal(max_price))
+            price_band_range(filters['price_band'])
+        except ValueError:
+            filters['price_band'] = None
+    for name in ('min_price', 'max_price'):
+        try:
+            value = Decimal(params[name]) if params.get(name) else None
         except (InvalidOperation, ValueError):
-            pass
+            continue
+        if value is not None and value.is_finite():
+            filters[name] = value
+    return filters
+
+def filter_catalog(products, filters):
+    """Applique à `products` les filtres renvoyés par catalog_filters()."""
+    if filters['min_price'] is not None:
+        products = products.filter(price__gte=filters['min_price'])
+    if filters['max_price'] is not None:
+        products = products.filter(price__lte=filters['max_price'])
+    if filters['min_rating'] is not None:
+        products = products.filter(rating_avg__gte=filters['min_rating'])
+    if filters['category_slug']:
+        products = products.filter(category__slug=filters['category_slug'])
+    if filters['subcategory_slug']:
+        products = products.filter(subcategory__slug=filters['subcategory_slug'])
+    if filters['shop'] is not None:
+        products = products.filter(shop_id=filters['shop'])
+    if filters['price_band'] is not None:
+        low, high = price_band_range(filters['price_band'])
+        if low is not None:
+            products = products.filter(price__gte=low)
+        if high is not None:
+            products = products.filter(price__lt=high)
+    return products
+
+def active_hero_slides():
+    return cached_list(
+        page_cache.HERO, 'active_slides',
+        lambda: HeroSlide.objects.filter(is_active=True).select_related('product').order_by('order')[:5]
+    )
+
+def all_categories():
+    return cached_list(
+        page_cache.CATEGORIES, 'all', lambda: Category.objects.prefetch_related('subcategories')
+    )
+
+@cached_catalog_page(catalog_namespaces)
+def product_list(request, category_slug=None):
+    # Récupération de tous les produits, puis application des filtres
+    products = Product.objects.all()
+    categories = all_categories()
+    
+    # Slides hero actifs (cache invalidé par les signaux de HeroSlide)
+    hero_slides = active_hero_slides()
+    
+    # 1. Filtres : prix, note, catégorie, sous-catégorie, boutique, tranche de prix
+    filters = catalog_filters(request)
+    if category_slug:
+        # Appel depuis products_by_category
+        filters['category_slug'] = category_slug
+    products = filter_catalog(products, filters)
 
-    # 3. Filtre par note moyenne (rating)
-    min_rating = request.GET.get('min_rating')
-    if min_rating:
-        products = products.annotate(avg_rating=Avg('reviews__rating')).filter(avg_rating__gte=int(min_rating))
+    # 2. Recherche (champ 'q') dans les produits filtrés : tri par pertinence, sauf si 'sort_by' est donné
+    query = request.GET.get('q')
+    search_ids = None
+    if query:
+        products = search_products(products, query)
+        search_ids = matching_products(Product.objects.all(), query).values_list('pk', flat=True)
 
-    # 4. Filtre par catégorie (la vue est réutilisée)
-    category_slug = request.GET.get('category_slug')
-    if category_slug:
-        products = products.filter(category__slug=category_slug)
+    # 3. Compteurs des facettes pour ces filtres (index en mémoire, voir shop/facets.py)
+    facets = facet_counts(**filters, product_ids=search_ids)
         
-    # 5. Trie
-    sort_by = request.GET.get('sort_by')
-    if sort_by == 'price_asc':
-        products = products.order_by('price')
-    elif sort_by == 'price_desc':
-        products = products.order_by('-price')
-    elif sort_by == 'rating_desc':
-        products = products.annotate(avg_rating=Avg('reviews__rating')).order_by('-avg_rating')
-        
-    # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # 5. Tri (sort_by) et pagination par curseur
+    page_obj = catalog_page(request, products)
     
     context = {
         'page_obj': page_obj,
         'categories': categories,
+        'facets': facets,
+        'filters': filters,
         'hero_slides': hero_slides,
         'is_merchant': is_merchant(request.user),
         'is_client': is_client(request.user),
@@ -728,20 +832,19 @@ def product_list(request):
     return render(request, 'product_list.html', context)
 
 # Vue pour les produits par catégorie
+@cached_catalog_page(catalog_namespaces)
 def products_by_category(request, category_slug):
     category = get_object_or_404(Category, slug=category_slug)
-    # Réutilisation de la vue product_list avec le filtre de catégorie
-    return product_list(request, category_slug=category_slug)
+    # Réutilisation de la vue product_list (sans son cache : la page est déjà mise en cache ici)
+    return product_list.__wrapped__(request, category_slug=category_slug)
 
 # Vue pour les produits par sous-catégorie
 def products_by_subcategory(request, category_slug, subcategory_slug):
     subcategory = get_object_or_404(SubCategory, slug=subcategory_slug)
-    products = Product.objects.filter(subcategory=subcategory).order_by('name')
+    products = Product.objects.filter(subcategory=subcategory)
     categories = Category.objects.all()
     
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = catalog_page(request, products)
     
     context = {
         'page_obj': page_obj,
@@ -758,15 +861,28 @@ def products_by_subcategory(request, category_slug, subcategory_slug):
 def product_search(request):
     return product_list(request)
 
+def line_items(queryset):
+    """
+    Lignes de panier ou de commande avec produit, boutique, variations et
+    images : nombre de requêtes constant. Les lignes de panier arrivent
+    annotées par with_totals() ; celles de commande ont leurs totaux figés.
+    """
+    return queryset.select_related('product__shop__merchant').prefetch_related(
+        'selected_variations', Prefetch('product__images', queryset=ProductImage.objects.order_by('pk'))
+    )
+
 @login_required(login_url='login_view')
 def cart_detail(request):
     try:
         cart = Cart.objects.get(user=request.user)
     except Cart.DoesNotExist:
         cart = Cart.objects.create(user=request.user)
+    items = list(line_items(cart.items.with_totals().order_by('pk')))
         
     context = {
         'cart': cart, 
+        'items': items,
+        'total': sum(item.line_total for item in items),
         'is_merchant': is_merchant(request.user),
         'is_client': is_client(request.user),
         'user_type': get_user_type(request.user)
@@ -781,7 +897,7 @@ def add_to_cart(request, product_id):
     
     # NOUVEAU : Récupérer les variations sélectionnées
     selected_variation_ids = request.POST.getlist('variations')
-    selected_variations = ProductVariation.objects.filter(id__in=selected_variation_ids)
+    selected_variations = ProductVariation.objects.filter(id__in=selected_variation_ids).select_related('product')
     
     # NOUVEAU : Vérifier la disponibilité des variations
     for variation in selected_variations:
@@ -789,28 +905,22 @@ def add_to_cart(request, product_id):
             messages.error(request, f"La variation {variation.type}: {variation.value} n'est plus en stock.")
             return redirect('product_detail', product_id=product_id)
     
-    # NOUVEAU : Créer une clé unique pour cet article avec ses variations
-    variation_keys = sorted([f"{v.id}" for v in selected_variations])
-    cart_key = f"{product_id}_{'_'.join(variation_keys)}"
-    
-    # NOUVEAU : Vérifier si l'article avec ces variations existe déjà
-    existing_item = None
-    for item in cart.items.all():
-        item_variation_keys = sorted([f"{v.id}" for v in item.selected_variations.all()])
-        item_key = f"{item.product.id}_{'_'.join(item_variation_keys)}"
-        if item_key == cart_key:
-            existing_item = item
-            break
-    
-    if existing_item:
-        # Incrémenter la quantité si l'article existe déjà
-        existing_item.quantity += 1
-        existing_item.save()
-    else:
-        # Créer un nouvel article
-        cart_item = CartItem.objects.create(cart=cart, product=product, quantity=1)
-        cart_item.selected_variations.set(selected_variations)
-        cart_item.save()
+    # Une ligne par combinaison de variations, retrouvée par l'index unique (panier, produit, signature)
+    line = {
+        'cart': cart,
+        'product': product,
+        'variation_signature': CartItem.signature_for(v.id for v in selected_variations),
+    }
+    if not CartItem.objects.filter(**line).update(quantity=F('quantity') + 1):
+        try:
+            with transaction.atomic():
+                cart_item = CartItem.objects.create(quantity=1, **line)
+                CartItemVariation.objects.bulk_create([
+                    CartItemVariation(cart_item=cart_item, variation=variation) for variation in selected_variations
+                ])
+        except IntegrityError:
+            # Ligne créée entre-temps par une requête concurrente (double clic)
+            CartItem.objects.filter(**line).update(quantity=F('quantity') + 1)
     
     messages.success(request, "Produit ajouté au panier avec succès!")
     return redirect('cart_detail')
@@ -864,16 +974,26 @@ def checkout_view(request):
     except Cart.DoesNotExist:
         return redirect('cart_detail')
     
+    # Vérifie si l'utilisateur a un panier avec des articles
+    items = list(line_items(cart.items.with_totals().order_by('pk')))
+    if not items:
+        return redirect('cart_detail')
     # Calcule le total
-    total = sum([item.get_total for item in cart.items.all()])
+    total = sum(item.line_total for item in items)
     
-    # Vérifie si l'utilisateur a un panier avec des articles
-    if not cart.items.exists():
+    # Retient les unités du panier le temps du paiement (voir shop/reservations.py)
+    try:
+        reserved_until = hold_cart(cart)
+    except OutOfStock as e:
+        for name, available, requested in e.products:
+            messages.error(request, f"Stock insuffisant pour {name} : {available} disponible(s), {requested} demandé(s).")
         return redirect('cart_detail')
         
     context = {
         'cart': cart, 
+        'items': items,
         'total': total,
+        'reserved_until': reserved_until,
         'is_merchant': is_merchant(request.user),
         'is_client': is_client(request.user),
         'user_type': get_user_type(request.user)
@@ -884,59 +1004,27 @@ def checkout_view(request):
 def process_order(request):
     if request.method == 'POST':
         cart = get_object_or_404(Cart, user=request.user)
-        if not cart.items.exists():
-            return redirect('cart_detail')
-        
         # Récupère les informations du formulaire
-        full_name = request.POST.get('full_name')
-        email = request.POST.get('email')
-        city = request.POST.get('city')
-        address = request.POST.get('address')
-        zipcode = request.POST.get('zipcode')
-        
-        # Crée une nouvelle commande
-        order = Order.objects.create(
-            user=request.user, 
-            complete=True,
-            transaction_id=f"trans-{request.user.id}-{date.today().isoformat()}",
-            full_name=full_name,
-            email=email,
-            city=city,
-            address=address,
-            zipcode=zipcode
-        )
-        
-        # Déplace les articles du panier à la commande
-        for item in cart.items.all():
-            order_item = OrderItem.objects.create(
-                product=item.product,
-                order=order,
-                quantity=item.quantity
-            )
-            # NOUVEAU : Copier les variations sélectionnées
-            order_item.selected_variations.set(item.selected_variations.all())
-            order_item.save()
-            
-            # Met à jour le stock du produit et des variations
-            product = item.product
-            product.stock -= item.quantity
-            product.save()
-            
-            # NOUVEAU : Mettre à jour le stock des variations
-            for variation in item.selected_variations.all():
-                variation.stock_variation -= item.quantity
-                variation.save()
-            
-        # Vide le panier
-        cart.items.all().delete()
-        
+        shipping = {
+            field: request.POST.get(field) for field in ('full_name', 'email', 'city', 'address', 'zipcode')
+        }
+        try:
+            # Commande, stock et vidage du panier en une transaction (voir shop/checkout.py)
+            order = place_order(cart, request.user, shipping)
+        except OutOfStock as e:
+            for name, available, requested in e.products:
+                messages.error(request, f"Stock insuffisant pour {name} : {available} disponible(s), {requested} demandé(s).")
+            return redirect('cart_detail')
+        if order is None:
+            # Panier vide
+            return redirect('cart_detail')
         return redirect('order_confirmation', order_id=order.id)
         
     return redirect('checkout_view')
 
 @login_required(login_url='login_view')
 def order_confirmation(request, order_id):
-    order = get_object_or_404(Order, id=order_id, user=request.user)
+    order = get_object_or_404(Order.objects.with_totals(), id=order_id, user=request.user)
     context = {
         'order': order,
         'is_merchant': is_merchant(request.user),
@@ -969,7 +1057,11 @@ def start_negotiation_view(request, product_id):
 
 @login_required(login_url='login_view')
 def conversation_detail_view(request, conversation_id):
-    conversation = get_object_or_404(Conversation, id=conversation_id)
+    from .services import NegotiationContext, get_conversation_ai_status
+    
+    # Conversation, produit, boutique, commerçant, paramètres et activité en une requête
+    conversation = get_object_or_404(NegotiationContext.queryset(), id=conversation_id)
+    negotiation_context = NegotiationContext(conversation)
     
     # Vérification des permissions
     is_user_merchant = is_merchant(request.user)
@@ -984,55 +1076,36 @@ def conversation_detail_view(request, conversation_id):
             return redirect('conversation_detail', conversation_id=conversation.id)
 
         # Création du message de l'utilisateur
-        Message.objects.create(
+        user_message = Message.objects.create(
             conversation=conversation,
             sender=request.user,
             text=message_text
         )
 
-        # LOGIQUE IA AMÉLIORÉE
+        # La réponse IA est générée en arrière-plan (manage.py run_ai_worker)
         if not is_user_merchant:  # Si c'est le client qui envoie un message
             try:
-                from .services import get_ai_negotiation_response, should_use_ai
-                
-                # Vérifier si l'IA doit répondre
-                if should_use_ai(conversation):
-                    # Appel du service amélioré
-                    ai_response_text = get_ai_negotiation_response(
-                        conversation.product, 
-                        message_text,
-                        conversation
-                    )
-                    
-                    # Si l'IA a généré une réponse, on la sauvegarde
-                    if ai_response_text:
-                        Message.objects.create(
-                            conversation=conversation,
-                            sender=conversation.merchant.user,
-                            text=ai_response_text,
-                            is_ai_response=True
-                        )
-                        logger.info(f"✅ Réponse IA envoyée pour la conversation {conversation.id}")
-                    else:
-                        logger.info(f"❌ Aucune réponse IA générée pour la conversation {conversation.id}")
-                else:
-                    logger.info(f"⏸️ IA non autorisée à répondre pour la conversation {conversation.id}")
-                
+                from .ai_jobs import enqueue_ai_reply
+                enqueue_ai_reply(conversation, user_message)
             except Exception as e:
-                logger.error(f"❌ Erreur lors de l'appel à l'IA : {e}")
+                logger.error(f"❌ Erreur lors de la mise en file de la réponse IA : {e}")
                 # En cas d'erreur, on continue sans bloquer la conversation
 
+        # Envoi depuis la page de chat : pas de redirection (la page récupère les messages par l'API)
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({'success': True, 'message_id': user_message.id})
         return redirect('conversation_detail', conversation_id=conversation.id)
     
-    messages_list = conversation.messages.all().order_by('timestamp')
+    messages_list, older_cursor = message_history_page(conversation)
+    conversation.mark_read(request.user)
     
     # Ajout du statut IA dans le contexte pour l'affichage
-    from .services import get_conversation_ai_status
-    ai_status = get_conversation_ai_status(conversation)
+    ai_status = get_conversation_ai_status(conversation, negotiation_context)
     
     context = {
         'conversation': conversation,
         'messages': messages_list,
+        'older_cursor': older_cursor,
         'product': conversation.product,
         'is_merchant': is_user_merchant,
         'is_client': is_client(request.user),
@@ -1058,14 +1131,14 @@ def chat_api(request, conversation_id):
                 return JsonResponse({'error': 'Message cannot be empty'}, status=400)
             
             # Sauvegarde le message
-            Message.objects.create(
+            user_message = Message.objects.create(
                 conversation=conversation,
                 sender=request.user,
                 text=message_text
             )
             
-            # Tente de générer une réponse de l'IA (si la négociation est active)
-            response_text = ""
+            # Met en file une réponse de l'IA (si la négociation est active)
+            ai_reply_queued = False
             if is_user_merchant:
                 # C'est un commerçant qui envoie un message, l'IA ne répond pas
                 pass
@@ -1074,34 +1147,215 @@ def chat_api(request, conversation_id):
                 shop = conversation.merchant.shop
                 settings_exist = NegotiationSettings.objects.filter(shop=shop, is_active=True).exists()
 
-                if settings_exist and "proposition" in message_text.lower():
-                    # Appelle le service d'IA pour obtenir une réponse
-                    from .services import get_ai_negotiation_response
+                if settings_exist and "proposition" in message_text.lower() and re.search(r'\d', message_text):
+                    from .ai_jobs import enqueue_ai_reply
                     try:
-                        # Extraire le prix proposé
-                        price_match = re.search(r'(\d+(\.\d+)?)', message_text)
-                        user_price_offer = Decimal(price_match.group(1)) if price_match else None
-                        
-                        if user_price_offer is not None:
-                            ai_response_text = get_ai_negotiation_response(conversation.product, user_price_offer, conversation)
-                            Message.objects.create(
-                                conversation=conversation,
-                                sender=conversation.merchant.user,
-                                text=ai_response_text,
-                                is_ai_response=True
-                            )
-                            response_text = ai_response_text
-
+                        enqueue_ai_reply(conversation, user_message)
+                        ai_reply_queued = True
                     except Exception as e:
-                        print(f"Erreur lors de l'appel à l'IA : {e}")
+                        logger.error(f"Erreur lors de la mise en file de la réponse IA : {e}")
             
-            return JsonResponse({'success': True, 'ai_response': response_text})
+            # La réponse de l'IA arrive de manière asynchrone (créée par le worker)
+            return JsonResponse({'success': True, 'ai_response': '', 'ai_reply_queued': ai_reply_queued})
 
         except json.JSONDecodeError:
             return JsonResponse({'error': 'Invalid JSON'}, status=400)
             
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
+def message_to_dict(message, conversation, user):
+    """Représentation JSON d'un message pour les API de chat."""
+    if message.is_ai_response:
+        sender_name = 'DEANNA IA'
+    elif message.sender_id == conversation.client_id:
+        sender_name = conversation.client.username
+    else:
+        sender_name = conversation.merchant.first_name
+    return {
+        'id': message.id,
+        'text': message.text,
+        'timestamp': message.timestamp.isoformat(),
+        'sender_name': sender_name,
+        'is_mine': message.sender_id == user.id,
+        'is_ai_response': message.is_ai_response,
+    }
+
+def message_history_page(conversation, before=None, per_page=CHAT_HISTORY_PAGE_SIZE):
+    """
+    Page de l'historique la plus récente avant le curseur `before`, par
+    pagination keyset sur (timestamp, id) : coût constant quelle que soit
+    la longueur de la conversation. Retourne les messages dans l'ordre
+    chronologique et le curseur de la page plus ancienne (None si aucune).
+    """
+    page = keyset_paginate(
+        conversation.messages.all(),
+        ('-timestamp', '-id'),
+        cursor=before,
+        per_page=per_page
+    )
+    return list(reversed(page.object_list)), page.next_cursor
+
+def conversation_etag(conversation_id, last_message_id):
+    """ETag de l'état d'une conversation : change dès qu'un message est ajouté."""
+    return f'"chat-{conversation_id}-{last_message_id or 0}"'
+
+@login_required(login_url='login_view')
+def chat_messages_api(request, conversation_id):
+    """
+    Retourne uniquement les messages postérieurs à un curseur :
+    ?since_id=<id du dernier message connu> ou ?since=<horodatage ISO>.
+    Avec If-None-Match, une conversation inchangée reçoit un 304 sans
+    qu'aucune ligne de message ne soit chargée.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    
+    conversation = get_object_or_404(
+        Conversation.objects.select_related('client', 'merchant__user'),
+        id=conversation_id
+    )
+    if request.user.id not in (conversation.client_id, conversation.merchant.user_id):
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    
+    # Identifiant du dernier message : lu dans l'index, sans charger de ligne
+    last_message_id = conversation.messages.aggregate(last_id=Max('id'))['last_id']
+    etag = conversation_etag(conversation.id, last_message_id)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    
+    messages_qs = conversation.messages.order_by('id')
+    since_id = request.GET.get('since_id')
+    since = request.GET.get('since')
+    try:
+        if since_id:
+            messages_qs = messages_qs.filter(id__gt=int(since_id))
+        elif since:
+            since_dt = parse_datetime(since)
+            if since_dt is None:
+                raise ValueError(since)
+            messages_qs = messages_qs.filter(timestamp__gt=since_dt)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    limit = CHAT_MESSAGES_API_LIMIT
+    new_messages = list(messages_qs[:limit + 1])
+    has_more = len(new_messages) > limit
+    new_messages = new_messages[:limit]
+    if new_messages:
+        # Les messages sont affichés dans la page ouverte : ils sont lus
+        conversation.mark_read(request.user)
+    
+    response = JsonResponse({
+        'messages': [message_to_dict(m, conversation, request.user) for m in new_messages],
+        'last_id': new_messages[-1].id if new_messages else (int(since_id) if since_id else None),
+        'has_more': has_more,
+    })
+    # L'ETag ne décrit l'état complet que si la réponse contient tout ce qui manquait
+    if not has_more:
+        response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+@login_required(login_url='login_view')
+def chat_older_messages_api(request, conversation_id):
+    """
+    Historique plus ancien ("charger plus") : ?before=<curseur opaque>
+    renvoyé par la page précédente.
+    """
+    conversation = get_object_or_404(
+        Conversation.objects.select_related('client', 'merchant__user'),
+        id=conversation_id
+    )
+    if request.user.id not in (conversation.client_id, conversation.merchant.user_id):
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    
+    try:
+        older_messages, older_cursor = message_history_page(conversation, before=request.GET.get('before'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    return JsonResponse({
+        'messages': [message_to_dict(m, conversation, request.user) for m in older_messages],
+        'older_cursor': older_cursor,
+    })
+
+@login_required(login_url='login_view')
+async def conversation_stream(request, conversation_id):
+    """
+    Flux Server-Sent Events des nouveaux messages d'une conversation
+    (y compris les réponses de l'IA). À servir en ASGI (deanna_project.asgi).
+    Reprend après ?since_id=<id> ou l'en-tête Last-Event-ID du navigateur.
+    """
+    conversation = await Conversation.objects.select_related('client', 'merchant__user').filter(id=conversation_id).afirst()
+    if conversation is None:
+        return JsonResponse({'error': 'Not found'}, status=404)
+    user = await request.auser()
+    if user.id not in (conversation.client_id, conversation.merchant.user_id):
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.GET.get('since_id') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    if not last_id:
+        last_id = (await conversation.messages.aaggregate(last_id=Max('id')))['last_id'] or 0
+    
+    signal_interval = getattr(settings, 'CHAT_STREAM_SIGNAL_INTERVAL', 0.5)
+    poll_interval = getattr(settings, 'CHAT_STREAM_POLL_INTERVAL', 30)
+    keepalive_interval = getattr(settings, 'CHAT_STREAM_KEEPALIVE', 15)
+    max_duration = getattr(settings, 'CHAT_STREAM_MAX_DURATION', 300)
+    channel = conversation_channel(conversation.id)
+    
+    async def event_stream():
+        nonlocal last_id
+        broker = get_broker()
+        subscription = broker.subscribe(channel)
+        loop = asyncio.get_running_loop()
+        started = last_event = last_read = loop.time()
+        sequence = await channel_sequence(channel)
+        # Premier passage : messages arrivés depuis since_id / Last-Event-ID
+        changed = True
+        try:
+            yield "retry: 2000\n\n"
+            while loop.time() - started < max_duration:
+                if not changed:
+                    try:
+                        # Réveil immédiat si un message est publié dans ce processus
+                        await asyncio.wait_for(subscription.get(), timeout=signal_interval)
+                        changed = True
+                        sequence = await channel_sequence(channel)
+                    except asyncio.TimeoutError:
+                        # Message publié par un autre processus (worker IA) : séquence changée
+                        current = await channel_sequence(channel)
+                        changed = current != sequence or loop.time() - last_read >= poll_interval
+                        sequence = current
+                if changed:
+                    last_read = loop.time()
+                    new_messages = [
+                        m async for m in conversation.messages.filter(id__gt=last_id).order_by('id')[:CHAT_MESSAGES_API_LIMIT]
+                    ]
+                    for message in new_messages:
+                        data = json.dumps(message_to_dict(message, conversation, user))
+                        yield f"id: {message.id}\nevent: message\ndata: {data}\n\n"
+                        last_id = message.id
+                        last_event = loop.time()
+                    if new_messages:
+                        await sync_to_async(conversation.mark_read)(user)
+                    # Lot plein : la suite est relue sans attendre
+                    changed = len(new_messages) == CHAT_MESSAGES_API_LIMIT
+                if loop.time() - last_event >= keepalive_interval:
+                    yield ": keepalive\n\n"
+                    last_event = loop.time()
+        finally:
+            broker.unsubscribe(subscription)
+    
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required(login_url='login_view')
 def list_conversations_view(request):
     is_user_merchant = is_merchant(request.user)
@@ -1113,8 +1367,26 @@ def list_conversations_view(request):
         # Si c'est un client, on récupère ses conversations
         conversations = Conversation.objects.filter(client=request.user)
     
+    # Une requête sur l'index (participant, last_message_at, id) : le résumé
+    # du dernier message et les compteurs non lus sont portés par la conversation
+    conversations = conversations.select_related('product', 'client', 'merchant').only(
+        'id', 'client_id', 'merchant_id', 'last_message_at', 'last_message_preview',
+        'client_unread_count', 'merchant_unread_count',
+        'product__name', 'client__username', 'merchant__first_name', 'merchant__user_id'
+    )
+    try:
+        page = keyset_paginate(
+            conversations, ('-last_message_at', '-id'),
+            cursor=request.GET.get('cursor'), per_page=INBOX_PAGE_SIZE
+        )
+    except InvalidCursor:
+        return redirect('list_conversations')
+    for conv in page:
+        conv.unread_count = conv.unread_count_for(request.user)
+    
     context = {
-        'conversations': conversations,
+        'conversations': page.object_list,
+        'next_cursor': page.next_cursor,
         'is_merchant': is_user_merchant,
         'is_client': is_client(request.user),
         'user_type': get_user_type(request.user)
@@ -1176,11 +1448,13 @@ def negotiation_chat(request, conversation_id):
         # La réponse se fera via le rechargement de la page pour le moment
         return redirect('negotiation_chat', conversation_id=conversation.id)
     
-    messages_list = conversation.messages.all().order_by('timestamp')
+    messages_list, older_cursor = message_history_page(conversation)
+    conversation.mark_read(request.user)
     
     context = {
         'conversation': conversation,
         'messages': messages_list,
+        'older_cursor': older_cursor,
         'product': conversation.product,
         'is_merchant': is_user_merchant,
         'is_client': is_client(request.user),
@@ -1240,16 +1514,14 @@ def shop_products(request, shop_slug):
     category_slug = request.GET.get('cat')
     subcategory_slug = request.GET.get('subcat')
     
-    if query:
-        products = products.filter(Q(name__icontains=query) | Q(description__icontains=query))
     if category_slug:
         products = products.filter(category__slug=category_slug)
     if subcategory_slug:
         products = products.filter(subcategory__slug=subcategory_slug)
+    if query:
+        products = search_products(products, query)
 
-    paginator = Paginator(products, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = catalog_page(request, products, default_sort='oldest', per_page=SHOP_CATALOG_PAGE_SIZE)
     
     categories = Category.objects.filter(products__shop=shop).distinct()
     
@@ -1272,9 +1544,7 @@ def shop_category(request, shop_slug, category_slug):
     category = get_object_or_404(Category, slug=category_slug)
     products = Product.objects.filter(shop=shop, category=category, stock__gt=0)
     
-    paginator = Paginator(products, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = catalog_page(request, products, default_sort='oldest', per_page=SHOP_CATALOG_PAGE_SIZE)
     
     context = {
         'shop': shop,
@@ -1308,6 +1578,7 @@ def shop_contact(request, shop_slug):
     }
     return render(request, 'shop/shop_contact.html', context)
 
+@cached_catalog_page(shop_page_namespaces)
 def shop_detail_by_slug(request, shop_slug):
     """Affiche la page d'accueil d'une boutique avec les produits en vedette."""
     try:
@@ -1321,7 +1592,9 @@ def shop_detail_by_slug(request, shop_slug):
         
         # Vérifier que la boutique est publique
         if not shop.shopsettings.is_public:
+            page_cache.forget_shop_slug(shop_slug)
             return render(request, 'shop/shop_private.html', {'shop': shop})
+        page_cache.remember_shop_slug(shop_slug, shop.id)
             
         featured_products = Product.objects.filter(shop=shop, stock__gt=0)[:8]
         categories = Category.objects.filter(products__shop=shop).distinct()
@@ -1339,6 +1612,7 @@ def shop_detail_by_slug(request, shop_slug):
         
     except Shop.DoesNotExist:
         # Si la boutique n'existe pas, afficher une page 404 personnalisée
+        page_cache.forget_shop_slug(shop_slug)
         return render(request, 'shop/shop_not_found.html', {'shop_slug': shop_slug})
 
 # Création de compte client
@@ -1404,14 +1678,14 @@ def create_client(request):
 def client_dashboard(request):
     """Tableau de bord pour les clients"""
     client = request.user.client
-    orders = Order.objects.filter(user=request.user).order_by('-date_ordered')[:5]
+    orders = Order.objects.with_totals().filter(user=request.user).order_by('-date_ordered')[:5]
     total_orders = Order.objects.filter(user=request.user).count()
     
-    # Calculer le total des dépenses
-    total_spent = Order.objects.filter(
-        user=request.user, 
-        complete=True
-    ).aggregate(total=Sum(F('orderitem__product__price') * F('orderitem__quantity')))['total'] or 0
+    # Calculer le total des dépenses (prix figés à la commande, variations comprises)
+    total_spent = OrderItem.objects.filter(
+        order__user=request.user,
+        order__complete=True
+    ).aggregate(total=Sum('line_total'))['total'] or 0
     
     context = {
         'client': client,
@@ -1428,7 +1702,7 @@ def client_dashboard(request):
 @client_required
 def client_orders(request):
     """Historique des commandes du client"""
-    orders = Order.objects.filter(user=request.user).order_by('-date_ordered')
+    orders = Order.objects.with_totals().filter(user=request.user).order_by('-date_ordered')
     
     paginator = Paginator(orders, 10)
     page_number = request.GET.get('page')
@@ -1436,6 +1710,7 @@ def client_orders(request):
     
     context = {
         'page_obj': page_obj,
+        'orders': page_obj,  # Nom utilisé par le gabarit client/orders.html
         'is_client': True,
         'is_merchant': is_merchant(request.user),
         'user_type': 'client'
@@ -1446,10 +1721,11 @@ def client_orders(request):
 @client_required
 def client_order_detail(request, order_id):
     """Détail d'une commande client"""
-    order = get_object_or_404(Order, id=order_id, user=request.user)
+    order = get_object_or_404(Order.objects.with_totals(), id=order_id, user=request.user)
     
     context = {
         'order': order,
+        'items': line_items(order.orderitem_set.order_by('pk')),
         'is_client': True,
         'is_merchant': is_merchant(request.user),
         'user_type': 'client'
@@ -1511,30 +1787,71 @@ def get_ai_negotiation_response(product, user_price_offer, conversation):
         return f"Je ne peux pas accepter {user_price_offer} CFA. Mon prix minimum est {product.price * Decimal('0.8')} CFA."
 
 
+# Nombre maximum de commerçants par appel à l'API de statut groupée
+MERCHANTS_STATUS_API_LIMIT = 100
+
+def catalog_facets_api(request):
+    """Compteurs des facettes du catalogue (mêmes paramètres GET que product_list)."""
+    query = request.GET.get('q')
+    search_ids = None
+    if query:
+        search_ids = matching_products(Product.objects.all(), query).values_list('pk', flat=True)
+    return JsonResponse({'facets': facet_counts(**catalog_filters(request), product_ids=search_ids)})
+
+
+def merchant_status_payload(merchant_id, presence):
+    """Statut d'un commerçant pour les API, calculé depuis sa présence en cache."""
+    from .services import get_status_from_activity
+    status = get_status_from_activity(presence)
+    return {
+        'merchant_id': merchant_id,
+        'status': status,
+        'is_online': status['status'] in ['en_ligne_actif', 'en_ligne_inactif'],
+        'last_seen': presence.last_seen.isoformat() if presence else None
+    }
+
 @login_required
 def merchant_status_api(request, merchant_id):
     """API pour obtenir le statut d'un commerçant"""
-    merchant = get_object_or_404(Merchant, id=merchant_id)
-    
-    status = get_merchant_status(merchant)
+    presence = presence_store.get(merchant_id)
+    # Jamais vu : le commerçant doit au moins exister
+    if presence is None and not Merchant.objects.filter(pk=merchant_id).exists():
+        raise Http404("Commerçant introuvable")
+    return JsonResponse(merchant_status_payload(merchant_id, presence))
+
+@login_required
+def merchants_status_api(request):
+    """
+    Statuts de plusieurs commerçants en un appel (pages listant les boutiques) :
+    ?ids=1,2,3
+    """
+    try:
+        merchant_ids = [int(merchant_id) for merchant_id in request.GET.get('ids', '').split(',') if merchant_id]
+    except ValueError:
+        return JsonResponse({'error': 'Invalid ids'}, status=400)
+    if len(merchant_ids) > MERCHANTS_STATUS_API_LIMIT:
+        return JsonResponse({'error': f'Maximum {MERCHANTS_STATUS_API_LIMIT} ids'}, status=400)
     
+    presences = presence_store.get_many(merchant_ids)
     return JsonResponse({
-        'merchant_id': merchant.id,
-        'status': status,
-        'is_online': status in ['en_ligne_actif', 'en_ligne_inactif'],
-        'last_seen': merchant.activity.last_seen.isoformat() if hasattr(merchant, 'activity') else None
+        'statuses': {
+            str(merchant_id): merchant_status_payload(merchant_id, presence)
+            for merchant_id, presence in presences.items()
+        }
     })
 
 @merchant_required
 def my_status_api(request):
     """API pour que le commerçant voit son propre statut"""
-    activity = get_object_or_404(MerchantActivity, merchant=request.user.merchant)
+    presence = presence_store.get(request.user.merchant.id)
+    if presence is None:
+        return JsonResponse({'error': 'Not found'}, status=404)
     
     return JsonResponse({
-        'is_online': activity.is_online,
-        'last_seen': activity.last_seen.isoformat(),
-        'minutes_since_last_seen': activity.minutes_since_last_seen,
-        'is_active_in_chat': activity.is_active_in_chat
+        'is_online': presence.is_online,
+        'last_seen': presence.last_seen.isoformat(),
+        'minutes_since_last_seen': presence.minutes_since_last_seen,
+        'is_active_in_chat': presence.is_active_in_chat
     })
 
 
@@ -1542,6 +1859,6 @@ def my_status_api(request):
 
 # Dans views.py
 def test_ai_service(request):
-    from .services import test_ai_connection, openrouter_client
-    test_result = test_ai_connection()
+    from .services import test_openai_connection
+    test_result = test_openai_connection()
     return JsonResponse(test_result)
\ No newline at end of file